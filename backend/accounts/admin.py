@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Lesson, UserProgress, StudySession, QuizQuestion
+from .models import CustomUser, Lesson, LessonTestCase, UserProgress, StudySession, QuizQuestion, XpLedgerEntry
 
 @admin.register(StudySession)
 class StudySessionAdmin(admin.ModelAdmin):
@@ -25,10 +25,16 @@ class CustomUserAdmin(UserAdmin):
 
 admin.site.register(CustomUser, CustomUserAdmin)
 
+class LessonTestCaseInline(admin.TabularInline):
+    model = LessonTestCase
+    extra = 0
+    fields = ("order", "name", "stdin", "expected_output", "time_limit")
+
 @admin.register(Lesson)
 class LessonAdmin(admin.ModelAdmin):
-    list_display = ("title", "learning_goal", "difficulty_level", "order")
-    search_fields = ("title", "learning_goal", "difficulty_level") 
+    inlines = [LessonTestCaseInline]
+    list_display = ("title", "slug", "learning_goal", "difficulty_level", "order")
+    search_fields = ("title", "slug", "learning_goal", "difficulty_level") 
     list_filter = ("learning_goal", "difficulty_level")
     ordering = ("learning_goal", "difficulty_level", "order")
 
@@ -36,4 +42,18 @@ class LessonAdmin(admin.ModelAdmin):
 class UserProgressAdmin(admin.ModelAdmin):
     list_display = ("user", "streak", "lessons_completed", "last_active")
 
+@admin.register(XpLedgerEntry)
+class XpLedgerEntryAdmin(admin.ModelAdmin):
+    """Corrections are new entries; existing ones are never edited or removed."""
+    list_display = ("user", "amount", "source", "source_id", "created_at")
+    list_filter = ("source",)
+    search_fields = ("user__username",)
+    raw_id_fields = ("user",)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 admin.site.register(QuizQuestion)
@@ -0,0 +1,150 @@
+"""
+Admission control for the expensive endpoints (run-code/, lesson grading, ai-feedback/).
+
+Concurrency is limited per user and globally with leased slots stored in the
+"admission" cache, which every gunicorn worker on the host shares. A slot is a
+cache key claimed with ``cache.add()``; it is deleted on release and expires on
+its own if a worker dies while holding it. Requests that find no free global
+slot wait in a bounded queue (also made of slots); when the user is at their
+limit or the queue is full the request fails fast with 429 and Retry-After.
+
+``add()`` is atomic on memcached/redis. With the default file-based cache two
+workers racing for the same slot can both win, so the limits are approximate
+there, which is fine for shedding load.
+
+The in-flight and queued gauges are read from the slots when /metrics/ is
+requested (``update_gauges``), not on every admission.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+
+from .metrics import metrics
+
+POLL_INTERVAL = 0.05
+
+
+class AdmissionRejected(Throttled):
+    default_detail = "Too many requests in progress, please try again shortly."
+
+
+def _cache():
+    return caches[settings.ADMISSION_CACHE]
+
+
+def _slot_keys(scope, owner, count):
+    return [f"admission:{scope}:{owner}:{i}" for i in range(count)]
+
+
+def _claim(keys, token):
+    cache = _cache()
+    for key in keys:
+        if cache.add(key, token, timeout=settings.ADMISSION_LEASE_SECONDS):
+            return key
+    return None
+
+
+def _release(key, token):
+    cache = _cache()
+    # Only drop the slot if our lease has not expired and been taken over
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+def in_flight(scope):
+    """Occupied global slots of a scope, across all workers on the host."""
+    limits = settings.ADMISSION_LIMITS[scope]
+    return len(_cache().get_many(_slot_keys(scope, "global", limits["global"])))
+
+
+def update_gauges():
+    """Set the in-flight and queued gauges of every scope from the slots."""
+    for scope, limits in settings.ADMISSION_LIMITS.items():
+        metrics.set_gauge(f"admission.{scope}.in_flight", in_flight(scope))
+        metrics.set_gauge(
+            f"admission.{scope}.queued",
+            len(_cache().get_many(_slot_keys(scope, "queue", limits["queue"]))),
+        )
+
+
+def _reject(scope, reason, retry_after):
+    metrics.incr(f"admission.{scope}.rejected_{reason}")
+    raise AdmissionRejected(wait=retry_after)
+
+
+@contextmanager
+def admission(user, scope):
+    """
+    Hold one per-user and one global slot of ``scope`` for the duration of the
+    block. Raises AdmissionRejected (HTTP 429 with Retry-After) otherwise.
+    """
+    limits = settings.ADMISSION_LIMITS[scope]
+    token = uuid.uuid4().hex
+
+    user_slot = _claim(_slot_keys(scope, f"user{user.pk}", limits["per_user"]), token)
+    if user_slot is None:
+        _reject(scope, "user_limit", 1)
+
+    global_slot = None
+    try:
+        global_keys = _slot_keys(scope, "global", limits["global"])
+        global_slot = _claim(global_keys, token)
+        if global_slot is None:
+            queue_slot = _claim(_slot_keys(scope, "queue", limits["queue"]), token)
+            if queue_slot is None:
+                _reject(scope, "queue_full", limits["wait"])
+
+            started = time.monotonic()
+            try:
+                while global_slot is None and time.monotonic() - started < limits["wait"]:
+                    time.sleep(POLL_INTERVAL)
+                    global_slot = _claim(global_keys, token)
+            finally:
+                _release(queue_slot, token)
+                metrics.observe(f"admission.{scope}.wait_seconds", time.monotonic() - started)
+            if global_slot is None:
+                _reject(scope, "wait_timeout", limits["wait"])
+
+        metrics.incr(f"admission.{scope}.admitted")
+        yield
+    finally:
+        if global_slot is not None:
+            _release(global_slot, token)
+        _release(user_slot, token)
+
+
+class _HeldStream:
+    """Streaming body that keeps its admission slots until it is consumed or closed."""
+
+    def __init__(self, lease, events):
+        self.lease = lease
+        self.events = events
+        self.released = False
+
+    def __iter__(self):
+        try:
+            yield from self.events
+        finally:
+            self.close()
+
+    def close(self):
+        # Django calls this when the response is done, even if it was never iterated
+        if not self.released:
+            self.released = True
+            self.events.close()
+            self.lease.__exit__(None, None, None)
+
+
+def admit_stream(user, scope, events):
+    """
+    Admit now, so a rejection is still a plain 429 response, and hold the
+    slots for as long as the streamed ``events`` are being sent.
+    """
+    lease = admission(user, scope)
+    lease.__enter__()
+    return _HeldStream(lease, events)
+
@@ -0,0 +1,164 @@
+"""
+Token authentication without a database round-trip per request.
+
+DRF's TokenAuthentication joins authtoken_token to the user on every request.
+CachedTokenAuthentication keeps token -> user in a bounded per-worker LRU
+whose entries expire after TOKEN_AUTH_CACHE_SECONDS, with the shared cache
+(TOKEN_AUTH_SHARED_CACHE) as a second level so a worker that has not seen a
+token yet still skips the query.
+
+The receivers in signals.py drop a user's entries when one of their tokens
+is deleted (LogoutView) and when a save changes the cached user, e.g. a
+deactivation, a new password or a profile edit; a save that only touches
+last_login changes nothing. Dropping also moves that user's version in the
+shared cache. Every entry carries the version it was built at and a worker
+checks it on each hit, so a revoked token stops working everywhere on the
+next request while other users' entries stay cached. The version is read
+before the user is loaded, so a revocation committing in between leaves the
+entry behind; a missing version (expired or culled from the shared cache)
+counts as a miss. Without a shared cache, other workers only notice after the
+TTL.
+
+Changes that send no post_save, like ``QuerySet.update(is_active=False)``,
+are not seen until the entries expire (TOKEN_AUTH_CACHE_SECONDS); call
+``token_cache.forget_user()`` after such updates.
+
+Cached users are rebuilt from their field values for every request (the
+password hash is left out and loads lazily if needed), so views never share
+an instance between requests.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+
+from .caching import LRUCache
+from .metrics import metrics
+
+
+
+def _shared():
+    alias = settings.TOKEN_AUTH_SHARED_CACHE
+    return caches[alias] if alias else None
+
+
+def _cache_key(key):
+    # Token keys are credentials; never use them verbatim as cache keys
+    return "auth:token:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _version_key(user_id):
+    return f"auth:user:{user_id}:version"
+
+
+def _user_fields():
+    return [f.attname for f in get_user_model()._meta.concrete_fields if f.attname != "password"]
+
+
+def _snapshot(user, token, version):
+    return {
+        "user_id": user.pk,
+        "version": version,
+        "user": [getattr(user, name) for name in _user_fields()],
+        "token_created": token.created,
+    }
+
+
+class TokenCache:
+    def __init__(self):
+        self._entries = LRUCache(max_entries=settings.TOKEN_AUTH_CACHE_ENTRIES)
+
+    def user_version(self, user_id):
+        """Moves whenever the user's entries are dropped; None if the shared cache has none."""
+        shared = _shared()
+        return shared.get(_version_key(user_id)) if shared is not None else 0
+
+    def stamp(self, user_id):
+        """The version to build a new entry at; starts one if the user has none."""
+        version = self.user_version(user_id)
+        if version is None:
+            # add() so a concurrent forget_user is not overwritten
+            _shared().add(_version_key(user_id), time.time_ns(), timeout=2 * settings.TOKEN_AUTH_CACHE_SECONDS)
+            version = self.user_version(user_id)
+        return version
+
+    def _current(self, snapshot):
+        version = self.user_version(snapshot["user_id"])
+        return version is not None and snapshot["version"] == version
+
+    def get(self, key):
+        cache_key = _cache_key(key)
+        entry = self._entries.get(cache_key)
+        if entry is not None and entry[1] > time.monotonic() and self._current(entry[0]):
+            metrics.incr("auth_cache.hits")
+            return entry[0]
+
+        shared = _shared()
+        snapshot = shared.get(cache_key) if shared is not None else None
+        if snapshot is not None and self._current(snapshot):
+            self._entries.set(cache_key, (snapshot, time.monotonic() + settings.TOKEN_AUTH_CACHE_SECONDS))
+            metrics.incr("auth_cache.hits")
+            metrics.incr("auth_cache.shared_hits")
+            return snapshot
+
+        metrics.incr("auth_cache.misses")
+        return None
+
+    def set(self, key, snapshot):
+        cache_key = _cache_key(key)
+        self._entries.set(cache_key, (snapshot, time.monotonic() + settings.TOKEN_AUTH_CACHE_SECONDS))
+        shared = _shared()
+        if shared is not None:
+            shared.set(cache_key, snapshot, timeout=settings.TOKEN_AUTH_CACHE_SECONDS)
+
+    def forget_user(self, user_id, keys=None):
+        """
+        Drop the entries of ``user_id``'s tokens (default: all of them, one
+        query) here and in the shared cache, and move the user's version so
+        other workers drop theirs on the next hit.
+        """
+        if keys is None:
+            from rest_framework.authtoken.models import Token
+
+            keys = list(Token.objects.filter(user_id=user_id).values_list("key", flat=True))
+        cache_keys = [_cache_key(key) for key in keys]
+        for cache_key in cache_keys:
+            self._entries.delete(cache_key)
+        shared = _shared()
+        if shared is not None:
+            shared.delete_many(cache_keys)
+            # Outlives every entry stamped with the old version; a new time never repeats an old one
+            shared.set(_version_key(user_id), time.time_ns(), timeout=2 * settings.TOKEN_AUTH_CACHE_SECONDS)
+        metrics.incr("auth_cache.invalidations")
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement for TokenAuthentication backed by ``token_cache``."""
+
+    def authenticate_credentials(self, key):
+        snapshot = token_cache.get(key)
+        if snapshot is None:
+            # Read the version first: a revocation committing after it moves it past this entry
+            user_id = self.get_model().objects.filter(key=key).values_list("user_id", flat=True).first()
+            version = token_cache.stamp(user_id) if user_id is not None else None
+            user, token = super().authenticate_credentials(key)
+            if version is not None:
+                token_cache.set(key, _snapshot(user, token, version))
+            return user, token
+
+        user = get_user_model().from_db(DEFAULT_DB_ALIAS, _user_fields(), snapshot["user"])
+        # Enough for request.auth.delete() on logout
+        token = self.get_model()(key=key, user=user, created=snapshot["token_created"])
+        token._state.adding = False
+        token._state.db = DEFAULT_DB_ALIAS
+        return user, token
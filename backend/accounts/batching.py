@@ -0,0 +1,171 @@
+"""
+Micro-batching gateway in front of the inference backend.
+
+Concurrent feedback requests in a process are sent as one inference call of
+up to HF_BATCH_MAX_SIZE prompts and the results are handed back to the
+waiting requests. That saves round trips against the provider's per-request
+overhead and rate limits.
+
+A prompt that finds the queue empty is sent at once. Only when other prompts
+are already waiting does a batch wait up to HF_BATCH_MAX_WAIT_MS for more, and
+while HF_BATCH_CONCURRENCY batches are in flight new prompts queue up for the
+next one. If a batch call fails its prompts are retried one by one, so one bad
+prompt does not fail the others.
+
+Batches only form between requests served by the same process, i.e. with
+threaded (gthread) or ASGI workers. Under the sync workers of the Procfile a
+process never has two prompts at once, so HF_BATCH_MAX_SIZE defaults to 1:
+the gateway then calls the backend in the request's own thread.
+
+The backend is pluggable (HF_BATCH_BACKEND): any class taking no arguments
+whose ``generate_batch(prompts)`` returns one result per prompt.
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .inference import InferenceError, get_client
+from .metrics import metrics
+
+
+class HuggingFaceBackend:
+    """Sends a batch as a single request with a list of ``inputs``."""
+
+    def __init__(self, client=None):
+        self.client = client or get_client()
+
+    def generate_batch(self, prompts):
+        if len(prompts) == 1:
+            return [self.client.generate(prompts[0])]
+
+        results = self.client.generate(prompts)
+        if not isinstance(results, list) or len(results) != len(prompts):
+            raise InferenceError("Inference backend returned a malformed batch")
+        # A single prompt is answered with [{...}]; keep that shape per prompt
+        return [result if isinstance(result, list) else [result] for result in results]
+
+
+class FakeBackend:
+    """Local stand-in for tests and development: answers every prompt with its own text."""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.batches = []
+
+    def generate_batch(self, prompts):
+        self.batches.append(list(prompts))
+        time.sleep(self.delay)
+        return [[{"generated_text": f"Feedback for: {prompt}"}] for prompt in prompts]
+
+
+class MicroBatcher:
+    def __init__(self, backend, max_batch_size=8, max_wait=0.05, concurrency=4):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        if max_batch_size <= 1:
+            # Pass-through: nothing to batch, so no queue or threads
+            return
+        self._queue = queue.Queue()
+        # Batches are sent from a pool so a slow one does not hold up the next
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="inference-batch")
+        self._slots = threading.Semaphore(concurrency)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="inference-batcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, prompt):
+        """Queue ``prompt``; the returned Future resolves to its result."""
+        future = Future()
+        if self.max_batch_size <= 1:
+            self._send([(prompt, future)])
+        else:
+            self._queue.put((prompt, future))
+        return future
+
+    def generate(self, prompt):
+        return self.submit(prompt).result()
+
+    async def agenerate(self, prompt):
+        return await asyncio.wrap_future(self.submit(prompt))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(batch) == 1 or len(batch) == self.max_batch_size:
+            # A lone prompt means no concurrent load to wait for
+            return batch
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            # With every slot busy, prompts keep queuing and the next batch grows
+            self._slots.acquire()
+            batch = self._collect()
+            metrics.observe("inference.batch_size", len(batch))
+            self._executor.submit(self._send_and_release, batch)
+
+    def _send_and_release(self, batch):
+        try:
+            self._send(batch)
+        finally:
+            self._slots.release()
+
+    def _call(self, prompts):
+        results = self.backend.generate_batch(prompts)
+        if len(results) != len(prompts):
+            raise InferenceError("Inference backend returned a malformed batch")
+        return results
+
+    def _send(self, batch):
+        try:
+            results = self._call([prompt for prompt, _ in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                batch[0][1].set_exception(exc)
+                return
+            metrics.incr("inference.batch_fallbacks")
+            for prompt, future in batch:
+                try:
+                    future.set_result(self._call([prompt])[0])
+                except Exception as error:
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The process-wide batcher, configured from the HF_BATCH_* settings."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = MicroBatcher(
+                import_string(settings.HF_BATCH_BACKEND)(),
+                max_batch_size=settings.HF_BATCH_MAX_SIZE,
+                max_wait=settings.HF_BATCH_MAX_WAIT_MS / 1000,
+                concurrency=settings.HF_BATCH_CONCURRENCY,
+            )
+        return _gateway
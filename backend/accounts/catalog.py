@@ -0,0 +1,77 @@
+"""
+Process-local cache of the rendered lesson catalog.
+
+Lessons only change when staff edit them, yet the lesson lists re-serialize
+every lesson's HTML steps, snippet and solution on each request. Each worker
+keeps the rendered JSON bytes of the full catalog and of every
+(learning_goal, difficulty_level) slice. Entries belong to a catalog version
+stored in the shared cache; the receivers in signals.py bump it when a Lesson
+or QuizQuestion is saved or deleted, and every worker drops its entries the
+next time it sees a new version, without a restart.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import metrics
+
+VERSION_KEY = "catalog:version"
+
+
+def _cache():
+    return caches[settings.CATALOG_VERSION_CACHE]
+
+
+def current_version():
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    metrics.incr("catalog.version_bumps")
+
+
+class LessonCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._entries = {}
+
+    def get_or_build(self, key, build):
+        """Rendered bytes stored under ``key`` for the current version; ``build()`` renders them on a miss."""
+        version = current_version()
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._entries = {}
+            payload = self._entries.get(key)
+        if payload is not None:
+            metrics.incr("catalog.hits")
+            return payload
+
+        metrics.incr("catalog.misses")
+        payload = build()
+        with self._lock:
+            # Do not file it under a version that was replaced while building
+            if self._version == version:
+                self._entries[key] = payload
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._entries = {}
+
+
+catalog = LessonCatalog()
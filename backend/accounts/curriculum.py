@@ -0,0 +1,308 @@
+"""
+The curriculum, kept as JSON files under settings.CURRICULUM_DIR.
+
+Each file holds one learning goal:
+
+    {
+      "format": 1,
+      "learning_goal": "School",
+      "levels": {
+        "Beginner": [
+          {"slug": "...", "title": "...", "description": "...", "order": 1, "step1_content": "...",
+           "quiz": [{"question": "...", "option_a": "...", "option_b": "...", "option_c": "...",
+                     "option_d": "...", "correct_option": "A", "explanation": "...", "order": 1}]}
+        ]
+      }
+    }
+
+Lessons are matched on their slug, so a title can change (or a lesson move to
+another track) without losing the lesson and its history. A lesson that has
+no slug yet, because it predates slugs or was written in the admin, is
+adopted by (learning_goal, difficulty_level, title) on its first sync. Quiz
+questions are matched on (lesson, question). A lesson owns its quiz only when
+it has a "quiz" key, so questions written in the admin survive until a file
+takes them over. Lesson fields a file leaves out get the model default.
+
+A file owns the tracks it lists. Lessons of those tracks that are missing
+from the files are only reported as orphaned; ``prune`` deletes them, except
+the ones learners have used (sessions, completions, feedback, activities),
+which are always kept.
+
+``sync_curriculum`` (``manage.py sync_curriculum``) applies the difference
+between the files and the database. The 0016 data migration, which seeds a
+new database, carries its own frozen copy of the curriculum and does not read
+these files.
+"""
+import json
+import os
+import re
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+FORMAT = 1
+SLUG_RE = re.compile(r"^[-a-z0-9_]+$")
+TRACK_FIELDS = ["learning_goal", "difficulty_level", "title"]
+LESSON_FIELDS = [
+    "description", "step1_content", "step2_content", "step3_challenge", "order",
+    "code_snippet", "expected_output", "solution",
+]
+QUESTION_FIELDS = ["option_a", "option_b", "option_c", "option_d", "correct_option", "explanation", "order"]
+REQUIRED_QUESTION_FIELDS = {"question", "option_a", "option_b", "option_c", "option_d", "correct_option"}
+
+
+class CurriculumError(ValueError):
+    pass
+
+
+def _model_defaults(model, names):
+    return {name: model._meta.get_field(name).get_default() for name in names}
+
+
+def _lesson_fields(entry, where, defaults):
+    from .grading import output_hash
+
+    unknown = set(entry) - {"slug", "title", "quiz", *LESSON_FIELDS}
+    if unknown:
+        raise CurriculumError(f"{where}: unknown lesson field(s) {', '.join(sorted(unknown))}")
+    if not isinstance(entry.get("slug"), str) or not SLUG_RE.match(entry["slug"]):
+        raise CurriculumError(f"{where}: 'slug' must be lowercase letters, digits, '-' or '_'")
+    if not isinstance(entry.get("order"), int):
+        raise CurriculumError(f"{where}: 'order' must be an integer")
+
+    fields = {name: entry.get(name, defaults[name]) for name in LESSON_FIELDS}
+    # Lesson.save() derives this; bulk writes have to do it themselves
+    fields["expected_output_hash"] = output_hash(fields["expected_output"]) if fields["expected_output"] else ""
+    return fields
+
+
+def _quiz(entries, where, defaults):
+    if not isinstance(entries, list):
+        raise CurriculumError(f"{where}: 'quiz' must be a list")
+    quiz = {}
+    for entry in entries:
+        missing = REQUIRED_QUESTION_FIELDS - set(entry)
+        unknown = set(entry) - {"question", *QUESTION_FIELDS}
+        if missing or unknown:
+            raise CurriculumError(f"{where}: quiz question missing {sorted(missing)} or with unknown {sorted(unknown)}")
+        if entry["correct_option"] not in "ABCD" or len(entry["correct_option"]) != 1:
+            raise CurriculumError(f"{where}: correct_option must be one of A, B, C, D")
+        if entry["question"] in quiz:
+            raise CurriculumError(f"{where}: duplicate quiz question {entry['question']!r}")
+        quiz[entry["question"]] = {name: entry.get(name, defaults[name]) for name in QUESTION_FIELDS}
+    return quiz
+
+
+def read_curriculum(directory=None):
+    """
+    Parse and validate every ``*.json`` file in ``directory``.
+
+    Returns ``{slug: {"fields": {...}, "quiz": {question: {...}} or None}}``; the
+    fields include learning_goal, difficulty_level and title.
+    """
+    from .models import CustomUser, Lesson, QuizQuestion
+
+    directory = directory or settings.CURRICULUM_DIR
+    goals = {goal for goal, _ in CustomUser.LEARNING_GOALS}
+    levels = {level for level, _ in CustomUser.DIFFICULTY_LEVELS}
+    lesson_defaults = _model_defaults(Lesson, LESSON_FIELDS)
+    question_defaults = _model_defaults(QuizQuestion, QUESTION_FIELDS)
+
+    curriculum, titles = {}, set()
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise CurriculumError(f"{name}: {e}")
+        if data.get("format") != FORMAT:
+            raise CurriculumError(f"{name}: unsupported format {data.get('format')!r}, expected {FORMAT}")
+        goal = data.get("learning_goal")
+        if goal not in goals:
+            raise CurriculumError(f"{name}: unknown learning_goal {goal!r}")
+
+        for level, lessons in data.get("levels", {}).items():
+            if level not in levels:
+                raise CurriculumError(f"{name}: unknown difficulty level {level!r}")
+            for entry in lessons:
+                where = f"{name} {level} {entry.get('title')!r}"
+                if not entry.get("title"):
+                    raise CurriculumError(f"{name} {level}: lesson without a title")
+                fields = {"learning_goal": goal, "difficulty_level": level, "title": entry["title"]}
+                fields.update(_lesson_fields(entry, where, lesson_defaults))
+                if entry["slug"] in curriculum:
+                    raise CurriculumError(f"{where}: slug {entry['slug']!r} is used twice")
+                if (goal, level, entry["title"]) in titles:
+                    raise CurriculumError(f"{where}: defined twice")
+                titles.add((goal, level, entry["title"]))
+                quiz = None
+                if "quiz" in entry:
+                    quiz = _quiz(entry["quiz"], where, question_defaults)
+                curriculum[entry["slug"]] = {"fields": fields, "quiz": quiz}
+    return curriculum
+
+
+class SyncResult:
+    """What a sync changed, as readable labels per model and kind of change."""
+
+    def __init__(self):
+        self.changes = {
+            # Orphaned lessons are no longer in the files but were left in place
+            "lessons": {"created": [], "updated": [], "deleted": [], "orphaned": []},
+            "questions": {"created": [], "updated": [], "deleted": []},
+        }
+
+    def add(self, model, kind, label):
+        self.changes[model][kind].append(label)
+
+    def __bool__(self):
+        # Orphans are a report, not a change
+        return any(labels for kinds in self.changes.values() for kind, labels in kinds.items() if kind != "orphaned")
+
+
+def _label(lesson, detail=None):
+    label = f"{lesson.learning_goal}/{lesson.difficulty_level}: {lesson.title}"
+    return f"{label} ({detail})" if detail else label
+
+
+def _diff(instance, fields):
+    return [name for name, value in fields.items() if getattr(instance, name) != value]
+
+
+def lessons_in_use(lesson_ids):
+    """``{lesson_id: [what]}`` for the given lessons that learners have sessions, completions, feedback or activities of."""
+    from .models import LessonFeedback, StudySession, UserActivity, UserProgress
+
+    uses = defaultdict(list)
+    if not lesson_ids:
+        return uses
+    for what, model in (
+        ("sessions", StudySession),
+        ("completions", UserProgress.completed_lessons.through),
+        ("feedback", LessonFeedback),
+        ("activities", UserActivity),
+    ):
+        for lesson_id in model.objects.filter(lesson_id__in=lesson_ids).values_list("lesson_id", flat=True).distinct():
+            uses[lesson_id].append(what)
+    return uses
+
+
+def sync_curriculum(curriculum=None, dry_run=False, prune=False):
+    """
+    Make the lessons and quizzes of the tracks in ``curriculum`` match it.
+
+    Lessons of those tracks that are not in ``curriculum`` are reported as
+    orphaned; with ``prune`` the ones nobody has used are deleted.
+
+    Everything happens in one transaction with a fixed number of queries:
+    one read per model, then at most one bulk insert, one bulk update and one
+    delete per model (the database backend may split very large bulk writes
+    into batches). Returns a SyncResult; with ``dry_run`` nothing is written.
+    """
+    from . import catalog, dashboard_cache
+    from .models import Lesson, QuizQuestion
+
+    curriculum = read_curriculum() if curriculum is None else curriculum
+    result = SyncResult()
+    tracks = {(spec["fields"]["learning_goal"], spec["fields"]["difficulty_level"]) for spec in curriculum.values()}
+    if not tracks:
+        return result
+
+    def in_tracks(prefix=""):
+        return reduce(or_, (Q(**{f"{prefix}learning_goal": goal, f"{prefix}difficulty_level": level})
+                            for goal, level in tracks))
+
+    with transaction.atomic():
+        # Lessons moved here from another track are found by their slug
+        lesson_query = Lesson.objects.filter(in_tracks() | Q(slug__in=list(curriculum)))
+        current = list(lesson_query)
+        by_slug = {lesson.slug: lesson for lesson in current if lesson.slug}
+        by_title = {tuple(getattr(lesson, name) for name in TRACK_FIELDS): lesson for lesson in current if not lesson.slug}
+        questions = defaultdict(dict)
+        for question in QuizQuestion.objects.filter(lesson__in=lesson_query):
+            questions[question.lesson_id][question.question] = question
+
+        lessons, new_lessons, changed_lessons, lesson_fields = {}, [], [], set()
+        for slug, spec in curriculum.items():
+            fields = {"slug": slug, **spec["fields"]}
+            lesson = by_slug.get(slug) or by_title.pop(tuple(fields[name] for name in TRACK_FIELDS), None)
+            if lesson is None:
+                lessons[slug] = Lesson(**fields)
+                new_lessons.append(lessons[slug])
+                result.add("lessons", "created", _label(lessons[slug]))
+                continue
+            lessons[slug] = lesson
+            changed = _diff(lesson, fields)
+            if changed:
+                for name in changed:
+                    setattr(lesson, name, fields[name])
+                changed_lessons.append(lesson)
+                lesson_fields.update(changed)
+                result.add("lessons", "updated", _label(lesson, ", ".join(changed)))
+
+        kept = {lesson.pk for lesson in lessons.values()}
+        orphans = [
+            lesson for lesson in current
+            if lesson.pk not in kept and (lesson.learning_goal, lesson.difficulty_level) in tracks
+        ]
+        in_use = lessons_in_use([lesson.pk for lesson in orphans])
+        removed_lessons = []
+        for lesson in orphans:
+            if prune and lesson.pk not in in_use:
+                removed_lessons.append(lesson)
+                result.add("lessons", "deleted", _label(lesson))
+            else:
+                used = in_use.get(lesson.pk)
+                result.add("lessons", "orphaned", _label(lesson, "has " + ", ".join(used) if used else None))
+
+        if not dry_run:
+            # Creates the lessons first so their new questions can point at them
+            Lesson.objects.bulk_create(new_lessons)
+            if changed_lessons:
+                Lesson.objects.bulk_update(changed_lessons, sorted(lesson_fields))
+
+        new_questions, changed_questions, question_fields, removed_questions = [], [], set(), []
+        for slug, spec in curriculum.items():
+            if spec["quiz"] is None:
+                continue
+            lesson = lessons[slug]
+            current_quiz = questions.get(lesson.pk, {}) if lesson.pk else {}
+            for text, fields in spec["quiz"].items():
+                question = current_quiz.get(text)
+                if question is None:
+                    new_questions.append(QuizQuestion(lesson=lesson, question=text, **fields))
+                    result.add("questions", "created", _label(lesson, text))
+                    continue
+                changed = _diff(question, fields)
+                if changed:
+                    for name in changed:
+                        setattr(question, name, fields[name])
+                    changed_questions.append(question)
+                    question_fields.update(changed)
+                    result.add("questions", "updated", _label(lesson, f"{text}: {', '.join(changed)}"))
+            for text, question in current_quiz.items():
+                if text not in spec["quiz"]:
+                    removed_questions.append(question.pk)
+                    result.add("questions", "deleted", _label(lesson, text))
+
+        if dry_run or not result:
+            return result
+
+        QuizQuestion.objects.bulk_create(new_questions)
+        if changed_questions:
+            QuizQuestion.objects.bulk_update(changed_questions, sorted(question_fields))
+        if removed_questions:
+            QuizQuestion.objects.filter(pk__in=removed_questions).delete()
+        if removed_lessons:
+            Lesson.objects.filter(pk__in=[lesson.pk for lesson in removed_lessons]).delete()
+
+        # Bulk writes send no signals, so drop cached lesson lists and dashboards here
+        transaction.on_commit(catalog.bump_version)
+        transaction.on_commit(dashboard_cache.invalidate_all)
+    return result
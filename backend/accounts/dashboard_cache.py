@@ -0,0 +1,102 @@
+"""
+Per-user cache of the rendered dashboard.
+
+The payload is stored as the JSON bytes that are sent to the client, in the
+shared cache so every worker sees the same entries. Keys carry a per-user
+version and a global lesson version; the receivers in signals.py bump them
+whenever the user's progress, activities, study sessions or completed lessons
+change (or any lesson is edited), so a stale payload is never read again and
+a rebuild that raced with a change is written under an outdated key.
+
+Only one request per user rebuilds a missing payload; concurrent requests
+wait briefly for it instead of all hitting the database (stampede protection).
+DASHBOARD_CACHE_SECONDS still bounds entries because the payload contains
+relative times ("5 minutes ago") and a date window.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import metrics
+
+LOCK_SECONDS = 10
+WAIT_INTERVAL = 0.05
+LESSONS_VERSION_KEY = "dashboard:version:lessons"
+
+
+def _cache():
+    return caches[settings.DASHBOARD_CACHE]
+
+
+def _version_key(user_id):
+    return f"dashboard:version:{user_id}"
+
+
+def _new_version():
+    # Never reuse a number, even after a version key has been evicted
+    return time.time_ns()
+
+
+def _bump(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not set (or expired): any new value differs from what readers last saw
+        cache.set(key, _new_version(), timeout=None)
+
+
+def invalidate(user_id):
+    _bump(_version_key(user_id))
+    metrics.incr("dashboard_cache.invalidations")
+
+
+def invalidate_all():
+    """Lessons are shared by everyone; editing one invalidates every dashboard."""
+    _bump(LESSONS_VERSION_KEY)
+    metrics.incr("dashboard_cache.invalidations")
+
+
+def _payload_key(user_id):
+    cache = _cache()
+    keys = [_version_key(user_id), LESSONS_VERSION_KEY]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return f"dashboard:{user_id}:{versions[keys[0]]}:{versions[keys[1]]}"
+
+
+def get_or_build(user_id, build):
+    """Cached dashboard bytes of ``user_id``; ``build()`` renders them on a miss."""
+    cache = _cache()
+    key = _payload_key(user_id)
+    payload = cache.get(key)
+    if payload is not None:
+        metrics.incr("dashboard_cache.hits")
+        return payload
+    metrics.incr("dashboard_cache.misses")
+
+    lock = f"{key}:lock"
+    if not cache.add(lock, 1, timeout=LOCK_SECONDS):
+        # Someone else is building this exact version; wait for it
+        deadline = time.monotonic() + settings.DASHBOARD_CACHE_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            payload = cache.get(key)
+            if payload is not None:
+                metrics.incr("dashboard_cache.waited")
+                return payload
+        metrics.incr("dashboard_cache.wait_timeouts")
+        return build()
+
+    try:
+        started = time.monotonic()
+        payload = build()
+        metrics.observe("dashboard_cache.build_seconds", time.monotonic() - started)
+        cache.set(key, payload, timeout=settings.DASHBOARD_CACHE_SECONDS)
+    finally:
+        cache.delete(lock)
+    return payload
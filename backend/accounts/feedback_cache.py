@@ -0,0 +1,140 @@
+"""
+Cache of AI feedback for near-identical submissions.
+
+Students in the same lesson submit the same program with different comments,
+formatting and variable names. The fingerprint is a hash of the lesson id,
+the model and the code's AST with those differences removed, so all of them
+share one answer. Answers are persisted in LessonFeedback (indexed on the
+fingerprint) and fronted by a process-local LRU.
+
+Local names are renamed consistently, so feedback that mentions a variable
+uses the name of whoever asked first. That is the price of the higher hit rate.
+"""
+import ast
+import builtins
+import hashlib
+import json
+
+from django.conf import settings
+
+from .caching import LRUCache
+from .metrics import metrics
+from .models import Lesson, LessonFeedback
+from .result_cache import normalize_source
+
+feedback_cache = LRUCache(max_entries=settings.FEEDBACK_CACHE_ENTRIES)
+
+BUILTIN_NAMES = set(dir(builtins))
+
+
+class _RenameLocals(ast.NodeTransformer):
+    """Rename every name the program binds itself to v0, v1, ... in order of first binding."""
+
+    def __init__(self, bound):
+        self.names = {}
+        self.bound = bound
+
+    def _rename(self, name):
+        if name not in self.bound:
+            return name
+        if name not in self.names:
+            self.names[name] = f"v{len(self.names)}"
+        return self.names[name]
+
+    def visit_Name(self, node):
+        node.id = self._rename(node.id)
+        return node
+
+    def visit_arg(self, node):
+        node.arg = self._rename(node.arg)
+        node.annotation = None
+        return node
+
+    def visit_ExceptHandler(self, node):
+        if node.name:
+            node.name = self._rename(node.name)
+        return self.generic_visit(node)
+
+
+def _bound_names(tree):
+    """Names assigned to, used as loop/with/except targets or parameters; imports are left alone."""
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+    # Shadowing a builtin is rare enough; renaming it would merge print() with a variable
+    return bound - BUILTIN_NAMES
+
+
+def normalized_ast(code):
+    """
+    A canonical dump of ``code`` without comments, formatting, docstrings
+    and local names, or None if it does not parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return None
+
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if (
+            isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+            and body and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str)
+        ):
+            node.body = body[1:] or [ast.Pass()]
+
+    tree = _RenameLocals(_bound_names(tree)).visit(tree)
+    return ast.dump(tree, annotate_fields=False, include_attributes=False)
+
+
+def fingerprint(code, lesson_id):
+    # Code that does not parse is common here too; key it by its source instead
+    normalized = normalized_ast(code)
+    if normalized is None:
+        normalized = "source:" + normalize_source(code)
+
+    digest = hashlib.sha256()
+    for part in (str(lesson_id or ""), settings.HF_MODEL_ID, normalized):
+        digest.update(part.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def cached_feedback(key):
+    """Feedback stored under fingerprint ``key``, or None."""
+    feedback = feedback_cache.get(key)
+    if feedback is not None:
+        metrics.incr("feedback_cache.hits")
+        return feedback
+
+    stored = (
+        LessonFeedback.objects.filter(fingerprint=key, feedback__isnull=False)
+        .order_by("-id").values_list("feedback", flat=True).first()
+    )
+    if stored is None:
+        metrics.incr("feedback_cache.misses")
+        return None
+
+    metrics.incr("feedback_cache.hits")
+    feedback = json.loads(stored)
+    feedback_cache.set(key, feedback)
+    return feedback
+
+
+def store_feedback(key, user, code, lesson_id, feedback):
+    if lesson_id is not None and not Lesson.objects.filter(id=lesson_id).exists():
+        lesson_id = None
+    LessonFeedback.objects.create(
+        user=user,
+        lesson_id=lesson_id,
+        code=code,
+        fingerprint=key,
+        feedback=json.dumps(feedback),
+    )
+    feedback_cache.set(key, feedback)
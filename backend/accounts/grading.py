@@ -0,0 +1,125 @@
+"""
+Server-side autograder.
+
+A submission is run against every test case of its lesson (or against
+Lesson.expected_output when the lesson has no test cases), all cases on one
+warm sandbox worker. Outputs are normalized before comparison:
+
+- line endings, runs of spaces/tabs and leading/trailing blank lines are ignored
+- floats are compared with settings.GRADER_FLOAT_TOLERANCE
+
+Expected outputs store the hash of their normalized form, so the common case
+is one hash comparison; the token-by-token comparison only runs on a mismatch.
+"""
+import hashlib
+import math
+import re
+
+from django.conf import settings
+
+from .sandbox import run_cases
+
+FLOAT_RE = re.compile(r"[-+]?(?:\d+\.\d*|\.\d+|\d+(?=[eE]))(?:[eE][-+]?\d+)?")
+# Floats are rounded to this many decimals in the normalized (hashed) form
+FLOAT_DECIMALS = 6
+
+
+def _canonical_float(match):
+    value = round(float(match.group()), FLOAT_DECIMALS)
+    return repr(value + 0.0)  # + 0.0 turns -0.0 into 0.0
+
+
+def normalize_output(text):
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+    lines = [" ".join(line.split()) for line in text.split("\n")]
+    return FLOAT_RE.sub(_canonical_float, "\n".join(lines).strip("\n"))
+
+
+def output_hash(text):
+    return hashlib.sha256(normalize_output(text).encode("utf-8")).hexdigest()
+
+
+def _tokens_match(actual, expected, tolerance):
+    if actual == expected:
+        return True
+    try:
+        return math.isclose(float(actual), float(expected), rel_tol=tolerance, abs_tol=tolerance)
+    except ValueError:
+        return False
+
+
+def outputs_match(actual, expected, expected_hash=None, tolerance=None):
+    if tolerance is None:
+        tolerance = settings.GRADER_FLOAT_TOLERANCE
+
+    normalized = normalize_output(actual)
+    if expected_hash is None:
+        expected_hash = output_hash(expected)
+    if hashlib.sha256(normalized.encode("utf-8")).hexdigest() == expected_hash:
+        return True
+
+    # Rounding can push two values that are within tolerance to different
+    # sides of a boundary, so compare token by token before failing
+    actual_lines = [line.split() for line in normalized.split("\n")]
+    expected_lines = [line.split() for line in normalize_output(expected).split("\n")]
+    if len(actual_lines) != len(expected_lines):
+        return False
+    for actual_tokens, expected_tokens in zip(actual_lines, expected_lines):
+        if len(actual_tokens) != len(expected_tokens):
+            return False
+        if not all(_tokens_match(a, e, tolerance) for a, e in zip(actual_tokens, expected_tokens)):
+            return False
+    return True
+
+
+def lesson_cases(lesson):
+    """
+    Test cases of a lesson as plain dicts. Falls back to the lesson's own
+    expected_output when it has no test cases; an empty list means the
+    lesson cannot be graded.
+    """
+    cases = [
+        {
+            "name": case.name or f"Case {case.order}",
+            "stdin": case.stdin,
+            "expected_output": case.expected_output,
+            "expected_output_hash": case.expected_output_hash,
+            "timeout": case.time_limit or settings.GRADER_CASE_TIME_LIMIT,
+        }
+        for case in lesson.test_cases.all()
+    ]
+    if not cases and lesson.expected_output:
+        cases.append({
+            "name": "Expected output",
+            "stdin": "",
+            "expected_output": lesson.expected_output,
+            "expected_output_hash": lesson.expected_output_hash or output_hash(lesson.expected_output),
+            "timeout": settings.GRADER_CASE_TIME_LIMIT,
+        })
+    return cases
+
+
+def grade(code, cases):
+    """Run ``code`` once against ``cases`` (see lesson_cases) and compare the outputs."""
+    results = run_cases(code, [{"stdin": case["stdin"], "timeout": case["timeout"]} for case in cases])
+
+    graded = []
+    for case, result in zip(cases, results):
+        passed = (
+            not result["timed_out"]
+            and result["returncode"] == 0
+            and outputs_match(result["stdout"], case["expected_output"], case["expected_output_hash"])
+        )
+        graded.append({
+            "name": case["name"],
+            "passed": passed,
+            "timed_out": result["timed_out"],
+            "output": (result["stdout"] or result["stderr"]).strip(),
+        })
+
+    return {
+        "passed": bool(graded) and all(case["passed"] for case in graded),
+        "passed_count": sum(case["passed"] for case in graded),
+        "total": len(graded),
+        "cases": graded,
+    }
@@ -0,0 +1,201 @@
+"""
+Instant, rule-based feedback for beginner code.
+
+One ``ast`` parse and a few tree walks, so a submission is checked in well
+under 10 ms. CodeFeedbackView answers with these hints straight away and only
+asks the remote model when the student wants more or no rule fired.
+
+Each hint is ``{"rule", "line", "message"}``; rules are plain functions that
+take the parsed tree (and the lesson's expected output) and yield hints.
+"""
+import ast
+
+# Builtins a beginner is likely to shadow by accident and then need
+COMMON_BUILTINS = {
+    "list", "dict", "set", "str", "int", "float", "tuple", "len", "sum", "min", "max",
+    "input", "print", "range", "type", "id", "sorted", "map", "filter", "zip", "any", "all",
+}
+
+
+def _hint(rule, node, message):
+    return {"rule": rule, "line": getattr(node, "lineno", None), "message": message}
+
+
+def unused_variables(tree, expected_output):
+    loaded = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+    # "for i in range(3):" with an unused i is fine
+    loop_targets = {
+        name.id for node in ast.walk(tree) if isinstance(node, (ast.For, ast.comprehension))
+        for name in ast.walk(node.target) if isinstance(name, ast.Name)
+    }
+    names = sorted(
+        (node for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)),
+        key=lambda node: (node.lineno, node.col_offset),
+    )
+    seen = set()
+    for node in names:
+        name = node.id
+        if name not in loaded and name not in loop_targets and name not in seen and not name.startswith("_"):
+            seen.add(name)
+            yield _hint("unused-variable", node, f"'{name}' is assigned but never used.")
+
+
+def shadowed_builtins(tree, expected_output):
+    seen = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            name = node.id
+        elif isinstance(node, ast.arg):
+            name = node.arg
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            name = node.name
+        else:
+            continue
+        if name in COMMON_BUILTINS and name not in seen:
+            seen.add(name)
+            yield _hint(
+                "shadowed-builtin", node,
+                f"'{name}' hides Python's built-in {name}(); pick another name so you can still use it.",
+            )
+
+
+def none_comparisons(tree, expected_output):
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Compare):
+            continue
+        for op, right in zip(node.ops, node.comparators):
+            if not isinstance(op, (ast.Eq, ast.NotEq)):
+                continue
+            for operand in (node.left, right):
+                if isinstance(operand, ast.Constant) and operand.value is None:
+                    better = "is None" if isinstance(op, ast.Eq) else "is not None"
+                    yield _hint("compare-to-none", node, f"Use '{better}' to check for None instead of '=='/'!='.")
+                    break
+                if isinstance(operand, ast.Constant) and isinstance(operand.value, bool):
+                    yield _hint(
+                        "compare-to-bool", node,
+                        f"No need to compare with {operand.value}; use the condition itself (or 'not').",
+                    )
+                    break
+
+
+def _appended_list(statement):
+    """``name`` if ``statement`` is ``name.append(...)``."""
+    if (
+        isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call)
+        and isinstance(statement.value.func, ast.Attribute) and statement.value.func.attr == "append"
+        and isinstance(statement.value.func.value, ast.Name) and len(statement.value.args) == 1
+    ):
+        return statement.value.func.value.id
+    return None
+
+
+def comprehension_loops(tree, expected_output):
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if not isinstance(body, list):
+            continue
+        for previous, statement in zip(body, body[1:]):
+            if not isinstance(statement, ast.For) or statement.orelse or len(statement.body) != 1:
+                continue
+            inner = statement.body[0]
+            if isinstance(inner, ast.If) and not inner.orelse and len(inner.body) == 1:
+                inner = inner.body[0]
+            name = _appended_list(inner)
+            if (
+                name and isinstance(previous, ast.Assign) and len(previous.targets) == 1
+                and isinstance(previous.targets[0], ast.Name) and previous.targets[0].id == name
+                and isinstance(previous.value, ast.List) and not previous.value.elts
+            ):
+                yield _hint(
+                    "use-comprehension", statement,
+                    f"This loop only builds '{name}'; a list comprehension like "
+                    f"[... for ... in ...] does the same in one line.",
+                )
+
+
+def range_len_loops(tree, expected_output):
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.For) and isinstance(node.iter, ast.Call)
+            and isinstance(node.iter.func, ast.Name) and node.iter.func.id == "range"
+            and len(node.iter.args) == 1 and isinstance(node.iter.args[0], ast.Call)
+            and isinstance(node.iter.args[0].func, ast.Name) and node.iter.args[0].func.id == "len"
+        ):
+            yield _hint(
+                "range-len", node,
+                "Loop over the items directly, or use enumerate() if you also need the index.",
+            )
+
+
+def bare_excepts(tree, expected_output):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ExceptHandler) and node.type is None:
+            yield _hint(
+                "bare-except", node,
+                "A bare 'except:' also hides typos and Ctrl+C; catch the specific error, e.g. 'except ValueError:'.",
+            )
+
+
+def mutable_defaults(tree, expected_output):
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for default in node.args.defaults + [d for d in node.args.kw_defaults if d is not None]:
+                if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                    yield _hint(
+                        "mutable-default", default,
+                        f"The default value of {node.name}() is shared between calls; use None and create it inside.",
+                    )
+
+
+def endless_loops(tree, expected_output):
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.While) and isinstance(node.test, ast.Constant) and node.test.value
+            and not any(isinstance(inner, (ast.Break, ast.Return, ast.Raise)) for inner in ast.walk(node))
+        ):
+            yield _hint("endless-loop", node, "This loop never stops: there is no 'break' inside it.")
+
+
+def missing_print(tree, expected_output):
+    if not (expected_output or "").strip():
+        return
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name) and func.id == "print":
+                return
+            if isinstance(func, ast.Attribute) and func.attr == "write":
+                return
+    yield _hint(
+        "missing-print", None,
+        "This exercise expects output, but your code never calls print(), so nothing is shown.",
+    )
+
+
+RULES = [
+    missing_print,
+    endless_loops,
+    unused_variables,
+    shadowed_builtins,
+    none_comparisons,
+    comprehension_loops,
+    range_len_loops,
+    bare_excepts,
+    mutable_defaults,
+]
+
+
+def analyze(code, expected_output=None):
+    """Hints for ``code``, ordered by line. ``expected_output`` is the lesson's, if any."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError) as exc:
+        line = getattr(exc, "lineno", None)
+        message = getattr(exc, "msg", None) or str(exc)
+        return [{"rule": "syntax-error", "line": line, "message": f"Python cannot read this code: {message}."}]
+    except (RecursionError, MemoryError):
+        return []
+
+    hints = [hint for rule in RULES for hint in rule(tree, expected_output)]
+    return sorted(hints, key=lambda hint: hint["line"] or 0)
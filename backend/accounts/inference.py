@@ -0,0 +1,333 @@
+"""
+HTTP client for the Hugging Face inference backend (AI feedback).
+
+- one pooled keep-alive session per process instead of a new connection per request
+- separate connect/read timeouts (HF_CONNECT_TIMEOUT / HF_REQUEST_TIMEOUT)
+- connection errors, timeouts, 429 and 5xx are retried with jittered exponential backoff
+- a circuit breaker fails fast while the backend is unhealthy, so a dead
+  backend cannot pin every sync worker for the full timeout
+
+AsyncInferenceClient is the variant for ASGI views. It uses httpx when it is
+installed and otherwise runs the sync client in a thread.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class InferenceError(Exception):
+    """The backend could not produce a result."""
+
+
+class InferenceUnavailable(InferenceError):
+    """The circuit is open; the backend was not called."""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures. Once
+    ``reset_timeout`` seconds have passed a single trial request is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow_request(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_in_progress:
+                    metrics.incr("inference.circuit_opened")
+                self._opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+
+class _RetryableError(InferenceError):
+    pass
+
+
+def _backoff(attempt, base):
+    # "Full jitter": spreads the retries of many workers over the whole interval
+    return random.uniform(0, base * 2 ** attempt)
+
+
+def _parse(status_code, body):
+    """Raise for a failed response, return the decoded JSON otherwise."""
+    if status_code in RETRY_STATUSES:
+        raise _RetryableError(f"Inference backend returned {status_code}")
+    if status_code >= 400:
+        raise InferenceError(f"Inference backend returned {status_code}")
+    if isinstance(body, dict) and "error" in body:
+        raise InferenceError(str(body["error"]))
+    return body
+
+
+class InferenceClient:
+    def __init__(self, base_url, model_id, api_key=None, connect_timeout=3, read_timeout=15,
+                 max_retries=2, backoff=0.5, pool_size=10, breaker=None):
+        self.url = base_url.rstrip("/") + "/" + model_id
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def payload(self, prompt, parameters=None):
+        payload = {"inputs": prompt}
+        if parameters:
+            payload["parameters"] = parameters
+        return payload
+
+    def _admit(self):
+        if not self.breaker.allow_request():
+            metrics.incr("inference.rejected_open_circuit")
+            raise InferenceUnavailable("AI feedback is temporarily unavailable.")
+
+    def _succeeded(self, result, started):
+        self.breaker.record_success()
+        metrics.observe("inference.seconds", time.monotonic() - started)
+        return result
+
+    def _rejected(self):
+        # The backend answered, so it is healthy; the request itself was bad
+        self.breaker.record_success()
+        metrics.incr("inference.errors")
+
+    def _gave_up(self):
+        self.breaker.record_failure()
+        metrics.incr("inference.errors")
+
+    def _send(self, payload):
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as exc:
+            raise _RetryableError(f"Inference backend unreachable: {exc}") from exc
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return _parse(response.status_code, body)
+
+    def generate(self, prompt, parameters=None):
+        """POST ``prompt`` to the model and return the decoded JSON response."""
+        self._admit()
+        payload = self.payload(prompt, parameters)
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._succeeded(self._send(payload), started)
+            except _RetryableError:
+                if attempt == self.max_retries:
+                    self._gave_up()
+                    raise
+            except InferenceError:
+                self._rejected()
+                raise
+            except Exception:
+                # Anything unexpected counts against the backend and ends a half-open trial
+                self._gave_up()
+                raise
+            metrics.incr("inference.retries")
+            time.sleep(_backoff(attempt, self.backoff))
+
+    def _open_stream(self, payload):
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout, stream=True)
+        except requests.RequestException as exc:
+            raise _RetryableError(f"Inference backend unreachable: {exc}") from exc
+        if response.status_code != 200:
+            try:
+                body = response.json()
+            except ValueError:
+                body = None
+            finally:
+                response.close()
+            _parse(response.status_code, body)
+        return response
+
+    def stream(self, prompt, parameters=None):
+        """
+        Yield the generated text piece by piece (the backend's SSE token stream).
+        Closing the generator closes the connection, which makes the backend
+        stop generating; the read timeout applies to the gap between tokens.
+        """
+        self._admit()
+        payload = dict(self.payload(prompt, parameters), stream=True)
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            # Only opening the stream is retried; tokens already sent cannot be taken back
+            try:
+                response = self._open_stream(payload)
+                break
+            except _RetryableError:
+                if attempt == self.max_retries:
+                    self._gave_up()
+                    raise
+            except InferenceError:
+                self._rejected()
+                raise
+            except Exception:
+                self._gave_up()
+                raise
+            metrics.incr("inference.retries")
+            time.sleep(_backoff(attempt, self.backoff))
+
+        # The backend answered; settle the breaker now in case the stream is abandoned
+        self.breaker.record_success()
+        metrics.observe("inference.first_byte_seconds", time.monotonic() - started)
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = json.loads(line[len("data:"):])
+                if "error" in data:
+                    raise InferenceError(str(data["error"]))
+                token = data.get("token") or {}
+                if token.get("text") and not token.get("special"):
+                    yield token["text"]
+        except (requests.RequestException, ValueError) as exc:
+            metrics.incr("inference.errors")
+            raise InferenceError(f"Inference stream interrupted: {exc}") from exc
+        finally:
+            response.close()
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncInferenceClient:
+    """Same behaviour as InferenceClient (and sharing its breaker) for async views."""
+
+    def __init__(self, client):
+        self.client = client
+        try:
+            import httpx
+        except ImportError:
+            self._http = None
+        else:
+            connect_timeout, read_timeout = client.timeout
+            self._http = httpx.AsyncClient(
+                headers=dict(client.session.headers),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=client.pool_size, max_keepalive_connections=client.pool_size),
+            )
+
+    async def _send(self, payload):
+        import httpx
+
+        try:
+            response = await self._http.post(self.client.url, json=payload)
+        except httpx.HTTPError as exc:
+            raise _RetryableError(f"Inference backend unreachable: {exc}") from exc
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return _parse(response.status_code, body)
+
+    async def generate(self, prompt, parameters=None):
+        if self._http is None:
+            return await asyncio.to_thread(self.client.generate, prompt, parameters)
+
+        client = self.client
+        client._admit()
+        payload = client.payload(prompt, parameters)
+        started = time.monotonic()
+        for attempt in range(client.max_retries + 1):
+            try:
+                return client._succeeded(await self._send(payload), started)
+            except _RetryableError:
+                if attempt == client.max_retries:
+                    client._gave_up()
+                    raise
+            except InferenceError:
+                client._rejected()
+                raise
+            except Exception:
+                client._gave_up()
+                raise
+            metrics.incr("inference.retries")
+            await asyncio.sleep(_backoff(attempt, client.backoff))
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client, built from the HF_* settings on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = InferenceClient(
+                base_url=settings.HF_API_URL,
+                model_id=settings.HF_MODEL_ID,
+                api_key=settings.HF_API_KEY,
+                connect_timeout=settings.HF_CONNECT_TIMEOUT,
+                read_timeout=settings.HF_REQUEST_TIMEOUT,
+                max_retries=settings.HF_MAX_RETRIES,
+                backoff=settings.HF_RETRY_BACKOFF,
+                pool_size=settings.HF_POOL_SIZE,
+                breaker=CircuitBreaker(
+                    failure_threshold=settings.HF_CIRCUIT_FAILURES,
+                    reset_timeout=settings.HF_CIRCUIT_RESET_SECONDS,
+                ),
+            )
+        return _client
+
@@ -0,0 +1,159 @@
+"""
+Asynchronous code-execution jobs.
+
+RunCodeView stores a CodeRunJob and returns its id straight away; an executor
+picks the job up, runs it in the sandbox and writes the result back. Clients
+read the result from the poll or SSE endpoint.
+
+Two executors are supported (settings.CODE_RUNNER_JOB_EXECUTOR):
+
+- ``"external"``: the ``run_code_executor`` management command, run as its own
+  process next to gunicorn, so web workers never block on student code.
+- ``"thread"``: a small thread pool inside each web worker, for local
+  development and single-box deployments.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .metrics import metrics
+from .models import CodeRunJob, Lesson
+from .sandbox import run_code
+
+_thread_executor = None
+_thread_executor_lock = threading.Lock()
+
+
+def _get_thread_executor():
+    global _thread_executor
+    if _thread_executor is None:
+        with _thread_executor_lock:
+            if _thread_executor is None:
+                _thread_executor = ThreadPoolExecutor(
+                    max_workers=settings.CODE_RUNNER_POOL_SIZE,
+                    thread_name_prefix="code-job",
+                )
+    return _thread_executor
+
+
+def submit_job(user, code, lesson_id=None):
+    # lesson_id comes straight from the client, only link the job to lessons that exist
+    lesson = Lesson.objects.filter(id=lesson_id).first() if str(lesson_id).isdigit() else None
+    job = CodeRunJob.objects.create(user=user, code=code, lesson=lesson)
+    metrics.incr("code_runner.jobs.submitted")
+
+    if settings.CODE_RUNNER_JOB_EXECUTOR == "thread":
+        transaction.on_commit(lambda: _get_thread_executor().submit(_execute_in_thread, job.id))
+    return job
+
+
+def unfinished_jobs(user):
+    return CodeRunJob.objects.filter(
+        user=user, status__in=[CodeRunJob.STATUS_QUEUED, CodeRunJob.STATUS_RUNNING]
+    ).count()
+
+
+def _execute_in_thread(job_id):
+    try:
+        execute_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id):
+    """Move a queued job to running. Returns False if someone else got it first."""
+    return CodeRunJob.objects.filter(id=job_id, status=CodeRunJob.STATUS_QUEUED).update(
+        status=CodeRunJob.STATUS_RUNNING, started_at=timezone.now()
+    ) == 1
+
+
+def claim_next_job():
+    """Claim the oldest queued job, or return None when the queue is empty."""
+    for job_id in CodeRunJob.objects.filter(status=CodeRunJob.STATUS_QUEUED).values_list("id", flat=True)[:10]:
+        if claim_job(job_id):
+            return job_id
+    return None
+
+
+def execute_job(job_id, claimed=False):
+    if not claimed and not claim_job(job_id):
+        return
+
+    job = CodeRunJob.objects.get(id=job_id)
+    metrics.observe("code_runner.jobs.queue_seconds", (job.started_at - job.created_at).total_seconds())
+
+    try:
+        result = run_code(job.code, lesson_id=job.lesson_id)
+    except Exception as e:
+        job.status = CodeRunJob.STATUS_FAILED
+        job.error = f"Execution failed: {str(e)}"
+    else:
+        job.stdout = result["stdout"]
+        job.stderr = result["stderr"]
+        job.returncode = result["returncode"]
+        if result["timed_out"]:
+            job.status = CodeRunJob.STATUS_TIMEOUT
+            job.error = "Execution timeout exceeded."
+        else:
+            job.status = CodeRunJob.STATUS_DONE
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "stdout", "stderr", "returncode", "error", "finished_at"])
+    metrics.incr(f"code_runner.jobs.{job.status}")
+
+
+def fail_stale_jobs(jobs=None):
+    """Jobs left running by an executor that died never finish on their own."""
+    cutoff = timezone.now() - timedelta(seconds=settings.CODE_RUNNER_TIMEOUT + settings.CODE_RUNNER_JOB_STALE_AFTER)
+    jobs = CodeRunJob.objects.all() if jobs is None else jobs
+    return jobs.filter(status=CodeRunJob.STATUS_RUNNING, started_at__lt=cutoff).update(
+        status=CodeRunJob.STATUS_FAILED, error="Execution failed: the executor stopped.", finished_at=timezone.now()
+    )
+
+
+def fail_if_stale(job):
+    """
+    Called by the poll and stream endpoints, so a job orphaned by a dead
+    thread executor still reaches a final state without the external sweep.
+    """
+    if job.status == CodeRunJob.STATUS_RUNNING and fail_stale_jobs(CodeRunJob.objects.filter(pk=job.pk)):
+        job.refresh_from_db()
+    return job
+
+
+def run_executor(poll_interval=0.2, max_jobs=None):
+    """Main loop of the external executor. Returns the number of jobs run."""
+    executed = 0
+    last_sweep = 0
+    while max_jobs is None or executed < max_jobs:
+        if time.monotonic() - last_sweep > settings.CODE_RUNNER_JOB_STALE_AFTER:
+            fail_stale_jobs()
+            last_sweep = time.monotonic()
+
+        job_id = claim_next_job()
+        if job_id is None:
+            if max_jobs is not None:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        execute_job(job_id, claimed=True)
+        executed += 1
+    return executed
+
+
+def job_payload(job):
+    """Job state in the same shape as the synchronous run-code/ response."""
+    payload = {"job_id": str(job.id), "status": job.status}
+    if job.status == CodeRunJob.STATUS_DONE:
+        output = job.stdout if job.stdout else job.stderr
+        payload["output"] = output.strip()
+        payload["status_code"] = job.returncode
+    elif job.is_finished:
+        payload["error"] = job.error
+    return payload
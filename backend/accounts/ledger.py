@@ -0,0 +1,226 @@
+"""
+The XP ledger: every XP change is an inserted XpLedgerEntry, never an update.
+
+UserProgress.xp and level are a snapshot of a user's entries up to
+UserProgress.xp_ledger_id. Awarding XP only inserts entries (``record``).
+Reads add whatever is past the snapshot (``with_live_xp``, ``live_xp``),
+a short range scan on the (user, id) index. ``snapshot``, run as its own
+process by ``manage.py snapshot_xp``, folds new entries into the snapshots in
+id order and creates the level-up activities, so those show up within a
+snapshot interval of the award.
+
+The snapshotter runs as the ``worker`` process of the Procfile. As a fallback
+for hosts that only run the web process, every web process also runs one
+snapshot of at most XP_SNAPSHOT_INLINE_BATCH_SIZE entries after an award, no
+more than once per XP_SNAPSHOT_INTERVAL (``fold_if_due``). That keeps the
+unfolded tail short and level-ups coming even when no worker is deployed; with
+one, it mostly finds nothing to do.
+
+The snapshotter's cursor is the highest xp_ledger_id of any progress row. An
+id is handed out on insert but only becomes visible on commit, so entries
+younger than XP_SNAPSHOT_LAG_SECONDS wait for the next run; an entry whose
+transaction stayed open longer than that can be passed over. ``rebuild``
+(``manage.py reconcile_xp``) recomputes totals from the whole ledger and
+repairs that, or any other drift.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import dashboard_cache
+from .leveling import level_for_xp
+from .metrics import metrics
+from .models import CustomUser, UserActivity, UserProgress, XpLedgerEntry
+
+logger = logging.getLogger(__name__)
+
+_inline_lock = threading.Lock()
+_last_inline_fold = None
+
+
+def _invalidate_dashboards(user_ids):
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: [dashboard_cache.invalidate(user_id) for user_id in user_ids])
+
+
+def record(user, awards):
+    """Append ``(source, source_id, amount)`` entries for ``user``; zero amounts are skipped."""
+    entries = [
+        XpLedgerEntry(user=user, source=source, source_id=source_id, amount=amount)
+        for source, source_id, amount in awards if amount
+    ]
+    if entries:
+        XpLedgerEntry.objects.bulk_create(entries)
+        _invalidate_dashboards([user.pk])
+        transaction.on_commit(fold_if_due)
+    return entries
+
+
+def fold_if_due():
+    """One bounded ``snapshot``, at most every XP_SNAPSHOT_INTERVAL in this process."""
+    global _last_inline_fold
+    if not settings.XP_SNAPSHOT_INLINE_BATCH_SIZE:
+        return
+    with _inline_lock:
+        now = time.monotonic()
+        if _last_inline_fold is not None and now - _last_inline_fold < settings.XP_SNAPSHOT_INTERVAL:
+            return
+        _last_inline_fold = now
+    try:
+        snapshot(batch_size=settings.XP_SNAPSHOT_INLINE_BATCH_SIZE)
+    except DatabaseError:
+        # The award is committed; the next run or the worker folds it
+        logger.exception("Inline XP snapshot failed")
+
+
+def _pending_xp():
+    pending = XpLedgerEntry.objects.filter(
+        user_id=OuterRef("user_id"), id__gt=OuterRef("xp_ledger_id"),
+    ).order_by().values("user_id").annotate(total=Sum("amount")).values("total")
+    return Coalesce(Subquery(pending), Value(0))
+
+
+def with_live_xp(queryset):
+    """Annotate progress rows with ``live_xp``: the snapshot plus the entries after it."""
+    return queryset.annotate(live_xp=F("xp") + _pending_xp())
+
+
+def live_xp(progress):
+    """XP including entries not folded yet; one query unless ``with_live_xp`` already ran."""
+    if getattr(progress, "live_xp", None) is None:
+        pending = XpLedgerEntry.objects.filter(
+            user_id=progress.user_id, id__gt=progress.xp_ledger_id,
+        ).aggregate(total=Sum("amount"))["total"]
+        progress.live_xp = progress.xp + (pending or 0)
+    return progress.live_xp
+
+
+def _cursor():
+    return UserProgress.objects.aggregate(cursor=Max("xp_ledger_id"))["cursor"] or 0
+
+
+def _locked_progress(user_ids):
+    """Progress rows of ``user_ids``, locked; creates the missing ones of users that still exist."""
+    rows = {p.user_id: p for p in UserProgress.objects.select_for_update().filter(user_id__in=user_ids).order_by("pk")}
+    missing = list(CustomUser.objects.filter(pk__in=set(user_ids) - set(rows)).values_list("pk", flat=True))
+    if missing:
+        UserProgress.objects.bulk_create([UserProgress(user_id=user_id) for user_id in missing], ignore_conflicts=True)
+        rows.update({p.user_id: p for p in UserProgress.objects.select_for_update().filter(user_id__in=missing)})
+    return rows
+
+
+def snapshot(batch_size=None, lag=None):
+    """
+    Fold up to ``batch_size`` entries past the cursor into UserProgress in one
+    transaction. Returns how many entries were read; fewer than ``batch_size``
+    means the snapshots have caught up.
+    """
+    batch_size = batch_size or settings.XP_SNAPSHOT_BATCH_SIZE
+    lag = settings.XP_SNAPSHOT_LAG_SECONDS if lag is None else lag
+    horizon = timezone.now() - timedelta(seconds=lag)
+
+    entries = defaultdict(list)
+    read = 0
+    rows = XpLedgerEntry.objects.filter(id__gt=_cursor()).order_by("id").values_list(
+        "id", "user_id", "amount", "created_at"
+    )[:batch_size]
+    for entry_id, user_id, amount, created_at in rows:
+        if created_at > horizon:
+            # Stop at the first young entry; the ones after it may not be visible yet
+            break
+        entries[user_id].append((entry_id, amount))
+        read += 1
+    if not read:
+        return 0
+
+    with transaction.atomic():
+        progress = _locked_progress(entries)
+        changed, level_ups = [], []
+        for user_id, user_entries in entries.items():
+            p = progress.get(user_id)
+            # A concurrent snapshot or a rebuild may have folded some of them already
+            new = [(entry_id, amount) for entry_id, amount in user_entries if p and entry_id > p.xp_ledger_id]
+            if not new:
+                continue
+            p.xp += sum(amount for _, amount in new)
+            p.xp_ledger_id = new[-1][0]
+            level = level_for_xp(p.xp)
+            if level > p.level:
+                level_ups.append(UserActivity(
+                    user_id=user_id,
+                    activity_type='level_up',
+                    title="Level Up! 🎉",
+                    description=f"Reached Level {level}",
+                    xp_earned=0,
+                    level_achieved=level,
+                ))
+            p.level = level
+            changed.append(p)
+
+        UserProgress.objects.bulk_update(changed, ["xp", "xp_ledger_id", "level"])
+        if level_ups:
+            # bulk_create sends no post_save, which would have invalidated these dashboards
+            UserActivity.objects.bulk_create(level_ups)
+            _invalidate_dashboards(activity.user_id for activity in level_ups)
+
+    metrics.incr("xp_snapshot.entries", read)
+    metrics.incr("xp_snapshot.level_ups", len(level_ups))
+    return read
+
+
+def rebuild(user_ids=None, chunk_size=1000, dry_run=False):
+    """
+    Recompute xp and level of the given users (default: everyone) from the
+    whole ledger, ``chunk_size`` progress rows per transaction. No level-up
+    activities are created.
+
+    Returns ``(checked, drift)`` where ``drift`` lists ``(user_id, xp_shown, ledger_xp)``
+    for every user whose live XP did not match the ledger.
+    """
+    queryset = UserProgress.objects.order_by("pk")
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+
+    checked, drift = 0, []
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            rows = list(with_live_xp(queryset.select_for_update().filter(pk__gt=last_pk))[:chunk_size])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+            checked += len(rows)
+
+            # Folded totals stop at the cursor so the snapshotter still picks up what comes after it
+            cursor = _cursor()
+            totals = {
+                row["user_id"]: row
+                for row in XpLedgerEntry.objects.filter(user_id__in=[p.user_id for p in rows]).order_by().values(
+                    "user_id"
+                ).annotate(total=Sum("amount"), folded=Sum("amount", filter=Q(id__lte=cursor)))
+            }
+
+            changed, drifted = [], []
+            for p in rows:
+                total = totals.get(p.user_id, {}).get("total") or 0
+                folded = totals.get(p.user_id, {}).get("folded") or 0
+                if p.live_xp != total:
+                    drifted.append((p.user_id, p.live_xp, total))
+                if (p.xp, p.xp_ledger_id, p.level) != (folded, cursor, level_for_xp(folded)):
+                    p.xp, p.xp_ledger_id, p.level = folded, cursor, level_for_xp(folded)
+                    changed.append(p)
+
+            if changed and not dry_run:
+                UserProgress.objects.bulk_update(changed, ["xp", "xp_ledger_id", "level"])
+                # Dashboards show live XP, which only moved for the drifted users
+                _invalidate_dashboards(user_id for user_id, _, _ in drifted)
+            drift += drifted
+    return checked, drift
@@ -0,0 +1,62 @@
+"""
+The XP curve, in one place.
+
+Level n starts at THRESHOLDS[n - 1] XP. The first ten levels follow
+BASE_THRESHOLDS; after that every level costs STEP_XP more. The table is
+precomputed for TABLE_LEVELS levels and looked up with bisect; XP beyond the
+table falls back to arithmetic on the last step.
+
+Changing the curve only changes the numbers below; run
+``manage.py recompute_levels`` afterwards to rewrite the stored levels.
+"""
+from bisect import bisect_right
+
+try:
+    import numpy
+except ImportError:  # in requirements.txt; without it recompute_levels falls back to bisect
+    numpy = None
+
+BASE_THRESHOLDS = (0, 50, 150, 300, 500, 750, 1050, 1400, 1800, 2250)
+STEP_XP = 500
+TABLE_LEVELS = 1000
+
+THRESHOLDS = BASE_THRESHOLDS + tuple(
+    BASE_THRESHOLDS[-1] + STEP_XP * i for i in range(1, TABLE_LEVELS - len(BASE_THRESHOLDS) + 1)
+)
+
+
+def level_start(level):
+    """XP at which ``level`` begins."""
+    if level <= len(THRESHOLDS):
+        return THRESHOLDS[max(level, 1) - 1]
+    return THRESHOLDS[-1] + (level - len(THRESHOLDS)) * STEP_XP
+
+
+def level_for_xp(xp):
+    if xp >= THRESHOLDS[-1]:
+        return len(THRESHOLDS) + (xp - THRESHOLDS[-1]) // STEP_XP
+    return max(bisect_right(THRESHOLDS, xp), 1)
+
+
+def level_progress(xp):
+    """Where ``xp`` sits inside its level, for progress bars."""
+    level = level_for_xp(xp)
+    start, end = level_start(level), level_start(level + 1)
+    return {
+        "xp_in_level": xp - start,
+        "xp_needed": end - start,
+        "next_level_xp": end,
+    }
+
+
+def levels_for_xp(xps):
+    """``level_for_xp`` over a sequence; vectorized when NumPy is installed."""
+    if numpy is None:
+        return [level_for_xp(xp) for xp in xps]
+
+    xps = numpy.asarray(xps, dtype=numpy.int64)
+    table = numpy.asarray(THRESHOLDS, dtype=numpy.int64)
+    levels = numpy.maximum(numpy.searchsorted(table, xps, side="right"), 1)
+    beyond = xps >= table[-1]
+    levels[beyond] = len(THRESHOLDS) + (xps[beyond] - table[-1]) // STEP_XP
+    return levels.tolist()
@@ -0,0 +1,208 @@
+import json
+import math
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import time as clock, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from accounts.models import CustomUser, Lesson, QuizAttempt, QuizQuestion, StudySession, UserActivity
+
+# Indexes the hot queries below are meant to use; they are dropped for the "before" run
+BENCHMARKED_MODELS = [Lesson, QuizQuestion, StudySession, UserActivity, QuizAttempt]
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    # auto_now_add would give every synthetic row the same created_at
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a synthetic dataset inside a transaction, then record EXPLAIN plans and latencies "
+        "of the hot per-user and per-track queries without and with the indexes declared on the "
+        "models. Everything is rolled back afterwards. Local databases only: it drops indexes "
+        "of live tables and holds their locks for the whole run, so it refuses to run unless "
+        "DEBUG is on or --force is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--activities", type=int, default=500, help="Activities per user.")
+        parser.add_argument("--sessions", type=int, default=100, help="Study sessions per user.")
+        parser.add_argument("--lessons", type=int, default=40, help="Lessons per track.")
+        parser.add_argument("--questions", type=int, default=10, help="Quiz questions per lesson.")
+        parser.add_argument("--repeat", type=int, default=50, help="Timed executions per query.")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+        parser.add_argument("--force", action="store_true", help="Run even though DEBUG is off.")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["force"]:
+            raise CommandError(
+                f"benchmark_queries drops indexes on the {connection.vendor} database "
+                f"{connection.settings_dict['NAME']!r} for the length of the run. Only run it against "
+                "a local database; pass --force if this is one."
+            )
+        random.seed(0)
+        # Unique per run so the synthetic users cannot collide with real ones
+        self.prefix = f"benchmark-{uuid.uuid4().hex[:8]}"
+        with transaction.atomic():
+            started = time.monotonic()
+            user = self.load(options)
+            self.stdout.write(f"Loaded synthetic data in {time.monotonic() - started:.1f}s")
+            self.analyze()
+
+            queries = self.queries(user)
+            indexes = [(model, index) for model in BENCHMARKED_MODELS for index in model._meta.indexes]
+
+            self.set_indexes(indexes, present=False)
+            before = self.measure(queries, options["repeat"])
+            self.set_indexes(indexes, present=True)
+            after = self.measure(queries, options["repeat"])
+
+            transaction.set_rollback(True)
+
+        self.report(before, after)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump({
+                    "vendor": connection.vendor,
+                    "options": {k: options[k] for k in ("users", "activities", "sessions", "lessons", "questions", "repeat")},
+                    "indexes": [index.name for _, index in indexes],
+                    "before": before,
+                    "after": after,
+                }, f, indent=2)
+
+    def load(self, options):
+        goals = [goal for goal, _ in CustomUser.LEARNING_GOALS]
+        levels = [level for level, _ in CustomUser.DIFFICULTY_LEVELS]
+        now = timezone.now()
+        today = timezone.localdate()
+
+        lessons = Lesson.objects.bulk_create(
+            Lesson(title=f"Benchmark {goal} {level} {i}", description="", learning_goal=goal,
+                   difficulty_level=level, order=i)
+            for goal in goals for level in levels for i in range(options["lessons"])
+        )
+        QuizQuestion.objects.bulk_create(
+            (QuizQuestion(lesson=lesson, question=f"Question {i}", option_a="a", option_b="b", option_c="c",
+                          option_d="d", correct_option="A", order=i)
+             for lesson in lessons for i in range(options["questions"])),
+            batch_size=2000,
+        )
+
+        # bulk_create skips the signup signals, which is what we want here
+        users = CustomUser.objects.bulk_create(
+            CustomUser(username=f"{self.prefix}-{i}", email=f"{self.prefix}-{i}@example.invalid",
+                       learning_goal=random.choice(goals), difficulty_level=random.choice(levels))
+            for i in range(options["users"])
+        )
+        types = [choice for choice, _ in UserActivity.ACTIVITY_TYPES]
+        with explicit_timestamps(UserActivity._meta.get_field("created_at")):
+            UserActivity.objects.bulk_create(
+                (UserActivity(user=user, activity_type=random.choice(types), title="Benchmark", description="",
+                              xp_earned=random.choice([0, 0, 10, 20]),
+                              created_at=now - timedelta(minutes=random.randint(0, 60 * 24 * 365)))
+                 for user in users for _ in range(options["activities"])),
+                batch_size=2000,
+            )
+        StudySession.objects.bulk_create(
+            (StudySession(user=user, lesson=random.choice(lessons), date=today + timedelta(days=random.randint(-365, 60)),
+                          start_time=clock(random.randint(8, 20)), end_time=clock(21))
+             for user in users for _ in range(options["sessions"])),
+            batch_size=2000,
+        )
+        QuizAttempt.objects.bulk_create(
+            QuizAttempt(user=user, quiz_type=quiz_type, learning_goal=user.learning_goal,
+                        difficulty_level=user.difficulty_level)
+            for user in users for quiz_type in ("general", f"lesson_{lessons[0].id}", f"lesson_{lessons[1].id}")
+        )
+        return users[len(users) // 2]
+
+    def analyze(self):
+        # Give the planner statistics for the freshly loaded rows
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def queries(self, user):
+        """The queries behind the dashboard, lesson lists, activities and quiz endpoints."""
+        today = timezone.localdate()
+        activities = UserActivity.objects.filter(user=user).order_by("-created_at", "-id")
+        middle = activities[activities.count() // 2]
+        lesson = Lesson.objects.filter(learning_goal=user.learning_goal, difficulty_level=user.difficulty_level).first()
+        return {
+            "dashboard.recent_activities": UserActivity.objects.filter(user=user)[:5],
+            "dashboard.study_sessions": StudySession.objects.filter(
+                user=user, date__gte=today - timedelta(days=7), date__lte=today + timedelta(days=30),
+            ).select_related("lesson").order_by("date", "start_time")[:20],
+            "lessons.track": Lesson.objects.filter(
+                learning_goal=user.learning_goal, difficulty_level=user.difficulty_level,
+            ).order_by("order"),
+            "activities.first_page": activities[:21],
+            "activities.deep_page": activities.filter(
+                models.Q(created_at__lt=middle.created_at) | models.Q(created_at=middle.created_at, id__lt=middle.id)
+            )[:21],
+            "quiz.general": QuizQuestion.objects.filter(
+                lesson__learning_goal=user.learning_goal, lesson__difficulty_level=user.difficulty_level,
+            ).order_by("order", "id")[:5],
+            "quiz.lesson": QuizQuestion.objects.filter(lesson=lesson),
+            "quiz.attempt": QuizAttempt.objects.filter(
+                user=user, quiz_type="general", learning_goal=user.learning_goal, difficulty_level=user.difficulty_level,
+            ),
+        }
+
+    def set_indexes(self, indexes, present):
+        # Not entered as a context manager: SQLite refuses that inside a transaction
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model, index in indexes:
+                if present:
+                    sql = str(index.create_sql(model, editor))
+                else:
+                    sql = editor.sql_delete_index % {
+                        "table": editor.quote_name(model._meta.db_table),
+                        "name": editor.quote_name(index.name),
+                    }
+                cursor.execute(sql)
+        self.analyze()
+
+    def measure(self, queries, repeat):
+        results = {}
+        for name, queryset in queries.items():
+            plan = queryset.explain()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())  # .all() gives a fresh, unevaluated copy
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            results[name] = {
+                "plan": plan,
+                "p50_ms": round(statistics.median(timings), 3),
+                # Nearest rank, so it is never below the median however few the repeats
+                "p95_ms": round(timings[math.ceil(0.95 * len(timings)) - 1], 3),
+            }
+        return results
+
+    def report(self, before, after):
+        self.stdout.write(f"\n{'Query':30} {'before p50':>11} {'after p50':>10} {'before p95':>11} {'after p95':>10}")
+        for name in before:
+            self.stdout.write(
+                f"{name:30} {before[name]['p50_ms']:>9.3f}ms {after[name]['p50_ms']:>8.3f}ms "
+                f"{before[name]['p95_ms']:>9.3f}ms {after[name]['p95_ms']:>8.3f}ms"
+            )
+        for name in before:
+            self.stdout.write(f"\n== {name}\n-- before\n{before[name]['plan']}\n-- after\n{after[name]['plan']}")
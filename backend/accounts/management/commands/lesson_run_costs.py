@@ -0,0 +1,52 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import LessonRunStats
+from accounts.usage import METRICS, merge_histogram, percentile, recorder
+
+
+class Command(BaseCommand):
+    help = "Report p50/p95/p99 resource cost of code runs per lesson."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7, help="Look back this many days (default 7).")
+        parser.add_argument("--sort", choices=METRICS, default="cpu_ms",
+                            help="Order lessons by the p95 of this metric.")
+
+    def handle(self, *args, **options):
+        recorder.flush()
+        since = timezone.localdate() - timedelta(days=options["days"] - 1)
+        rows = LessonRunStats.objects.filter(day__gte=since).select_related("lesson")
+
+        lessons = {}
+        runs = defaultdict(int)
+        timeouts = defaultdict(int)
+        histograms = defaultdict(lambda: {metric: {} for metric in METRICS})
+        for row in rows:
+            lessons[row.lesson_id] = row.lesson
+            runs[row.lesson_id] += row.runs
+            timeouts[row.lesson_id] += row.timeouts
+            for metric in METRICS:
+                merge_histogram(histograms[row.lesson_id][metric], row.histograms.get(metric, {}))
+
+        if not lessons:
+            self.stdout.write(f"No code runs recorded in the last {options['days']} day(s).")
+            return
+
+        def p95(lesson_id):
+            return percentile(histograms[lesson_id][options["sort"]], 0.95) or 0
+
+        self.stdout.write(f"{'Lesson':40} {'Runs':>7} {'T/O':>5}  " + "  ".join(
+            f"{metric + ' p50/p95/p99':>28}" for metric in METRICS
+        ))
+        for lesson_id in sorted(lessons, key=p95, reverse=True):
+            columns = []
+            for metric in METRICS:
+                values = [percentile(histograms[lesson_id][metric], p) for p in (0.5, 0.95, 0.99)]
+                columns.append(f"{'/'.join('-' if v is None else str(v) for v in values):>28}")
+            self.stdout.write(
+                f"{lessons[lesson_id].title[:40]:40} {runs[lesson_id]:>7} {timeouts[lesson_id]:>5}  " + "  ".join(columns)
+            )
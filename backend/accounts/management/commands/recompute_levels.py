@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts import dashboard_cache
+from accounts.leveling import levels_for_xp, numpy
+from accounts.models import UserProgress
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite every stored level from XP with the current curve (accounts/leveling.py), "
+        "in chunks with bulk_update. No level-up activities are created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows read and written per transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many levels would change.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        scanned = raised = lowered = 0
+        last_pk = 0
+
+        while True:
+            # Keyset over the primary key; each chunk is its own short transaction
+            rows = list(
+                UserProgress.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", "xp", "level")
+                [:options["chunk_size"]]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            scanned += len(rows)
+
+            levels = levels_for_xp([xp for _, xp, _ in rows])
+            changed = [UserProgress(pk=pk, level=new) for (pk, _, old), new in zip(rows, levels) if new != old]
+            raised += sum(1 for (_, _, old), new in zip(rows, levels) if new > old)
+            lowered += sum(1 for (_, _, old), new in zip(rows, levels) if new < old)
+
+            if changed and not options["dry_run"]:
+                with transaction.atomic():
+                    UserProgress.objects.bulk_update(changed, ["level"])
+
+        if (raised or lowered) and not options["dry_run"]:
+            # bulk_update sends no signals; every cached dashboard shows a level
+            dashboard_cache.invalidate_all()
+
+        self.stdout.write(
+            f"{'Would change' if options['dry_run'] else 'Changed'} {raised + lowered} of {scanned} level(s) "
+            f"({raised} raised, {lowered} lowered) in {time.monotonic() - started:.2f}s"
+            f"{'' if numpy is not None else ' (NumPy not installed; used bisect)'}."
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from accounts.ledger import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild UserProgress xp and level from the XP ledger (accounts/ledger.py) "
+        "and report every user whose total had drifted from it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users", metavar="USER_ID",
+                            help="Only this user; repeat for several. Default: everyone.")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Progress rows per transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report drift.")
+
+    def handle(self, *args, **options):
+        checked, drift = rebuild(user_ids=options["users"], chunk_size=options["chunk_size"],
+                                 dry_run=options["dry_run"])
+        for user_id, shown, total in drift:
+            self.stdout.write(f"user {user_id}: showed {shown} XP, ledger has {total} ({total - shown:+d})")
+        self.stdout.write(
+            f"Checked {checked} user(s); {len(drift)} had drifted"
+            f"{' (dry run, nothing written)' if options['dry_run'] else ' and were repaired'}."
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from accounts.jobs import run_executor
+
+
+class Command(BaseCommand):
+    help = "Run queued code-execution jobs (the executor tier for async run-code/ requests)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll-interval", type=float, default=0.2,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--once", action="store_true",
+                            help="Drain the current queue and exit instead of running forever.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Code executor started.")
+        executed = run_executor(
+            poll_interval=options["poll_interval"],
+            max_jobs=float("inf") if options["once"] else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Executed {executed} job(s)."))
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.ledger import snapshot
+
+
+class Command(BaseCommand):
+    help = "Fold new XP ledger entries into UserProgress xp and level (accounts/ledger.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=None,
+                            help="Seconds to sleep once caught up (default XP_SNAPSHOT_INTERVAL).")
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Entries folded per transaction (default XP_SNAPSHOT_BATCH_SIZE).")
+        parser.add_argument("--lag", type=float, default=None,
+                            help="Leave entries younger than this many seconds (default XP_SNAPSHOT_LAG_SECONDS).")
+        parser.add_argument("--once", action="store_true",
+                            help="Fold everything old enough and exit instead of running forever.")
+
+    def handle(self, *args, **options):
+        interval = settings.XP_SNAPSHOT_INTERVAL if options["interval"] is None else options["interval"]
+        batch_size = options["batch_size"] or settings.XP_SNAPSHOT_BATCH_SIZE
+        self.stdout.write("XP snapshotter started.")
+        folded = 0
+        while True:
+            read = snapshot(batch_size=batch_size, lag=options["lag"])
+            folded += read
+            if read < batch_size:
+                if options["once"]:
+                    break
+                time.sleep(interval)
+        self.stdout.write(self.style.SUCCESS(f"Folded {folded} ledger entr{'y' if folded == 1 else 'ies'}."))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.curriculum import CurriculumError, read_curriculum, sync_curriculum
+
+SYMBOLS = {"created": "+", "updated": "~", "deleted": "-", "orphaned": "?"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Make lessons and quiz questions match the curriculum files, with bulk inserts, "
+        "updates and deletes in one transaction. Lessons missing from the files are only "
+        "reported unless --prune is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Curriculum directory (default: settings.CURRICULUM_DIR).")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would change.")
+        parser.add_argument(
+            "--prune", action="store_true",
+            help="Delete lessons of the synced tracks that are missing from the files, "
+                 "unless learners have sessions, completions, feedback or activities of them.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            curriculum = read_curriculum(options["dir"])
+        except (CurriculumError, OSError) as e:
+            raise CommandError(str(e))
+
+        result = sync_curriculum(curriculum, dry_run=options["dry_run"], prune=options["prune"])
+
+        for model, kinds in result.changes.items():
+            for kind, labels in kinds.items():
+                for label in labels:
+                    self.stdout.write(f"{SYMBOLS[kind]} {model[:-1]} {label}")
+        summary = "; ".join(
+            f"{model}: " + ", ".join(f"{len(labels)} {kind}" for kind, labels in kinds.items())
+            for model, kinds in result.changes.items()
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"Dry run, nothing written. {summary}")
+        elif result:
+            self.stdout.write(self.style.SUCCESS(f"Curriculum synced. {summary}"))
+        else:
+            self.stdout.write("Curriculum already up to date.")
+
+        orphaned = result.changes["lessons"]["orphaned"]
+        if orphaned:
+            hint = "" if options["prune"] else " Use --prune to delete the ones nobody has used."
+            self.stdout.write(self.style.WARNING(
+                f"{len(orphaned)} lesson(s) missing from the files were kept.{hint}"
+            ))
@@ -0,0 +1,67 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from accounts.grading import grade, lesson_cases
+from accounts.models import Lesson
+
+
+def _grade_solution(job):
+    # Runs in a pool process; only plain data crosses the process boundary
+    lesson_id, solution, cases = job
+    try:
+        return lesson_id, grade(solution, cases), None
+    except Exception as e:
+        return lesson_id, None, str(e)
+
+
+class Command(BaseCommand):
+    help = "Check that every lesson's solution produces its expected output."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Number of grading processes.")
+        parser.add_argument("--lesson", type=int, action="append", dest="lessons",
+                            help="Only validate this lesson id (can be repeated).")
+
+    def handle(self, *args, **options):
+        lessons = Lesson.objects.exclude(solution__isnull=True).exclude(solution="").prefetch_related("test_cases")
+        if options["lessons"]:
+            lessons = lessons.filter(id__in=options["lessons"])
+
+        titles, jobs = {}, []
+        for lesson in lessons:
+            cases = lesson_cases(lesson)
+            if not cases:
+                continue
+            titles[lesson.id] = str(lesson)
+            jobs.append((lesson.id, lesson.solution, cases))
+
+        if not jobs:
+            self.stdout.write("No lessons with both a solution and an expected output.")
+            return
+
+        # Pool processes are forked from this one and must not share its DB connection
+        connections.close_all()
+
+        failures = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            for lesson_id, result, error in executor.map(_grade_solution, jobs):
+                if error:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(f"ERROR {titles[lesson_id]}: {error}"))
+                elif result["passed"]:
+                    self.stdout.write(self.style.SUCCESS(f"PASS  {titles[lesson_id]}"))
+                else:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(
+                        f"FAIL  {titles[lesson_id]} ({result['passed_count']}/{result['total']} cases)"
+                    ))
+                    for case in result["cases"]:
+                        if not case["passed"]:
+                            reason = "timed out" if case["timed_out"] else repr(case["output"][:200])
+                            self.stdout.write(f"      {case['name']}: {reason}")
+
+        if failures:
+            raise CommandError(f"{failures} of {len(jobs)} lesson(s) failed validation.")
+        self.stdout.write(self.style.SUCCESS(f"All {len(jobs)} lesson(s) passed."))
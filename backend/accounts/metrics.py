@@ -0,0 +1,60 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """
+    Process-local counters, timings and gauges.
+
+    Each gunicorn worker keeps its own registry; the numbers exposed by
+    MetricsView are for the worker that served the request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._timings = {}
+        self._gauges = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name, value):
+        """Record one sample of a duration (seconds) or size."""
+        with self._lock:
+            timing = self._timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += value
+            timing["max"] = max(timing["max"], value)
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {
+                name: dict(timing, avg=timing["total"] / timing["count"] if timing["count"] else 0.0)
+                for name, timing in self._timings.items()
+            }
+            gauges = dict(self._gauges)
+
+        # Every "<prefix>.hits" / "<prefix>.misses" pair also gets a hit rate
+        for name in list(counters):
+            if name.endswith(".hits"):
+                prefix = name[:-len(".hits")]
+                total = counters[name] + counters.get(prefix + ".misses", 0)
+                gauges[prefix + ".hit_rate"] = counters[name] / total if total else 0.0
+
+        return {"counters": counters, "timings": timings, "gauges": gauges}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+            self._gauges.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:11
+
+import hashlib
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# accounts.grading.output_hash as of this migration, frozen so later changes
+# to the grader cannot change what this migration writes
+FLOAT_RE = re.compile(r"[-+]?(?:\d+\.\d*|\.\d+|\d+(?=[eE]))(?:[eE][-+]?\d+)?")
+FLOAT_DECIMALS = 6
+
+
+def _canonical_float(match):
+    value = round(float(match.group()), FLOAT_DECIMALS)
+    return repr(value + 0.0)
+
+
+def output_hash(text):
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+    lines = [" ".join(line.split()) for line in text.split("\n")]
+    normalized = FLOAT_RE.sub(_canonical_float, "\n".join(lines).strip("\n"))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def hash_expected_outputs(apps, schema_editor):
+    Lesson = apps.get_model('accounts', 'Lesson')
+    lessons = list(Lesson.objects.exclude(expected_output__isnull=True).exclude(expected_output=''))
+    for lesson in lessons:
+        lesson.expected_output_hash = output_hash(lesson.expected_output)
+    Lesson.objects.bulk_update(lessons, ['expected_output_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_coderunjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='expected_output_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='LessonTestCase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('stdin', models.TextField(blank=True, default='', help_text='Fed to the program as standard input')),
+                ('expected_output', models.TextField()),
+                ('expected_output_hash', models.CharField(blank=True, default='', editable=False, max_length=64)),
+                ('time_limit', models.FloatField(blank=True, help_text='Seconds, defaults to GRADER_CASE_TIME_LIMIT', null=True)),
+                ('order', models.PositiveIntegerField(default=1)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_cases', to='accounts.lesson')),
+            ],
+            options={
+                'ordering': ['order', 'id'],
+            },
+        ),
+        migrations.RunPython(hash_expected_outputs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_lessontestcase_expected_output_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LessonRunStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('runs', models.PositiveIntegerField(default=0)),
+                ('timeouts', models.PositiveIntegerField(default=0)),
+                ('truncated', models.PositiveIntegerField(default=0)),
+                ('cpu_ms_total', models.BigIntegerField(default=0)),
+                ('wall_ms_total', models.BigIntegerField(default=0)),
+                ('output_bytes_total', models.BigIntegerField(default=0)),
+                ('max_rss_kb_peak', models.PositiveIntegerField(default=0)),
+                ('histograms', models.JSONField(default=dict)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='run_stats', to='accounts.lesson')),
+            ],
+            options={
+                'unique_together': {('lesson', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_lessonrunstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lessonfeedback',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_lessonfeedback_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['learning_goal', 'difficulty_level', 'order'], name='lesson_track_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizquestion',
+            index=models.Index(fields=['lesson', 'order', 'id'], name='quiz_lesson_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studysession',
+            index=models.Index(fields=['user', 'date', 'start_time'], name='session_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='activity_user_created_idx'),
+        ),
+    ]
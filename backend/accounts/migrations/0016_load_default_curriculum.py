@@ -0,0 +1,84 @@
+from django.db import migrations
+
+# The curriculum as it was when this migration was written. Later changes
+# reach the database through ``manage.py sync_curriculum``, not through here.
+CURRICULUM = {
+    "School": {
+        "Beginner": [
+            {
+                "title": "Introduction to Python",
+                "description": "Learn Python basics.",
+                "step1_content": "<h3>What is Python?</h3><p>Python is a beginner-friendly programming language.</p>",
+                "step2_content": "<h3>Basic Syntax</h3><p>Let's write a simple Python program.</p>",
+                "step3_challenge": "<h3>Mini Challenge</h3><p>Write a Python program that prints 'Hello, World!'.</p>",
+                "order": 1,
+                "code_snippet": "print('Hello, Python!')",
+            },
+            {
+                "title": "Variables & Data Types",
+                "description": "Learn about variables and data types.",
+                "step1_content": "<h3>Understanding Variables</h3><p>Variables store data in Python.</p>",
+                "step2_content": "<h3>Working with Variables</h3><p>Define a variable and assign a value.</p>",
+                "step3_challenge": "<h3>Mini Challenge</h3><p>Declare a variable 'name' and assign your name to it.</p>",
+                "order": 2,
+                "code_snippet": "age = 25\nname = 'John'",
+            },
+            {"title": "Loops & Conditionals", "description": "Control program flow with loops and conditionals.", "order": 3},
+        ],
+        "Intermediate": [
+            {"title": "Functions & Loops", "description": "Master functions and loops.", "order": 1},
+            {"title": "Object-Oriented Programming", "description": "Understand classes and objects.", "order": 2},
+        ],
+        "Advanced": [
+            {"title": "Data Structures & Algorithms", "description": "Deep dive into CS fundamentals.", "order": 1},
+            {"title": "Advanced Python Concepts", "description": "Explore metaprogramming and decorators.", "order": 2},
+        ],
+    },
+    "Portfolio": {
+        "Beginner": [
+            {"title": "Building Your First Project", "description": "Start your portfolio with a simple project.", "order": 1},
+        ],
+        "Intermediate": [
+            {"title": "APIs & Web Scraping", "description": "Learn how to interact with APIs and scrape data.", "order": 1},
+        ],
+        "Advanced": [
+            {"title": "Full-Stack Web Development", "description": "Build a full-stack web application.", "order": 1},
+        ],
+    },
+    "Career Growth": {
+        "Beginner": [
+            {"title": "Introduction to Data Structures", "description": "Learn the basics of stacks and queues.", "order": 1},
+        ],
+        "Intermediate": [
+            {"title": "Interview Preparation", "description": "Solve common coding interview problems.", "order": 1},
+        ],
+        "Advanced": [
+            {"title": "System Design", "description": "Learn how to design scalable applications.", "order": 1},
+        ],
+    },
+}
+
+
+def load(apps, schema_editor):
+    """Insert the lessons above that do not exist yet; existing ones are left alone."""
+    Lesson = apps.get_model("accounts", "Lesson")
+    Lesson.objects.bulk_create(
+        [
+            Lesson(learning_goal=goal, difficulty_level=level, **lesson)
+            for goal, levels in CURRICULUM.items()
+            for level, lessons in levels.items()
+            for lesson in lessons
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(load, migrations.RunPython.noop),
+    ]
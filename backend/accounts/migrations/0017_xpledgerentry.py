@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_load_default_curriculum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprogress',
+            name='xp_ledger_id',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.CreateModel(
+            name='XpLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('source', models.PositiveSmallIntegerField(choices=[(0, 'Other'), (1, 'Signup'), (2, 'Lesson completed'), (3, 'Streak milestone'), (4, 'Lesson quiz'), (5, 'General quiz'), (6, 'Opening balance')])),
+                ('source_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('amount', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='xp_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='xp_ledger_user_idx')],
+            },
+        ),
+    ]
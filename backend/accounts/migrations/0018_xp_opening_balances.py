@@ -0,0 +1,36 @@
+from django.db import migrations
+
+OPENING_BALANCE = 6  # XpLedgerEntry.SOURCE_OPENING_BALANCE
+CHUNK_SIZE = 2000
+
+
+def open_ledger(apps, schema_editor):
+    """Turn every existing XP total into the first ledger entry of its user."""
+    UserProgress = apps.get_model("accounts", "UserProgress")
+    XpLedgerEntry = apps.get_model("accounts", "XpLedgerEntry")
+
+    progress = list(UserProgress.objects.exclude(xp=0).order_by("pk").only("pk", "user_id", "xp"))
+    for start in range(0, len(progress), CHUNK_SIZE):
+        chunk = progress[start:start + CHUNK_SIZE]
+        entries = XpLedgerEntry.objects.bulk_create(
+            [XpLedgerEntry(user_id=p.user_id, source=OPENING_BALANCE, amount=p.xp) for p in chunk]
+        )
+        for p, entry in zip(chunk, entries):
+            p.xp_ledger_id = entry.pk
+        UserProgress.objects.bulk_update(chunk, ["xp_ledger_id"])
+
+
+def close_ledger(apps, schema_editor):
+    apps.get_model("accounts", "XpLedgerEntry").objects.filter(source=OPENING_BALANCE).delete()
+    apps.get_model("accounts", "UserProgress").objects.update(xp_ledger_id=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_xpledgerentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(open_ledger, close_ledger),
+    ]
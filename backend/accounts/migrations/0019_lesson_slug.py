@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0018_xp_opening_balances'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -1,10 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.conf import settings
 from django.db.models import CASCADE
-from datetime import timedelta, date
+from .leveling import level_for_xp, level_progress
+import uuid
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)  # Make email required and unique
@@ -50,12 +49,21 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save receivers tell which fields a save actually changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
 
 class Lesson(models.Model):
     title = models.CharField(max_length=255)
+    # Stable key of the lessons in curriculum/*.json, so titles can change
+    slug = models.SlugField(max_length=100, unique=True, null=True, blank=True)
     description = models.TextField()
     step1_content = models.TextField(blank=True, null=True)
     step2_content = models.TextField(blank=True, null=True)
@@ -66,63 +74,48 @@ class Lesson(models.Model):
     code_snippet = models.TextField(blank=True, null=True)
     expected_output = models.TextField(blank=True, null=True)
     solution = models.TextField(blank=True, null=True)  # New field to store the answer
+    expected_output_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
 
     class Meta:
         ordering = ["order"]
         unique_together = ("title", "learning_goal", "difficulty_level")
+        indexes = [
+            # Lesson lists and the dashboard filter by track and sort by order
+            models.Index(fields=["learning_goal", "difficulty_level", "order"], name="lesson_track_order_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.learning_goal} - {self.difficulty_level})"
 
-    @classmethod
-    def create_default_lessons(cls, user):
-        if not user or not user.learning_goal or not user.difficulty_level:
-            return
-
-        default_lessons = {
-            "School": {
-                "Beginner": [
-                    {
-                        "title": "Introduction to Python",
-                        "description": "Learn Python basics.",
-                        "step1_content": "<h3>What is Python?</h3><p>Python is a beginner-friendly programming language.</p>",
-                        "step2_content": "<h3>Basic Syntax</h3><p>Let's write a simple Python program.</p>",
-                        "step3_challenge": "<h3>Mini Challenge</h3><p>Write a Python program that prints 'Hello, World!'.</p>",
-                        "order": 1,
-                        "code_snippet": "print('Hello, Python!')",
-                    },
-                    {
-                        "title": "Variables & Data Types",
-                        "description": "Learn about variables and data types.",
-                        "step1_content": "<h3>Understanding Variables</h3><p>Variables store data in Python.</p>",
-                        "step2_content": "<h3>Working with Variables</h3><p>Define a variable and assign a value.</p>",
-                        "step3_challenge": "<h3>Mini Challenge</h3><p>Declare a variable 'name' and assign your name to it.</p>",
-                        "order": 2,
-                        "code_snippet": "age = 25\nname = 'John'",
-                    },
-                ],
-            },
-        }
-
-        lessons = default_lessons.get(user.learning_goal, {}).get(user.difficulty_level, [])
-
-        if not lessons:
-            return
-
-        for lesson_data in lessons:
-            cls.objects.get_or_create(
-                title=lesson_data["title"],
-                learning_goal=user.learning_goal,
-                difficulty_level=user.difficulty_level,
-                defaults={
-                    "description": lesson_data["description"],
-                    "step1_content": lesson_data["step1_content"],
-                    "step2_content": lesson_data["step2_content"],
-                    "step3_challenge": lesson_data["step3_challenge"],
-                    "order": lesson_data["order"],
-                    "code_snippet": lesson_data["code_snippet"],
-                },
-            )
+    def save(self, *args, **kwargs):
+        from .grading import output_hash
+        self.expected_output_hash = output_hash(self.expected_output) if self.expected_output else ""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "expected_output" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "expected_output_hash"}
+        super().save(*args, **kwargs)
+
+
+class LessonTestCase(models.Model):
+    """One input/expected-output pair used by the autograder (accounts/grading.py)."""
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name="test_cases")
+    name = models.CharField(max_length=100, blank=True)
+    stdin = models.TextField(blank=True, default="", help_text="Fed to the program as standard input")
+    expected_output = models.TextField()
+    expected_output_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
+    time_limit = models.FloatField(null=True, blank=True, help_text="Seconds, defaults to GRADER_CASE_TIME_LIMIT")
+    order = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        ordering = ["order", "id"]
+
+    def __str__(self):
+        return f"{self.lesson.title} – {self.name or f'case {self.order}'}"
+
+    def save(self, *args, **kwargs):
+        from .grading import output_hash
+        self.expected_output_hash = output_hash(self.expected_output)
+        super().save(*args, **kwargs)
 
 
 class UserProgress(models.Model):
@@ -133,71 +126,28 @@ class UserProgress(models.Model):
     completed_lessons = models.ManyToManyField(Lesson, blank=True)
     xp = models.IntegerField(default=0)
     level = models.IntegerField(default=1)
+    # xp and level are snapshots of the XP ledger up to this entry (see accounts/ledger.py)
+    xp_ledger_id = models.BigIntegerField(default=0, db_index=True)
 
     def __str__(self):
         return f"Progress for {self.user.username}"
 
     def calculate_level(self):
-        """Calculate level based on XP using a simple formula"""
-        if self.xp < 50:
-            return 1
-        elif self.xp < 150:
-            return 2
-        elif self.xp < 300:
-            return 3
-        elif self.xp < 500:
-            return 4
-        elif self.xp < 750:
-            return 5
-        elif self.xp < 1050:
-            return 6
-        elif self.xp < 1400:
-            return 7
-        elif self.xp < 1800:
-            return 8
-        elif self.xp < 2250:
-            return 9
-        else:
-            # For levels 10+, each level requires 500 more XP
-            return 10 + ((self.xp - 2250) // 500)
+        """Level earned by the current XP (see accounts/leveling.py)"""
+        return level_for_xp(self.xp)
 
     def get_level_progress(self):
         """Get XP progress within current level"""
-        level_thresholds = [0, 50, 150, 300, 500, 750, 1050, 1400, 1800, 2250]
-        
-        current_level = self.calculate_level()
-        
-        if current_level <= 9:
-            level_start_xp = level_thresholds[current_level - 1]
-            level_end_xp = level_thresholds[current_level]
-        else:
-            # For levels 10+
-            level_start_xp = 2250 + ((current_level - 10) * 500)
-            level_end_xp = 2250 + ((current_level - 9) * 500)
-        
-        xp_in_level = self.xp - level_start_xp
-        xp_needed = level_end_xp - level_start_xp
-        
-        return {
-            'xp_in_level': xp_in_level,
-            'xp_needed': xp_needed,
-            'next_level_xp': level_end_xp
-        }
+        return level_progress(self.xp)
 
-    def mark_lesson_completed(self, lesson):
-        if lesson not in self.completed_lessons.all():
-            self.completed_lessons.add(lesson)
-            self.lessons_completed += 1
-
-            today = date.today()
-            if self.last_active == today - timedelta(days=1):
-                self.streak += 1
-            elif self.last_active != today:
-                self.streak = 1
-
-            self.last_active = today
-            self.save()
+    def _refresh_from(self, progress):
+        for field in ("xp", "level", "xp_ledger_id", "streak", "lessons_completed", "last_active"):
+            setattr(self, field, getattr(progress, field))
+        self.live_xp = getattr(progress, "live_xp", None)  # see accounts/ledger.py
 
+    def mark_lesson_completed(self, lesson):
+        from .progress import complete_lesson
+        self._refresh_from(complete_lesson(self.user, lesson, xp=0, streak_bonus=False).progress)
         return self.unlock_next_lesson(lesson)
 
     def unlock_next_lesson(self, lesson):
@@ -216,38 +166,11 @@ class UserProgress(models.Model):
         )
 
     def add_xp(self, amount, create_activity=True):
-        """Add XP and handle level-ups with activity tracking"""
-        old_level = self.level
-        self.xp += amount
-        new_level = self.calculate_level()
-        
-        # Check for level up
-        if new_level > old_level:
-            self.level = new_level
-            # Create level up activity
-            UserActivity.create_activity(
-                user=self.user,
-                activity_type='level_up',
-                title=f"Level Up! 🎉",
-                description=f"Reached Level {new_level}",
-                xp_earned=0,
-                level_achieved=new_level
-            )
-        
-        self.save()
-        
-        # Only create XP earned activity if explicitly requested
-        # This prevents duplicates when XP is already tracked in main activities
-        if create_activity and amount >= 10 and amount > 0:
-            UserActivity.create_activity(
-                user=self.user,
-                activity_type='xp_earned',
-                title=f"Earned {amount} XP",
-                description=f"Total XP: {self.xp}",
-                xp_earned=amount
-            )
-        
-        return new_level > old_level  # Return True if leveled up
+        """Add XP through the ledger (see accounts/progress.py); self.live_xp holds the new total"""
+        from .progress import award_xp
+        result = award_xp(self.user, amount, create_activity=create_activity)
+        self._refresh_from(result.progress)
+        return result.leveled_up  # Return True if leveled up
 
 class StudySession(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=CASCADE)
@@ -257,6 +180,12 @@ class StudySession(models.Model):
     end_time = models.TimeField()
     learning_goal = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # The dashboard shows a date window of the user's sessions
+            models.Index(fields=["user", "date", "start_time"], name="session_user_date_idx"),
+        ]
+
     def __str__(self):
         return f"Study Session for {self.user.username} on {self.lesson.title}"
 
@@ -264,16 +193,6 @@ class StudySession(models.Model):
         super().delete(*args, **kwargs)
 
 
-@receiver(post_save, sender=CustomUser)
-def assign_lessons_on_signup(sender, instance, created, **kwargs):
-    if created:
-        UserProgress.objects.get_or_create(user=instance)
-
-    if instance.learning_goal and instance.difficulty_level:
-        Lesson.create_default_lessons(instance)
-
-
-
 class LessonFeedback(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, null=True, blank=True)
@@ -289,6 +208,8 @@ class LessonFeedback(models.Model):
     expected_output = models.TextField(blank=True, null=True)
     actual_output = models.TextField(blank=True, null=True)
     feedback = models.TextField(blank=True, null=True)
+    # feedback_cache.fingerprint() of the code; answers are shared between equal fingerprints
+    fingerprint = models.CharField(max_length=64, blank=True, null=True, db_index=True)
 
     def __str__(self):
         if self.lesson:
@@ -317,6 +238,9 @@ class QuizQuestion(models.Model):
     class Meta:
         ordering = ['order']  # <-- Default ordering by this field
         unique_together = ("lesson", "question")
+        indexes = [
+            models.Index(fields=["lesson", "order", "id"], name="quiz_lesson_order_idx"),
+        ]
 
     def __str__(self):
         if self.lesson:
@@ -340,6 +264,42 @@ class QuizAttempt(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.quiz_type} - Best: {self.best_score}/{self.total_questions}"
 
+class XpLedgerEntry(models.Model):
+    """One XP award or correction. Rows are only ever inserted (see accounts/ledger.py)."""
+    SOURCE_OTHER = 0
+    SOURCE_SIGNUP = 1
+    SOURCE_LESSON = 2
+    SOURCE_STREAK = 3
+    SOURCE_LESSON_QUIZ = 4
+    SOURCE_GENERAL_QUIZ = 5
+    SOURCE_OPENING_BALANCE = 6
+    SOURCE_CHOICES = [
+        (SOURCE_OTHER, 'Other'),
+        (SOURCE_SIGNUP, 'Signup'),
+        (SOURCE_LESSON, 'Lesson completed'),
+        (SOURCE_STREAK, 'Streak milestone'),
+        (SOURCE_LESSON_QUIZ, 'Lesson quiz'),
+        (SOURCE_GENERAL_QUIZ, 'General quiz'),
+        (SOURCE_OPENING_BALANCE, 'Opening balance'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=CASCADE, related_name='xp_entries', db_index=False)
+    source = models.PositiveSmallIntegerField(choices=SOURCE_CHOICES)
+    source_id = models.PositiveIntegerField(null=True, blank=True)  # lesson, quiz attempt, ... depending on source
+    amount = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A user's entries past their snapshot, summed on every progress read
+            models.Index(fields=["user", "id"], name="xp_ledger_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.amount:+d} XP for {self.user_id} ({self.get_source_display()})"
+
+
 class UserActivity(models.Model):
     ACTIVITY_TYPES = [
         ('lesson_completed', 'Lesson Completed'),
@@ -366,6 +326,10 @@ class UserActivity(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Activity pages (keyset on created_at, id) and the dashboard's recent activities
+            models.Index(fields=["user", "-created_at", "-id"], name="activity_user_created_idx"),
+        ]
         
     def __str__(self):
         return f"{self.user.username} - {self.title}"
@@ -379,4 +343,70 @@ class UserActivity(models.Model):
             title=title,
             description=description,
             **kwargs
-        )
\ No newline at end of file
+        )
+
+
+class CodeRunJob(models.Model):
+    """A code submission queued for the executor tier (see accounts/jobs.py)."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_TIMEOUT = 'timeout'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_TIMEOUT, 'Timed Out'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    FINISHED_STATUSES = (STATUS_DONE, STATUS_TIMEOUT, STATUS_FAILED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='code_jobs')
+    lesson = models.ForeignKey(Lesson, on_delete=models.SET_NULL, null=True, blank=True)
+    code = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stdout = models.TextField(blank=True, default='')
+    stderr = models.TextField(blank=True, default='')
+    returncode = models.IntegerField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.status} - {self.created_at}"
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+
+class LessonRunStats(models.Model):
+    """
+    Daily resource usage of code runs per lesson (see accounts/usage.py).
+    Totals are exact; the histograms hold log-scale bucket counts so
+    percentiles can be read without keeping every run.
+    """
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='run_stats')
+    day = models.DateField()
+    runs = models.PositiveIntegerField(default=0)
+    timeouts = models.PositiveIntegerField(default=0)
+    truncated = models.PositiveIntegerField(default=0)
+    cpu_ms_total = models.BigIntegerField(default=0)
+    wall_ms_total = models.BigIntegerField(default=0)
+    output_bytes_total = models.BigIntegerField(default=0)
+    max_rss_kb_peak = models.PositiveIntegerField(default=0)
+    histograms = models.JSONField(default=dict)  # {metric: {bucket: count}}
+
+    class Meta:
+        unique_together = ('lesson', 'day')
+
+    def __str__(self):
+        return f"{self.lesson.title} - {self.day} - {self.runs} runs"
+
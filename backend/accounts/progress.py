@@ -0,0 +1,108 @@
+"""
+Race-free changes to a user's UserProgress.
+
+Views used to load the progress row, change xp/streak/lessons_completed in
+Python and save() the whole row, several times per request. Two tabs
+submitting at once could overwrite each other's XP. XP is now only ever
+inserted into the ledger (accounts/ledger.py), which the snapshotter folds
+into xp and level later, so concurrent awards cannot collide at all.
+Completing a lesson also depends on the current streak and completed set, so
+it locks the row with select_for_update() before deciding anything and
+writes streak and counters in one UPDATE.
+
+update() sends no post_save, so the dashboard cache is invalidated here.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import F
+
+from . import dashboard_cache, ledger
+from .leveling import level_for_xp
+from .models import UserActivity, UserProgress, XpLedgerEntry
+
+LESSON_XP = 25
+STREAK_MILESTONE_EVERY = 5
+STREAK_MILESTONE_XP_PER_DAY = 10
+
+XpResult = namedtuple("XpResult", "progress leveled_up")
+LessonResult = namedtuple("LessonResult", "progress leveled_up newly_completed streak_bonus")
+
+
+def _invalidate_dashboard(user_id):
+    transaction.on_commit(lambda: dashboard_cache.invalidate(user_id))
+
+
+def _leveled_up(progress, amount):
+    """Whether the last ``amount`` XP crossed a level; the activity comes from the snapshotter."""
+    return level_for_xp(progress.live_xp) > level_for_xp(progress.live_xp - amount)
+
+
+def award_xp(user, amount, create_activity=True, source=XpLedgerEntry.SOURCE_OTHER, source_id=None):
+    """
+    Add ``amount`` XP to ``user`` as a ledger entry. Returns the progress, with
+    ``live_xp`` set, and whether it leveled up.
+    """
+    with transaction.atomic():
+        ledger.record(user, [(source, source_id, amount)])
+        progress = ledger.with_live_xp(UserProgress.objects.filter(user=user)).first()
+        if progress is None:
+            progress, _ = UserProgress.objects.get_or_create(user=user)
+            ledger.live_xp(progress)
+        today = date.today()
+        if progress.last_active != today:
+            UserProgress.objects.filter(pk=progress.pk).update(last_active=today)
+            progress.last_active = today
+            _invalidate_dashboard(user.pk)
+
+        if create_activity and amount >= 10:
+            UserActivity.create_activity(
+                user=user,
+                activity_type='xp_earned',
+                title=f"Earned {amount} XP",
+                description=f"Total XP: {progress.live_xp}",
+                xp_earned=amount,
+            )
+    return XpResult(progress, _leveled_up(progress, amount))
+
+
+def complete_lesson(user, lesson, xp=LESSON_XP, streak_bonus=True):
+    """
+    Mark ``lesson`` completed and extend the streak in one UPDATE, and record
+    ``xp`` (plus the streak milestone bonus unless ``streak_bonus`` is off) in
+    the ledger. A lesson that was already completed changes nothing and
+    returns ``newly_completed=False``.
+    """
+    with transaction.atomic():
+        progress, _ = UserProgress.objects.select_for_update().get_or_create(user=user)
+        if progress.completed_lessons.filter(pk=lesson.pk).exists():
+            return LessonResult(progress, False, False, 0)
+        progress.completed_lessons.add(lesson)
+
+        today = date.today()
+        streak = progress.streak
+        if progress.last_active == today - timedelta(days=1):
+            streak += 1
+        elif progress.last_active != today:
+            streak = 1
+        bonus = 0
+        if streak_bonus and streak > progress.streak and streak % STREAK_MILESTONE_EVERY == 0:
+            bonus = streak * STREAK_MILESTONE_XP_PER_DAY
+
+        UserProgress.objects.filter(pk=progress.pk).update(
+            lessons_completed=F("lessons_completed") + 1,
+            streak=streak,
+            last_active=today,
+        )
+        # The row is locked, so these are exactly the values just written
+        progress.lessons_completed += 1
+        progress.streak = streak
+        progress.last_active = today
+        ledger.record(user, [
+            (XpLedgerEntry.SOURCE_LESSON, lesson.pk, xp),
+            (XpLedgerEntry.SOURCE_STREAK, lesson.pk, bonus),
+        ])
+        ledger.live_xp(progress)
+        _invalidate_dashboard(user.pk)
+    return LessonResult(progress, _leveled_up(progress, xp + bonus), True, bonus)
@@ -0,0 +1,108 @@
+"""
+Content-addressed cache of sandbox results.
+
+Most run-code/ traffic is the lesson's own snippet or a known solution, whose
+output never changes. Results are keyed by a hash of the normalized source and
+the interpreter version. Only programs that a static check considers
+deterministic, and whose output shows no object address, are cached.
+"""
+import ast
+import hashlib
+import re
+import sys
+
+from django.conf import settings
+
+from .caching import LRUCache
+
+# Anything that reads the clock, randomness, the outside world or the user
+NONDETERMINISTIC_MODULES = {
+    "random", "secrets", "uuid", "time", "datetime", "calendar", "zoneinfo",
+    "os", "sys", "io", "pathlib", "shutil", "glob", "tempfile", "fileinput",
+    "socket", "ssl", "select", "selectors", "http", "urllib", "ftplib", "smtplib",
+    "requests", "subprocess", "threading", "multiprocessing", "concurrent",
+    "asyncio", "signal", "sqlite3", "pickle", "shelve", "getpass", "platform",
+    "resource", "gc", "inspect", "ctypes", "importlib", "builtins",
+}
+NONDETERMINISTIC_BUILTINS = {
+    "input", "open", "exec", "eval", "compile", "__import__", "breakpoint", "id", "hash",
+    # Reach any of the above by name
+    "getattr", "setattr", "delattr", "globals", "locals", "vars",
+    # Iteration order of a set of str depends on the per-process hash seed
+    "set", "frozenset",
+}
+# Default reprs, e.g. <__main__.Point object at 0x7f...>
+ADDRESS_RE = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def _dunder(name):
+    return name.startswith("__") and name.endswith("__")
+
+
+def normalize_source(code):
+    """
+    Line endings and trailing whitespace at the end of the file do not change
+    what a program prints. Whitespace inside lines is kept, it can sit in a
+    string literal.
+    """
+    return code.replace("\r\n", "\n").replace("\r", "\n").rstrip()
+
+
+def cache_key(code):
+    digest = hashlib.sha256()
+    digest.update(sys.version.encode())
+    digest.update(b"\0")
+    digest.update(normalize_source(code).encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def is_deterministic(code):
+    """
+    Static check for the usual sources of nondeterminism: the modules and
+    builtins above, dunder names and attributes (``__builtins__``,
+    ``().__class__...``) and set displays. It is a heuristic, not a proof;
+    ``is_cacheable`` also looks at the output.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return False
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                return False
+            modules = [node.module or ""]
+        elif isinstance(node, ast.Name) and (
+            node.id in NONDETERMINISTIC_BUILTINS or (_dunder(node.id) and node.id != "__name__")
+        ):
+            return False
+        elif isinstance(node, ast.Attribute) and _dunder(node.attr):
+            return False
+        elif isinstance(node, (ast.Set, ast.SetComp)):
+            return False
+        else:
+            continue
+
+        if any(module.split(".")[0] in NONDETERMINISTIC_MODULES for module in modules):
+            return False
+
+    return True
+
+
+def is_cacheable(code, result):
+    """Whether ``result`` of running ``code`` may be served to the next run."""
+    return is_deterministic(code) and not ADDRESS_RE.search(result["stdout"] + result["stderr"])
+
+
+def _result_size(result):
+    return len(result["stdout"]) + len(result["stderr"])
+
+
+result_cache = LRUCache(
+    max_entries=settings.CODE_RUNNER_RESULT_CACHE_ENTRIES,
+    max_bytes=settings.CODE_RUNNER_RESULT_CACHE_BYTES,
+    sizeof=_result_size,
+)
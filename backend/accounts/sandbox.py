@@ -0,0 +1,463 @@
+"""
+Execution of student code for RunCodeView.
+
+Snippets run in a pool of warm interpreter processes (see sandbox_worker.py)
+instead of a fresh ``python -c`` per request. Every result is a dict with
+``stdout``, ``stderr``, ``returncode``, ``timed_out``, ``truncated`` and
+``cached``.
+"""
+import atexit
+import json
+import os
+import queue
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import metrics
+from .precheck import syntax_error_message
+from .result_cache import cache_key, is_cacheable, result_cache
+from .usage import record_usage
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+# Extra time the pool gives a worker on top of the snippet's own budget
+# before it decides the worker itself is stuck.
+WORKER_GRACE_SECONDS = 2
+
+
+class PoolSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class WorkerCrashed(Exception):
+    """Raised when a worker dies or stops answering mid-request."""
+
+
+def _sandbox_env():
+    # Never hand the web process environment (SECRET_KEY, DATABASE_URL, ...) to student code
+    return {
+        "PATH": os.environ.get("PATH", ""),
+        "LANG": "C.UTF-8",
+        "PYTHONIOENCODING": "utf-8",
+    }
+
+
+class _Worker:
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=tempfile.gettempdir(),
+            env=_sandbox_env(),
+        )
+        self.runs = 0
+        # Process group of the snippet the worker is running right now, if any
+        self.child_pgid = None
+        self._buffer = b""
+        metrics.incr("code_runner.pool.spawned")
+
+    def _send(self, payload):
+        self.runs += 1
+        try:
+            self.process.stdin.write(json.dumps(payload).encode("utf-8") + b"\n")
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise WorkerCrashed(str(e))
+
+    def _read_line(self, deadline):
+        # Reads the pipe directly: a buffered reader could hold lines that
+        # select() no longer reports as readable
+        fd = self.process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            ready = select.select([fd], [], [], remaining)[0] if remaining > 0 else []
+            data = os.read(fd, 65536) if ready else b""
+            if not data:
+                raise WorkerCrashed("Worker did not answer")
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def _read_message(self, deadline):
+        """Next output chunk or result from the worker; child notices are only recorded."""
+        while True:
+            message = self._read_line(deadline)
+            if "child" not in message:
+                return message
+            self.child_pgid = message["child"]
+
+    def request(self, payload, timeout):
+        """Send one request and wait up to ``timeout`` (plus grace) for the answer."""
+        self._send(payload)
+        return self._read_message(time.monotonic() + timeout + WORKER_GRACE_SECONDS)
+
+    def stream(self, payload, timeout):
+        """Like request(), but yields every output chunk before returning the result."""
+        self._send(payload)
+        deadline = time.monotonic() + timeout + WORKER_GRACE_SECONDS
+        while True:
+            message = self._read_message(deadline)
+            if "stream" not in message:
+                return message
+            yield message
+
+    def close(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=1)
+        except Exception:
+            pass
+        # A snippet still running has its own process group and would outlive the worker
+        if self.child_pgid:
+            try:
+                os.killpg(self.child_pgid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            self.child_pgid = None
+
+
+class InterpreterPool:
+    """
+    Fixed-size pool of warm sandbox workers.
+
+    A request that finds an idle worker is a hit. Otherwise it either starts a
+    new worker (while the pool is below ``size``) or waits in a queue of at
+    most ``max_queue`` requests; past that PoolSaturated is raised. Workers are
+    replaced after ``max_runs`` snippets or as soon as they crash.
+    """
+
+    def __init__(self, size, max_queue, max_runs, acquire_timeout):
+        self.size = size
+        self.max_queue = max_queue
+        self.max_runs = max_runs
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._waiting = 0
+        self._closed = False
+
+    def prestart(self):
+        while True:
+            with self._lock:
+                if self._started >= self.size:
+                    return
+                self._started += 1
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        try:
+            return _Worker()
+        except Exception:
+            with self._lock:
+                self._started -= 1
+            raise
+
+    def _acquire(self):
+        try:
+            worker = self._idle.get_nowait()
+            metrics.incr("code_runner.pool.hits")
+            return worker
+        except queue.Empty:
+            metrics.incr("code_runner.pool.misses")
+
+        with self._lock:
+            if self._started < self.size:
+                self._started += 1
+                spawn = True
+            elif self._waiting >= self.max_queue:
+                metrics.incr("code_runner.pool.rejected")
+                raise PoolSaturated("All code runners are busy, please try again shortly.")
+            else:
+                self._waiting += 1
+                spawn = False
+            self._update_gauges()
+
+        if spawn:
+            return self._spawn()
+
+        started = time.monotonic()
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            metrics.incr("code_runner.pool.rejected")
+            raise PoolSaturated("All code runners are busy, please try again shortly.")
+        finally:
+            metrics.observe("code_runner.pool.wait_seconds", time.monotonic() - started)
+            with self._lock:
+                self._waiting -= 1
+                self._update_gauges()
+
+    def _release(self, worker, healthy):
+        if healthy and worker.runs < self.max_runs and not self._closed:
+            self._idle.put(worker)
+            return
+
+        worker.close()
+        metrics.incr("code_runner.pool.recycled" if healthy else "code_runner.pool.crashed")
+        with self._lock:
+            self._started -= 1
+        if not self._closed:
+            # Respawn off the request path so this response is not delayed
+            threading.Thread(target=self.prestart, daemon=True).start()
+
+    def _update_gauges(self):
+        metrics.set_gauge("code_runner.pool.started", self._started)
+        metrics.set_gauge("code_runner.pool.waiting", self._waiting)
+
+    def _request(self, payload, timeout):
+        worker = self._acquire()
+        healthy = False
+        try:
+            result = worker.request(payload, timeout)
+            healthy = True
+            return result
+        finally:
+            self._release(worker, healthy)
+
+    def run(self, code, timeout, max_output=None):
+        return self._request(
+            {"code": code, "timeout": timeout, "max_output": max_output, "limits": resource_limits()}, timeout
+        )
+
+    def stream(self, code, timeout, max_output=None):
+        """Generator of output chunks; returns the final result (StopIteration.value)."""
+        worker = self._acquire()
+        healthy = False
+        try:
+            result = yield from worker.stream(
+                {"code": code, "timeout": timeout, "max_output": max_output, "limits": resource_limits(), "stream": True},
+                timeout,
+            )
+            healthy = True
+            return result
+        finally:
+            # Also reached when the client goes away mid-stream; the worker is
+            # then still busy with the snippet and gets replaced
+            self._release(worker, healthy)
+
+    def run_cases(self, code, cases, max_output=None):
+        total = sum(case["timeout"] for case in cases) + 1
+        return self._request(
+            {"code": code, "cases": cases, "max_output": max_output, "limits": resource_limits()}, total
+        )["cases"]
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def resource_limits():
+    return {
+        "cpu_seconds": settings.CODE_RUNNER_CPU_LIMIT,
+        "memory_bytes": settings.CODE_RUNNER_MEMORY_LIMIT_MB * 1024 * 1024,
+    }
+
+
+def pool_available():
+    return settings.CODE_RUNNER_POOL_ENABLED and hasattr(os, "fork")
+
+
+def get_pool():
+    """Per-process pool, created lazily so gunicorn's master never owns workers."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InterpreterPool(
+                    size=settings.CODE_RUNNER_POOL_SIZE,
+                    max_queue=settings.CODE_RUNNER_POOL_QUEUE_DEPTH,
+                    max_runs=settings.CODE_RUNNER_POOL_MAX_RUNS,
+                    acquire_timeout=settings.CODE_RUNNER_POOL_ACQUIRE_TIMEOUT,
+                )
+                atexit.register(_pool.close)
+                threading.Thread(target=_pool.prestart, daemon=True).start()
+    return _pool
+
+
+def _run_subprocess(code, timeout, stdin="", max_output=None):
+    """
+    Fallback used when the pool is disabled or the platform cannot fork.
+    Output is only cut to ``max_output`` after the fact here, and only wall
+    time and output size are measured.
+    """
+    metrics.incr("code_runner.subprocess_runs")
+    started = time.monotonic()
+    try:
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            input=stdin, capture_output=True, text=True, timeout=timeout,
+            env=_sandbox_env(),
+        )
+    except subprocess.TimeoutExpired:
+        return {
+            "stdout": "", "stderr": "", "returncode": None, "timed_out": True, "truncated": False,
+            "usage": {"cpu_user": None, "cpu_sys": None, "max_rss_kb": None, "output_bytes": 0, "wall": timeout},
+        }
+
+    stdout, stderr = result.stdout, result.stderr
+    truncated = max_output is not None and len(stdout) + len(stderr) > max_output
+    if truncated:
+        stdout = stdout[:max_output]
+        stderr = stderr[:max_output - len(stdout)]
+    return {
+        "stdout": stdout,
+        "stderr": stderr,
+        "returncode": result.returncode,
+        "timed_out": False,
+        "truncated": truncated,
+        "usage": {
+            "cpu_user": None,
+            "cpu_sys": None,
+            "max_rss_kb": None,
+            "output_bytes": len(result.stdout.encode()) + len(result.stderr.encode()),
+            "wall": time.monotonic() - started,
+        },
+    }
+
+
+def _answer_without_running(code, key):
+    """Result from the result cache or the syntax check, or None if the code has to run."""
+    if settings.CODE_RUNNER_RESULT_CACHE_ENABLED:
+        cached = result_cache.get(key)
+        if cached is not None:
+            metrics.incr("code_runner.result_cache.hits")
+            return dict(cached, cached=True, usage=None)
+        metrics.incr("code_runner.result_cache.misses")
+
+    error = syntax_error_message(code, key)
+    if error:
+        metrics.incr("code_runner.syntax_check.spawns_avoided")
+        return {
+            "stdout": "", "stderr": error, "returncode": 1, "timed_out": False, "truncated": False,
+            "cached": False, "usage": None,
+        }
+    return None
+
+
+def _record(code, key, result, started, lesson_id):
+    metrics.observe("code_runner.run_seconds", time.monotonic() - started)
+    if lesson_id is not None:
+        record_usage(lesson_id, result)
+    if result["timed_out"]:
+        metrics.incr("code_runner.timeouts")
+    elif result["truncated"]:
+        metrics.incr("code_runner.truncated")
+    elif settings.CODE_RUNNER_RESULT_CACHE_ENABLED and is_cacheable(code, result):
+        result_cache.set(key, result)
+        metrics.set_gauge("code_runner.result_cache.entries", len(result_cache))
+        metrics.set_gauge("code_runner.result_cache.bytes", result_cache.size_bytes)
+
+
+def run_code(code, timeout=None, lesson_id=None):
+    """
+    Run a snippet and return its result dict. May raise PoolSaturated or WorkerCrashed.
+
+    Deterministic programs are answered from the result cache when possible;
+    such results carry ``cached=True``. Code that does not compile is answered
+    in-process with the interpreter's own error message. Output past
+    settings.CODE_RUNNER_MAX_OUTPUT_BYTES stops the run (``truncated=True``).
+
+    Runs that actually execute report their ``usage`` (CPU, wall time, peak
+    RSS, output bytes); with ``lesson_id`` it is also added to the lesson's
+    run statistics. Cached and pre-checked answers have ``usage=None``.
+    """
+    if timeout is None:
+        timeout = settings.CODE_RUNNER_TIMEOUT
+
+    key = cache_key(code)
+    answer = _answer_without_running(code, key)
+    if answer is not None:
+        return answer
+
+    started = time.monotonic()
+    max_output = settings.CODE_RUNNER_MAX_OUTPUT_BYTES
+    if pool_available():
+        result = get_pool().run(code, timeout, max_output)
+    else:
+        result = _run_subprocess(code, timeout, max_output=max_output)
+
+    _record(code, key, result, started, lesson_id)
+    return dict(result, cached=False)
+
+
+def stream_code(code, timeout=None, lesson_id=None):
+    """
+    Streaming variant of run_code(). Yields ``(stream, text)`` tuples with
+    stream "stdout" or "stderr" as output is produced, then one
+    ``("result", result_dict)`` at the end; the result's stdout/stderr hold
+    the complete (capped) output. Without the pool the output arrives in a
+    single chunk once the run is over.
+    """
+    if timeout is None:
+        timeout = settings.CODE_RUNNER_TIMEOUT
+
+    key = cache_key(code)
+    result = _answer_without_running(code, key)
+    if result is None:
+        started = time.monotonic()
+        max_output = settings.CODE_RUNNER_MAX_OUTPUT_BYTES
+        if pool_available():
+            chunks = get_pool().stream(code, timeout, max_output)
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                yield chunk["stream"], chunk["data"]
+        else:
+            result = _run_subprocess(code, timeout, max_output=max_output)
+            for stream in ("stdout", "stderr"):
+                if result[stream]:
+                    yield stream, result[stream]
+        _record(code, key, result, started, lesson_id)
+        result = dict(result, cached=False)
+    else:
+        for stream in ("stdout", "stderr"):
+            if result[stream]:
+                yield stream, result[stream]
+
+    metrics.incr("code_runner.streamed_runs")
+    yield "result", result
+
+
+def run_cases(code, cases):
+    """
+    Run one submission against several inputs, e.g. a lesson's test cases.
+
+    ``cases`` is a list of ``{"stdin": str, "timeout": seconds}``; the result
+    is one result dict per case, in order. With the pool every case is
+    forked from the same warm worker instead of starting an interpreter
+    per case.
+    """
+    started = time.monotonic()
+    max_output = settings.CODE_RUNNER_MAX_OUTPUT_BYTES
+    if pool_available():
+        results = get_pool().run_cases(code, cases, max_output)
+    else:
+        results = [
+            _run_subprocess(code, case["timeout"], case.get("stdin") or "", max_output)
+            for case in cases
+        ]
+
+    metrics.observe("code_runner.batch_seconds", time.monotonic() - started)
+    return results
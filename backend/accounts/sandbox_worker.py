@@ -0,0 +1,260 @@
+"""
+Warm interpreter process used by accounts.sandbox.InterpreterPool.
+
+The pool starts this file once with ``python -I`` and keeps it alive. Each
+request arrives as one JSON line on stdin and the answer goes back as one JSON
+line on stdout, preceded by ``{"child": pid}`` / ``{"child": null}`` lines
+around every forked child. Every snippet runs in a freshly forked child, so student code
+never sees state left behind by a previous submission, but it also never pays
+for interpreter start-up.
+
+This file only uses the standard library and must not import Django.
+"""
+import builtins
+import codecs
+import json
+import math
+import os
+import resource
+import select
+import signal
+import sys
+import tempfile
+import time
+import traceback
+import types
+
+# Imported once here so forked children get them for free.
+# Do not add modules with per-process state (e.g. random), every child would share it.
+PRELOAD_MODULES = ("math", "json", "re", "string", "collections", "itertools", "functools", "datetime")
+
+for _name in PRELOAD_MODULES:
+    __import__(_name)
+
+
+def _exit_code(exc):
+    """Mirror how ``python -c`` turns SystemExit into a return code."""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+def run_child(code, stdin=None):
+    """Runs inside the forked child. Returns the process exit code."""
+    if stdin:
+        # A file rather than a pipe, so any amount of input is there without a feeder
+        source = tempfile.TemporaryFile()
+        source.write(stdin.encode("utf-8"))
+        source.flush()
+        source.seek(0)
+        os.dup2(source.fileno(), 0)
+        source.close()
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+    sys.stderr = open(2, "w", encoding="utf-8", closefd=False)
+    sys.argv = ["-c"]
+
+    main = types.ModuleType("__main__")
+    main.__builtins__ = builtins
+    sys.modules["__main__"] = main
+
+    returncode = 0
+    try:
+        exec(compile(code, "<string>", "exec"), main.__dict__)
+    except SystemExit as exc:
+        returncode = _exit_code(exc)
+    except BaseException as exc:
+        # Skip this frame so the traceback looks like one from ``python -c``
+        traceback.print_exception(type(exc), exc, exc.__traceback__.tb_next)
+        returncode = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+    return returncode
+
+
+def _collect(pid, out_r, err_r, timeout, max_output=None, on_chunk=None):
+    """
+    Read both pipes until the child closes them, the deadline passes or the
+    child has written more than ``max_output`` bytes. ``on_chunk(stream, text)``
+    is called for every piece of output as it arrives.
+    """
+    chunks = {out_r: [], err_r: []}
+    names = {out_r: "stdout", err_r: "stderr"}
+    decoders = {fd: codecs.getincrementaldecoder("utf-8")("replace") for fd in chunks}
+    open_fds = [out_r, err_r]
+    deadline = time.monotonic() + timeout
+    written = 0
+    timed_out = truncated = False
+
+    while open_fds and not truncated:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        ready, _, _ = select.select(open_fds, [], [], remaining)
+        for fd in ready:
+            data = os.read(fd, 65536)
+            if not data:
+                open_fds.remove(fd)
+                continue
+            if max_output is not None and written + len(data) > max_output:
+                data = data[:max_output - written]
+                truncated = True
+            written += len(data)
+            chunks[fd].append(data)
+            if on_chunk is not None:
+                text = decoders[fd].decode(data)
+                if text:
+                    on_chunk(names[fd], text)
+            if truncated:
+                break
+
+    if timed_out or truncated:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    _, status, rusage = os.wait4(pid, 0)
+    returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "stdout": b"".join(chunks[out_r]).decode("utf-8", "replace"),
+        "stderr": b"".join(chunks[err_r]).decode("utf-8", "replace"),
+        "returncode": returncode,
+        # Hitting RLIMIT_CPU is a timeout too, just measured in CPU time
+        "timed_out": timed_out or returncode == -signal.SIGXCPU,
+        "truncated": truncated,
+        "usage": {
+            "cpu_user": rusage.ru_utime,
+            "cpu_sys": rusage.ru_stime,
+            "max_rss_kb": rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss,
+            "output_bytes": written,
+        },
+    }
+
+
+def _apply_limits(limits):
+    """Kernel-enforced limits for the child: CPU seconds and address space."""
+    if limits.get("cpu_seconds"):
+        cpu = math.ceil(limits["cpu_seconds"])
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    if limits.get("memory_bytes"):
+        resource.setrlimit(resource.RLIMIT_AS, (limits["memory_bytes"], limits["memory_bytes"]))
+
+
+def _fork_and_collect(target, timeout, max_output=None, on_chunk=None, limits=None):
+    """
+    Run ``target()`` in a forked child with fresh stdio pipes, a deadline and
+    the given resource limits. The result includes the child's resource usage.
+    """
+    started = time.monotonic()
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pid = os.fork()
+    if pid == 0:
+        returncode = 1
+        try:
+            # Own process group so a timeout also kills anything the snippet spawned
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(out_w, 1)
+            os.dup2(err_w, 2)
+            for fd in (devnull, out_r, out_w, err_r, err_w):
+                os.close(fd)
+            _apply_limits(limits or {})
+            returncode = target()
+        finally:
+            os._exit(returncode)
+
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        # The child already did it, or has already exited
+        pass
+    # The pool kills this group if it gives up on us while the child runs
+    _send({"child": pid})
+    os.close(out_w)
+    os.close(err_w)
+    try:
+        result = _collect(pid, out_r, err_r, timeout, max_output, on_chunk)
+    finally:
+        os.close(out_r)
+        os.close(err_r)
+    _send({"child": None})
+    result["usage"]["wall"] = time.monotonic() - started
+    return result
+
+
+def _send(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def execute(request):
+    """
+    Run one snippet. With ``"stream": true`` every piece of output is also
+    sent as its own ``{"stream": ..., "data": ...}`` line before the result.
+    """
+    code = request["code"]
+    on_chunk = None
+    if request.get("stream"):
+        on_chunk = lambda stream, data: _send({"stream": stream, "data": data})
+    return _fork_and_collect(
+        lambda: run_child(code),
+        request.get("timeout", 5),
+        max_output=request.get("max_output"),
+        on_chunk=on_chunk,
+        limits=request.get("limits"),
+    )
+
+
+def execute_cases(request):
+    """
+    Grade one submission against several test cases. Each case is forked
+    from this warm worker exactly like a single run, with its own stdin,
+    deadline and output cap. The per-case results are put together here in
+    the worker, where the submission cannot write to them.
+    """
+    code = request["code"]
+    results = []
+    usage = {"cpu_user": 0.0, "cpu_sys": 0.0, "max_rss_kb": 0, "output_bytes": 0, "wall": 0.0}
+    for case in request["cases"]:
+        result = _fork_and_collect(
+            lambda: run_child(code, case.get("stdin")),
+            case["timeout"],
+            max_output=request.get("max_output"),
+            limits=request.get("limits"),
+        )
+        case_usage = result.pop("usage")
+        for name in ("cpu_user", "cpu_sys", "output_bytes", "wall"):
+            usage[name] += case_usage[name]
+        usage["max_rss_kb"] = max(usage["max_rss_kb"], case_usage["max_rss_kb"])
+        results.append(result)
+    return {"cases": results, "usage": usage}
+
+
+def main():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            # The pool closed our stdin, or the web worker died
+            break
+        request = json.loads(line)
+        _send(execute_cases(request) if "cases" in request else execute(request))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,105 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from .models import CustomUser, Lesson, UserProgress
+from rest_framework.authtoken.models import Token
+
+from . import catalog, dashboard_cache
+from .authentication import token_cache
+from .models import CustomUser, Lesson, QuizQuestion, StudySession, UserActivity, UserProgress
+
+@receiver(post_save, sender=CustomUser)
+def create_progress_for_user(sender, instance, created, **kwargs):
+    # Lessons are shared and loaded once (see curriculum.py); nothing to seed per user
+    if created:
+        UserProgress.objects.create(user=instance)
+
+
+# Dashboard cache invalidation. Runs after commit so a dashboard rebuilt in
+# between cannot be cached from the old rows under the new version.
+
+def _invalidate_dashboard(user_id):
+    transaction.on_commit(lambda: dashboard_cache.invalidate(user_id))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_dashboard_for_user(sender, instance, **kwargs):
+    # learning_goal/difficulty_level select the lessons shown
+    _invalidate_dashboard(instance.pk)
+
+
+@receiver(post_save, sender=UserProgress)
+@receiver(post_save, sender=UserActivity)
+@receiver(post_delete, sender=UserActivity)
+@receiver(post_save, sender=StudySession)
+@receiver(post_delete, sender=StudySession)
+def invalidate_dashboard_for_owner(sender, instance, **kwargs):
+    _invalidate_dashboard(instance.user_id)
+
+
+@receiver(m2m_changed, sender=UserProgress.completed_lessons.through)
+def invalidate_dashboard_for_completed_lessons(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        _invalidate_dashboard(instance.user_id)
+    elif pk_set:
+        # Changed from the lesson's side: pk_set holds UserProgress ids
+        for user_id in UserProgress.objects.filter(pk__in=pk_set).values_list("user_id", flat=True):
+            _invalidate_dashboard(user_id)
+    else:
+        # lesson.userprogress_set.clear()
+        transaction.on_commit(dashboard_cache.invalidate_all)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_dashboards_for_lesson(sender, instance, **kwargs):
+    transaction.on_commit(dashboard_cache.invalidate_all)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=QuizQuestion)
+@receiver(post_delete, sender=QuizQuestion)
+def bump_catalog_version(sender, **kwargs):
+    transaction.on_commit(catalog.bump_version)
+
+
+# Cached token authentication. A deleted token must stop working at once;
+# saving a user covers deactivation and changes views read from request.user.
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    key, user_id = instance.key, instance.user_id
+    transaction.on_commit(lambda: token_cache.forget_user(user_id, [key]))
+
+
+def _changed_user_fields(user, update_fields):
+    """Cached fields this save changed, judged against the values the user was loaded with."""
+    # login() saves last_login on every sign-in; cached users may carry an old one
+    names = [f.attname for f in CustomUser._meta.concrete_fields if f.attname != "last_login"]
+    if update_fields is not None:
+        names = [name for name in names if name in update_fields]
+    loaded = getattr(user, "_loaded_values", None)
+    if loaded is None:
+        return names
+    # A deferred field that was never set cannot have changed; one set after loading may have
+    return [
+        name for name in names
+        if name in user.__dict__ and (name not in loaded or loaded[name] != user.__dict__[name])
+    ]
+
 
 @receiver(post_save, sender=CustomUser)
-def create_lessons_for_user(sender, instance, created, **kwargs):
-    if not instance.learning_goal or not instance.difficulty_level:
-        return  
-
-    UserProgress.objects.get_or_create(user=instance)
-
-    default_lessons = {
-        "School": {
-            "Beginner": [
-                {"title": "Introduction to Python", "description": "Learn Python basics.", "order": 1},
-                {"title": "Variables & Data Types", "description": "Understand variables and data types.", "order": 2},
-                {"title": "Loops & Conditionals", "description": "Control program flow with loops and conditionals.", "order": 3}
-            ],
-            "Intermediate": [
-                {"title": "Functions & Loops", "description": "Master functions and loops.", "order": 1},
-                {"title": "Object-Oriented Programming", "description": "Understand classes and objects.", "order": 2},
-            ],
-            "Advanced": [
-                {"title": "Data Structures & Algorithms", "description": "Deep dive into CS fundamentals.", "order": 1},
-                {"title": "Advanced Python Concepts", "description": "Explore metaprogramming and decorators.", "order": 2},
-            ]
-        },
-        "Portfolio": {
-            "Beginner": [
-                {"title": "Building Your First Project", "description": "Start your portfolio with a simple project.", "order": 1},
-            ],
-            "Intermediate": [
-                {"title": "APIs & Web Scraping", "description": "Learn how to interact with APIs and scrape data.", "order": 1},
-            ],
-            "Advanced": [
-                {"title": "Full-Stack Web Development", "description": "Build a full-stack web application.", "order": 1},
-            ]
-        },
-        "Career Growth": {
-            "Beginner": [
-                {"title": "Introduction to Data Structures", "description": "Learn the basics of stacks and queues.", "order": 1},
-            ],
-            "Intermediate": [
-                {"title": "Interview Preparation", "description": "Solve common coding interview problems.", "order": 1},
-            ],
-            "Advanced": [
-                {"title": "System Design", "description": "Learn how to design scalable applications.", "order": 1},
-            ]
-        }
-    }
-
-    lessons_to_create = default_lessons.get(instance.learning_goal, {}).get(instance.difficulty_level, [])
-
-    for lesson_data in lessons_to_create:
-        if not Lesson.objects.filter(
-            title=lesson_data["title"],
-            learning_goal=instance.learning_goal,
-            difficulty_level=instance.difficulty_level
-        ).exists():
-            Lesson.objects.create(
-                title=lesson_data["title"],
-                description=lesson_data["description"],
-                difficulty_level=instance.difficulty_level,
-                learning_goal=instance.learning_goal,
-                order=lesson_data["order"],
-            )
+def forget_tokens_of_saved_user(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Cached token users carry the user's fields, so a save that changes any
+    of them (is_active, password, profile) drops that user's entries.
+    """
+    if created:
+        return
+    changed = _changed_user_fields(instance, update_fields)
+    instance._loaded_values = {name: value for name, value in instance.__dict__.items() if not name.startswith("_")}
+    if changed:
+        user_id = instance.pk
+        transaction.on_commit(lambda: token_cache.forget_user(user_id))
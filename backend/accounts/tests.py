@@ -1,3 +1,1848 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from io import StringIO
 
-# Create your tests here.
+from datetime import time as clock, timedelta
+from unittest import mock, skipUnless
+
+from django.apps import apps as django_apps
+from django.db import connection
+from django.db.models import Sum
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import dashboard_cache, ledger, leveling, sandbox
+from .admission import AdmissionRejected, admission, admit_stream, in_flight
+from .authentication import TokenCache, token_cache
+from .batching import FakeBackend, HuggingFaceBackend, MicroBatcher
+from .catalog import catalog
+from .feedback_cache import feedback_cache, fingerprint
+from .grading import grade, output_hash, outputs_match
+from .hints import analyze
+from .curriculum import CurriculumError, read_curriculum, sync_curriculum
+from .ledger import live_xp, snapshot
+from .leveling import THRESHOLDS, level_for_xp, level_progress, levels_for_xp
+from .metrics import metrics
+from .precheck import syntax_cache
+from .progress import award_xp, complete_lesson
+from .result_cache import is_deterministic, result_cache
+from .models import CodeRunJob, CustomUser, Lesson, LessonFeedback, LessonRunStats, LessonTestCase, QuizAttempt, QuizQuestion, StudySession, UserActivity, UserProgress, XpLedgerEntry
+from .sandbox import InterpreterPool
+from .usage import UsageRecorder, recorder
+from .serializers import UserProgressSerializer
+from .jobs import execute_job
+from .inference import (
+    AsyncInferenceClient, CircuitBreaker, InferenceClient, InferenceError, InferenceUnavailable,
+)
+
+# Statistics of the runs below are written once at the end, not by the background flusher mid-test
+_manual_usage_flush = override_settings(USAGE_FLUSH_SECONDS=0)
+
+
+def setUpModule():
+    _manual_usage_flush.enable()
+
+
+def tearDownModule():
+    # Before the test database goes away, so the atexit flush has nothing left to do
+    recorder.flush()
+    _manual_usage_flush.disable()
+
+
+@skipUnless(hasattr(os, "fork"), "the interpreter pool needs fork()")
+class InterpreterPoolTests(SimpleTestCase):
+    def make_pool(self, **kwargs):
+        options = dict(size=1, max_queue=1, max_runs=200, acquire_timeout=5)
+        options.update(kwargs)
+        pool = InterpreterPool(**options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def worker_pid(self, pool):
+        # Snippets run in a child forked from the worker
+        return int(pool.run("import os\nprint(os.getppid())", timeout=5)["stdout"])
+
+    def test_worker_is_reused(self):
+        pool = self.make_pool()
+        hits = metrics.snapshot()["counters"].get("code_runner.pool.hits", 0)
+
+        first, second = self.worker_pid(pool), self.worker_pid(pool)
+
+        self.assertEqual(first, second)
+        self.assertEqual(metrics.snapshot()["counters"]["code_runner.pool.hits"], hits + 1)
+
+    def test_worker_is_recycled_after_max_runs(self):
+        pool = self.make_pool(max_runs=2)
+
+        pids = [self.worker_pid(pool) for _ in range(3)]
+
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+
+    def test_runs_do_not_share_state(self):
+        pool = self.make_pool()
+
+        pool.run("leaked = 1", timeout=5)
+        result = pool.run("print(leaked)", timeout=5)
+
+        self.assertEqual(result["returncode"], 1)
+        self.assertIn("NameError", result["stderr"])
+
+    def assertProcessesGone(self, pids):
+        def alive(pid):
+            try:
+                with open(f"/proc/{pid}/stat") as stat:
+                    # A zombie is dead, it only waits for its new parent to reap it
+                    return stat.read().rsplit(")", 1)[1].split()[0] != "Z"
+            except FileNotFoundError:
+                return False
+
+        deadline = time.monotonic() + 2
+        while any(alive(pid) for pid in pids) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual([pid for pid in pids if alive(pid)], [])
+
+    @skipUnless(os.path.exists("/proc/self/stat"), "needs /proc")
+    def test_abandoned_stream_leaves_no_process_behind(self):
+        pool = self.make_pool()
+        code = (
+            "import os, subprocess, time\n"
+            "spawned = subprocess.Popen(['sleep', '1000'])\n"
+            "print(os.getpid(), spawned.pid, flush=True)\n"
+            "time.sleep(1000)"
+        )
+
+        chunks = pool.stream(code, timeout=30)
+        pids = [int(pid) for pid in next(chunks)["data"].split()]
+        # What StreamingHttpResponse does when the client disconnects
+        chunks.close()
+        pool.close()
+
+        self.assertProcessesGone(pids)
+
+
+@override_settings(CODE_RUNNER_JOB_EXECUTOR="external", CODE_RUNNER_RESULT_CACHE_ENABLED=False)
+class CodeRunJobTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="student", password="Passw0rd!")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, code="print(6 * 7)"):
+        response = self.client.post(reverse("run-code"), {"code": code, "lesson_id": "1", "mode": "async"}, format="json")
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def stream(self, job_id):
+        response = self.client.get(reverse("run-code-job-stream", args=[job_id]))
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_submitted_job_is_queued_until_executed(self):
+        job = self.submit()
+        poll = self.client.get(job["poll_url"])
+        self.assertEqual(poll.json()["status"], "queued")
+        self.assertEqual(poll["Retry-After"], "1")
+
+        execute_job(job["job_id"])
+
+        poll = self.client.get(job["poll_url"])
+        self.assertEqual(poll.json(), {"job_id": job["job_id"], "status": "done", "output": "42", "status_code": 0})
+        self.assertFalse(poll.has_header("Retry-After"))
+
+    def test_stream_of_unfinished_job_ends_with_a_retry_hint(self):
+        job = self.submit()
+
+        response, body = self.stream(job["job_id"])
+
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertTrue(body.startswith("retry: 1000\n\n"))
+        self.assertIn('event: status\ndata: {"job_id": "%s", "status": "queued"}' % job["job_id"], body)
+
+    def test_stream_of_finished_job_sends_the_result(self):
+        job = self.submit()
+        execute_job(job["job_id"])
+
+        _, body = self.stream(job["job_id"])
+
+        self.assertTrue(body.startswith("event: result\n"))
+        self.assertIn('"output": "42"', body)
+
+    def test_job_left_running_by_a_dead_executor_fails(self):
+        job = self.submit()
+        CodeRunJob.objects.filter(id=job["job_id"]).update(
+            status=CodeRunJob.STATUS_RUNNING, started_at=timezone.now() - timedelta(minutes=5),
+        )
+
+        payload = self.client.get(job["poll_url"]).json()
+
+        self.assertEqual(payload["status"], "failed")
+        self.assertEqual(payload["error"], "Execution failed: the executor stopped.")
+
+    def test_users_cannot_queue_unbounded_jobs(self):
+        for _ in range(2):
+            self.submit()
+        response = self.client.post(reverse("run-code"), {"code": "print(1)", "lesson_id": "1", "mode": "async"}, format="json")
+        self.assertEqual(response.status_code, 429)
+
+
+@override_settings(CODE_RUNNER_POOL_ENABLED=False, CODE_RUNNER_RESULT_CACHE_ENABLED=True)
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        result_cache.clear()
+        self.addCleanup(result_cache.clear)
+        patcher = mock.patch.object(sandbox, "_run_subprocess", wraps=sandbox._run_subprocess)
+        self.executed = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cache_hit_skips_execution(self):
+        first = sandbox.run_code("print(sum(range(10)))")
+        second = sandbox.run_code("print(sum(range(10)))\r\n\n")
+
+        self.assertEqual((first["stdout"], first["cached"]), ("45\n", False))
+        self.assertEqual((second["stdout"], second["cached"], second["usage"]), ("45\n", True, None))
+        self.assertEqual(self.executed.call_count, 1)
+
+    def test_nondeterministic_programs_always_run(self):
+        for code in ("import os\nprint(os.getpid() > 0)", "import random\nprint(random.random() < 2)",
+                     "print(input)"):
+            sandbox.run_code(code)
+            self.assertFalse(sandbox.run_code(code)["cached"], code)
+        self.assertEqual(self.executed.call_count, 6)
+
+    def test_static_check_rejects_indirect_and_order_dependent_code(self):
+        for code in (
+            "print(getattr(__builtins__, 'open'))",
+            "print(().__class__.__base__.__subclasses__())",
+            "m = __builtins__.__dict__['__import__']('os')",
+            "for word in {'a', 'b', 'c'}:\n    print(word)",
+            "print(sorted(set('abc')) == list({c for c in 'abc'}))",
+        ):
+            self.assertFalse(is_deterministic(code), code)
+        self.assertTrue(is_deterministic("if __name__ == '__main__':\n    print(sorted([3, 1, 2]))"))
+
+    def test_outputs_with_object_addresses_are_not_cached(self):
+        code = "class Point:\n    pass\nprint(Point())"
+        self.assertIn(" at 0x", sandbox.run_code(code)["stdout"])
+        self.assertFalse(sandbox.run_code(code)["cached"])
+        self.assertEqual(self.executed.call_count, 2)
+
+    def test_timeouts_are_not_cached(self):
+        code = "while True:\n    pass"
+        sandbox.run_code(code, timeout=0.2)
+        self.assertTrue(sandbox.run_code(code, timeout=0.2)["timed_out"])
+        self.assertEqual(self.executed.call_count, 2)
+
+
+@override_settings(CODE_RUNNER_POOL_ENABLED=False, CODE_RUNNER_RESULT_CACHE_ENABLED=False)
+class SyntaxPrecheckTests(SimpleTestCase):
+    def setUp(self):
+        syntax_cache.clear()
+        self.addCleanup(syntax_cache.clear)
+        patcher = mock.patch.object(sandbox, "_run_subprocess", wraps=sandbox._run_subprocess)
+        self.executed = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_code_that_does_not_compile_never_runs(self):
+        for code in ("print('unclosed'", "if True:\nprint(1)", "x = 1\0"):
+            result = sandbox.run_code(code)
+            self.assertEqual((result["returncode"], result["usage"]), (1, None), code)
+        self.assertEqual(self.executed.call_count, 0)
+
+    def test_message_matches_the_interpreter(self):
+        code = "def f(:\n    pass"
+        precheck = sandbox.run_code(code)["stderr"]
+        interpreter = sandbox._run_subprocess(code, timeout=5)["stderr"]
+        # python -c adds the source line and a caret; the last line is the error itself
+        self.assertEqual(precheck.strip().splitlines()[-1], interpreter.strip().splitlines()[-1])
+
+    def test_valid_code_still_runs(self):
+        # Imports like os are left to the sandbox, the precheck only compiles
+        result = sandbox.run_code("import os\nprint('ran')")
+        self.assertEqual(result["stdout"], "ran\n")
+        self.assertEqual(self.executed.call_count, 1)
+
+
+LIMITS = {"run_code": {"per_user": 1, "global": 2, "queue": 1, "wait": 0.2}}
+
+
+@override_settings(ADMISSION_CACHE="default", ADMISSION_LIMITS=LIMITS)
+class AdmissionTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.users = [
+            CustomUser.objects.create_user(username=f"student{i}", email=f"student{i}@example.com", password="Passw0rd!")
+            for i in range(3)
+        ]
+
+    def test_user_limit_rejects_at_once(self):
+        started = time.monotonic()
+        with admission(self.users[0], "run_code"):
+            with self.assertRaises(AdmissionRejected) as rejected:
+                with admission(self.users[0], "run_code"):
+                    pass
+            # Other users are not affected
+            with admission(self.users[1], "run_code"):
+                self.assertEqual(in_flight("run_code"), 2)
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertEqual(rejected.exception.wait, 1)
+
+    def test_slots_are_released_even_on_errors(self):
+        with self.assertRaises(ZeroDivisionError):
+            with admission(self.users[0], "run_code"):
+                1 / 0
+        self.assertEqual(in_flight("run_code"), 0)
+        with admission(self.users[0], "run_code"):
+            pass
+
+    def test_request_waits_for_a_global_slot_then_gives_up(self):
+        with admission(self.users[0], "run_code"), admission(self.users[1], "run_code"):
+            started = time.monotonic()
+            with self.assertRaises(AdmissionRejected):
+                with admission(self.users[2], "run_code"):
+                    pass
+            self.assertGreaterEqual(time.monotonic() - started, 0.2)
+            # The queue slot was given back
+            with self.assertRaises(AdmissionRejected):
+                with admission(self.users[2], "run_code"):
+                    pass
+
+    def test_full_queue_rejects_at_once(self):
+        caches["default"].add("admission:run_code:queue:0", "someone else")
+        with admission(self.users[0], "run_code"), admission(self.users[1], "run_code"):
+            started = time.monotonic()
+            with self.assertRaises(AdmissionRejected):
+                with admission(self.users[2], "run_code"):
+                    pass
+            self.assertLess(time.monotonic() - started, 0.2)
+
+    def test_stream_holds_its_slots_until_closed(self):
+        body = admit_stream(self.users[0], "run_code", (chunk for chunk in ["a", "b"]))
+        self.assertEqual(in_flight("run_code"), 1)
+        self.assertEqual(list(body), ["a", "b"])
+        self.assertEqual(in_flight("run_code"), 0)
+
+        body = admit_stream(self.users[0], "run_code", (chunk for chunk in ["a"]))
+        body.close()
+        self.assertEqual(in_flight("run_code"), 0)
+
+    def test_admission_reads_no_gauges_and_metrics_does(self):
+        with mock.patch.object(type(caches["default"]), "get_many", autospec=True) as get_many:
+            with admission(self.users[0], "run_code"):
+                pass
+        get_many.assert_not_called()
+
+        staff = CustomUser.objects.create_user(username="staff", email="staff@example.com", password="Passw0rd!", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        caches["default"].add("admission:run_code:queue:0", "someone else")
+        with admission(self.users[0], "run_code"):
+            gauges = client.get(reverse("metrics")).json()["gauges"]
+        self.assertEqual((gauges["admission.run_code.in_flight"], gauges["admission.run_code.queued"]), (1, 1))
+
+    def test_endpoint_answers_429_with_retry_after(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        with admission(self.users[0], "run_code"):
+            response = client.post(reverse("run-code"), {"code": "print(1)", "lesson_id": 1}, format="json")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+
+
+def run_result(wall=0.5, cpu=0.1, rss=10000, output=100, timed_out=False):
+    return {
+        "timed_out": timed_out, "truncated": False,
+        "usage": {"wall": wall, "cpu_user": cpu, "cpu_sys": 0.0, "max_rss_kb": rss, "output_bytes": output},
+    }
+
+
+class UsageTests(TestCase):
+    def setUp(self):
+        self.lesson = Lesson.objects.first()
+        self.recorder = UsageRecorder()
+
+    def test_runs_are_aggregated_into_one_row_per_lesson_and_day(self):
+        self.recorder.record(self.lesson.id, run_result(cpu=0.1, rss=10000))
+        self.recorder.record(self.lesson.id, run_result(cpu=0.3, rss=30000, timed_out=True))
+        self.recorder.flush()
+        self.recorder.record(self.lesson.id, run_result(cpu=0.2, rss=20000))
+        self.recorder.flush()
+
+        stats = LessonRunStats.objects.get(lesson=self.lesson)
+        self.assertEqual((stats.runs, stats.timeouts), (3, 1))
+        self.assertEqual((stats.cpu_ms_total, stats.wall_ms_total, stats.output_bytes_total), (600, 1500, 300))
+        self.assertEqual(stats.max_rss_kb_peak, 30000)
+        self.assertEqual(sum(stats.histograms["cpu_ms"].values()), 3)
+
+    def test_recording_costs_no_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(5):
+                self.recorder.record(self.lesson.id, run_result())
+        self.assertEqual(len(queries), 0)
+        self.assertFalse(LessonRunStats.objects.exists())
+
+    def test_row_created_by_another_process_is_added_to(self):
+        LessonRunStats.objects.create(lesson=self.lesson, day=timezone.localdate(), runs=4)
+        self.recorder.record(self.lesson.id, run_result())
+        self.recorder.flush()
+        self.assertEqual(LessonRunStats.objects.get(lesson=self.lesson).runs, 5)
+
+    def test_failed_flush_keeps_the_batch(self):
+        self.recorder.record(self.lesson.id, run_result())
+        with mock.patch("accounts.usage.save_aggregates", side_effect=RuntimeError("database is down")), \
+                self.assertLogs("accounts.usage", "ERROR"):
+            self.recorder.flush()
+        self.recorder.record(self.lesson.id, run_result())
+        self.recorder.flush()
+        self.assertEqual(LessonRunStats.objects.get(lesson=self.lesson).runs, 2)
+
+    def test_unknown_lessons_are_skipped(self):
+        self.recorder.record(999999, run_result())
+        self.recorder.flush()
+        self.assertFalse(LessonRunStats.objects.exists())
+
+    @override_settings(USAGE_FLUSH_SECONDS=0.05)
+    def test_background_thread_flushes(self):
+        with mock.patch("accounts.usage.save_aggregates") as save:
+            self.recorder.record(self.lesson.id, run_result())
+            deadline = time.monotonic() + 2
+            while not save.called and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(save.call_args.args[0][(self.lesson.id, timezone.localdate())]["runs"], 1)
+
+
+class GraderTests(TestCase):
+    CASES = [
+        {"name": "small", "stdin": "2 3\n", "expected_output": "5", "expected_output_hash": None, "timeout": 2},
+        {"name": "large", "stdin": "40 2\n", "expected_output": "42", "expected_output_hash": None, "timeout": 2},
+    ]
+    SOLUTION = "a, b = map(int, input().split())\nprint(a + b)"
+
+    def grade(self, code):
+        return grade(code, self.CASES)
+
+    def test_solution_passes_every_case(self):
+        result = self.grade(self.SOLUTION)
+        self.assertEqual((result["passed"], result["passed_count"], result["total"]), (True, 2, 2))
+        self.assertEqual([case["output"] for case in result["cases"]], ["5", "42"])
+
+    def test_wrong_and_crashing_code_fail(self):
+        self.assertEqual(self.grade("print(5)")["passed_count"], 1)
+        crashed = self.grade("a, b = map(int, input().split())\nprint(a + b)\nraise SystemExit(3)")
+        self.assertEqual(crashed["passed_count"], 0)
+
+    def test_submission_cannot_forge_results(self):
+        forged = json.dumps({"stdout": "42", "stderr": "", "returncode": 0, "timed_out": False, "truncated": False})
+        for code in (f"import sys\nsys.__stdout__.write({forged!r} + '\\n')",
+                     f"import os\nos.write(1, ({forged!r} + '\\n').encode())"):
+            result = self.grade(code)
+            self.assertEqual(result["passed_count"], 0, code)
+            self.assertFalse(any(case["timed_out"] for case in result["cases"]))
+
+    def test_subprocess_output_does_not_break_grading(self):
+        result = self.grade("import os\nos.system('echo hi')\n" + self.SOLUTION)
+        self.assertFalse(any(case["timed_out"] for case in result["cases"]))
+        self.assertEqual([case["output"] for case in result["cases"]], ["hi\n5", "hi\n42"])
+
+    def test_each_case_has_its_own_deadline(self):
+        code = "a, b = map(int, input().split())\nwhile a == 2:\n    pass\nprint(a + b)"
+        result = self.grade(code)
+        self.assertEqual([case["timed_out"] for case in result["cases"]], [True, False])
+        self.assertEqual(result["passed_count"], 1)
+
+    @override_settings(CODE_RUNNER_MAX_OUTPUT_BYTES=1000)
+    def test_output_is_capped_while_running(self):
+        started = time.monotonic()
+        result = sandbox.run_cases("while True:\n    print('x' * 100)", [{"stdin": "", "timeout": 5}])
+        self.assertLess(time.monotonic() - started, 4)
+        self.assertTrue(result[0]["truncated"])
+        self.assertEqual(len(result[0]["stdout"]), 1000)
+
+    def test_outputs_are_compared_after_normalization(self):
+        self.assertTrue(outputs_match("1  2\r\n3.0000001\n\n", "1 2\n3.0"))
+        self.assertFalse(outputs_match("1 2\n3.1", "1 2\n3.0"))
+
+    @override_settings(ADMISSION_CACHE="default")
+    def test_grading_goes_through_admission_control(self):
+        user = CustomUser.objects.create_user(username="student", password="Passw0rd!")
+        lesson = Lesson.objects.first()
+        LessonTestCase.objects.create(lesson=lesson, stdin="2 3\n", expected_output="5")
+        client = APIClient()
+        client.force_authenticate(user)
+        url = reverse("lesson-grade", args=[lesson.id])
+
+        self.assertTrue(client.post(url, {"code": self.SOLUTION}, format="json").json()["passed"])
+        limits = {"run_code": {"per_user": 0, "global": 16, "queue": 32, "wait": 5}}
+        with self.settings(ADMISSION_LIMITS=limits):
+            response = client.post(url, {"code": self.SOLUTION}, format="json")
+        self.assertEqual(response.status_code, 429)
+
+
+class FeedbackCacheTests(TestCase):
+    CODE = (
+        "def total(numbers):\n"
+        "    \"\"\"Add them up.\"\"\"\n"
+        "    result = 0\n"
+        "    for n in numbers:\n"
+        "        result += n\n"
+        "    return result\n"
+        "print(total([1, 2, 3]))\n"
+    )
+    VARIANT = (
+        "# my solution\n"
+        "def total(values):\n"
+        "    acc = 0  # running sum\n"
+        "    for value in values:   acc += value\n"
+        "\n"
+        "    return acc\n"
+        "print( total( [1,2,3] ) )\n"
+    )
+
+    def setUp(self):
+        feedback_cache.clear()
+        self.user = CustomUser.objects.create_user(username="student", password="Passw0rd!")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.lesson = Lesson.objects.first()
+
+    def test_equivalent_submissions_share_a_fingerprint(self):
+        self.assertEqual(fingerprint(self.CODE, self.lesson.id), fingerprint(self.VARIANT, self.lesson.id))
+
+    def test_fingerprint_keeps_what_changes_the_program(self):
+        key = fingerprint(self.CODE, self.lesson.id)
+        self.assertNotEqual(key, fingerprint(self.CODE.replace("result += n", "result -= n"), self.lesson.id))
+        self.assertNotEqual(key, fingerprint(self.CODE.replace("print(", "len("), self.lesson.id))
+        self.assertNotEqual(key, fingerprint(self.CODE, self.lesson.id + 1))
+        with self.settings(HF_MODEL_ID="another/model"):
+            self.assertNotEqual(key, fingerprint(self.CODE, self.lesson.id))
+
+    def test_code_that_does_not_parse_is_keyed_by_its_source(self):
+        self.assertEqual(fingerprint("print(1", None), fingerprint("print(1\n", None))
+        self.assertNotEqual(fingerprint("print(1", None), fingerprint("print(2", None))
+
+    def ask(self, code):
+        return self.client.post(
+            reverse("ai-feedback"), {"code": code, "lesson_id": self.lesson.id, "escalate": True}, format="json"
+        )
+
+    @override_settings(ADMISSION_CACHE="default")
+    def test_cache_hit_skips_the_model_and_admission(self):
+        answer = [{"generated_text": "Looks good."}]
+        with mock.patch("accounts.views.get_gateway") as gateway:
+            gateway.return_value.generate.return_value = answer
+            first = self.ask(self.CODE).json()
+            with mock.patch("accounts.views.admission") as admitted:
+                second = self.ask(self.VARIANT).json()
+
+        self.assertEqual((first["source"], first["cached"]), ("model", False))
+        self.assertEqual((second["source"], second["cached"], second["feedback"]), ("cache", True, answer))
+        self.assertEqual(gateway.return_value.generate.call_count, 1)
+        admitted.assert_not_called()
+
+    def test_stored_feedback_survives_the_process_cache(self):
+        key = fingerprint(self.CODE, self.lesson.id)
+        LessonFeedback.objects.create(
+            user=self.user, lesson=self.lesson, code=self.CODE, fingerprint=key,
+            feedback=json.dumps([{"generated_text": "Stored."}]),
+        )
+        with mock.patch("accounts.views.get_gateway") as gateway:
+            response = self.ask(self.VARIANT).json()
+        self.assertEqual(response["feedback"], [{"generated_text": "Stored."}])
+        gateway.assert_not_called()
+
+
+class HintTests(TestCase):
+    def rules(self, code, expected_output=None):
+        return [(hint["rule"], hint["line"]) for hint in analyze(code, expected_output)]
+
+    def test_unused_variable_is_flagged(self):
+        code = "name = input()\ngreeting = 'Hello ' + name\nprint(name)"
+        self.assertEqual(self.rules(code), [("unused-variable", 2)])
+        self.assertEqual(analyze(code)[0]["message"], "'greeting' is assigned but never used.")
+
+    def test_unused_loop_and_underscore_names_are_fine(self):
+        self.assertEqual(self.rules("for i in range(3):\n    print('hi')\n_, b = 1, 2\nprint(b)"), [])
+
+    def test_each_rule_fires(self):
+        samples = {
+            "shadowed-builtin": "list = [1, 2]\nprint(list)",
+            "compare-to-none": "x = input()\nif x == None:\n    print(x)",
+            "compare-to-bool": "x = input() == 'y'\nif x == True:\n    print(x)",
+            "use-comprehension": "squares = []\nfor n in range(5):\n    squares.append(n * n)\nprint(squares)",
+            "range-len": "items = [1, 2]\nfor i in range(len(items)):\n    print(items[i])",
+            "bare-except": "try:\n    print(int(input()))\nexcept:\n    print('no')",
+            "mutable-default": "def add(item, into=[]):\n    into.append(item)\n    return into\nprint(add(1))",
+            "endless-loop": "while True:\n    print('again')",
+        }
+        for rule, code in samples.items():
+            with self.subTest(rule):
+                self.assertEqual([found for found, _ in self.rules(code)], [rule])
+
+    def test_missing_print_only_when_output_is_expected(self):
+        self.assertEqual(self.rules("x = 1\nx + 1", expected_output="2"), [("missing-print", None)])
+        self.assertEqual(self.rules("x = 1\nx + 1"), [])
+        self.assertEqual(self.rules("x = 1\nprint(x + 1)", expected_output="2"), [])
+
+    def test_syntax_error_is_a_hint(self):
+        self.assertEqual(self.rules("print(1"), [("syntax-error", 1)])
+
+    def test_hints_answer_without_the_model(self):
+        user = CustomUser.objects.create_user(username="student", password="Passw0rd!")
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with mock.patch("accounts.views.get_gateway") as gateway:
+            response = client.post(reverse("ai-feedback"), {"code": "unused = 1\nprint(2)"}, format="json").json()
+
+        self.assertEqual((response["source"], response["feedback"]), ("rules", None))
+        self.assertEqual([hint["rule"] for hint in response["hints"]], ["unused-variable"])
+        gateway.assert_not_called()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.requests.append({"path": self.path, "body": body, "port": self.client_address[1],
+                                "auth": self.headers.get("Authorization")})
+        if body.get("stream"):
+            return self.stream_tokens()
+        status, payload, delay = server.responses.pop(0) if server.responses else (200, [{"generated_text": "ok"}], 0)
+        time.sleep(delay)
+        data = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def stream_tokens(self):
+        # Text-generation-inference style: one "data:" line per token
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for text in self.server.tokens:
+                self.wfile.write(f"data: {json.dumps({'token': {'text': text, 'special': False}})}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(self.server.token_delay)
+            self.server.stream_finished = True
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.stream_cancelled = True
+
+    def log_message(self, *args):
+        pass
+
+
+class InferenceClientTests(SimpleTestCase):
+    """The inference client against a local stub of the Hugging Face API."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.responses = []
+        self.server.tokens = []
+        self.server.token_delay = 0
+        self.server.stream_finished = self.server.stream_cancelled = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def make_client(self, **kwargs):
+        options = dict(
+            base_url=f"http://127.0.0.1:{self.server.server_port}/models/",
+            model_id="org/model", api_key="secret", connect_timeout=1, read_timeout=1,
+            max_retries=2, backoff=0.01,
+        )
+        options.update(kwargs)
+        client = InferenceClient(**options)
+        self.addCleanup(client.close)
+        return client
+
+    def test_posts_prompt_to_configured_model(self):
+        result = self.make_client().generate("print(1)")
+
+        self.assertEqual(result, [{"generated_text": "ok"}])
+        request = self.server.requests[0]
+        self.assertEqual(request["path"], "/models/org/model")
+        self.assertEqual(request["body"], {"inputs": "print(1)"})
+        self.assertEqual(request["auth"], "Bearer secret")
+
+    def test_reuses_connection(self):
+        client = self.make_client()
+        for _ in range(3):
+            client.generate("x")
+        self.assertEqual(len({request["port"] for request in self.server.requests}), 1)
+
+    def test_retries_server_errors(self):
+        self.server.responses = [(503, {"error": "loading"}, 0), (502, {}, 0)]
+
+        self.assertEqual(self.make_client().generate("x"), [{"generated_text": "ok"}])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_does_not_retry_client_errors(self):
+        self.server.responses = [(400, {"error": "bad input"}, 0)]
+
+        with self.assertRaises(InferenceError):
+            self.make_client().generate("x")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_read_timeout_is_bounded(self):
+        self.server.responses = [(200, [], 2)] * 2
+        client = self.make_client(read_timeout=0.2, max_retries=1)
+
+        started = time.monotonic()
+        with self.assertRaises(InferenceError):
+            client.generate("x")
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_circuit_opens_and_recovers(self):
+        self.server.responses = [(500, {}, 0)] * 2
+        client = self.make_client(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+
+        for _ in range(2):
+            with self.assertRaises(InferenceError):
+                client.generate("x")
+        with self.assertRaises(InferenceUnavailable):
+            client.generate("x")
+        self.assertEqual(len(self.server.requests), 2)
+
+        time.sleep(0.25)
+        self.assertEqual(client.generate("x"), [{"generated_text": "ok"}])
+        self.assertEqual(client.breaker.state, "closed")
+
+    def test_unexpected_error_in_a_trial_does_not_wedge_the_circuit(self):
+        client = self.make_client(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.1))
+        self.server.responses = [(500, {}, 0)]
+        with self.assertRaises(InferenceError):
+            client.generate("x")
+
+        time.sleep(0.15)
+        with mock.patch.object(client.session, "post", side_effect=ValueError("unexpected")):
+            with self.assertRaises(ValueError):
+                client.generate("x")
+        self.assertEqual(client.breaker.state, "open")
+
+        time.sleep(0.15)
+        self.assertEqual(client.generate("x"), [{"generated_text": "ok"}])
+        self.assertEqual(client.breaker.state, "closed")
+
+    def test_stream_relays_tokens(self):
+        self.server.tokens = ["Use ", "a ", "loop."]
+
+        self.assertEqual(list(self.make_client().stream("x")), ["Use ", "a ", "loop."])
+        self.assertEqual(self.server.requests[0]["body"], {"inputs": "x", "stream": True})
+
+    def test_closing_stream_cancels_generation(self):
+        self.server.tokens = ["token "] * 200
+        self.server.token_delay = 0.01
+        stream = self.make_client().stream("x")
+
+        self.assertEqual(next(stream), "token ")
+        stream.close()
+
+        deadline = time.monotonic() + 5
+        while not self.server.stream_cancelled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.server.stream_cancelled)
+        self.assertFalse(self.server.stream_finished)
+
+    def test_async_client(self):
+        self.server.responses = [(503, {}, 0)]
+        client = AsyncInferenceClient(self.make_client())
+
+        async def generate():
+            try:
+                return await client.generate("x")
+            finally:
+                await client.aclose()
+
+        self.assertEqual(asyncio.run(generate()), [{"generated_text": "ok"}])
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_requests_queued_behind_busy_batches_share_a_batch(self):
+        sending, release = threading.Event(), threading.Event()
+
+        class BlockingBackend(FakeBackend):
+            def generate_batch(self, prompts):
+                sending.set()
+                release.wait(5)
+                return super().generate_batch(prompts)
+
+        backend = BlockingBackend()
+        batcher = MicroBatcher(backend, max_batch_size=4, max_wait=0.2, concurrency=1)
+        first = batcher.submit("first")
+        self.assertTrue(sending.wait(5))
+
+        futures = [batcher.submit(f"code {i}") for i in range(8)]
+        release.set()
+        results = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(first.result(timeout=5), [{"generated_text": "Feedback for: first"}])
+        self.assertEqual(results, [[{"generated_text": f"Feedback for: code {i}"}] for i in range(8)])
+        self.assertEqual([len(batch) for batch in backend.batches], [1, 4, 4])
+
+    def test_lone_request_is_not_held_for_the_wait_window(self):
+        backend = FakeBackend()
+        batcher = MicroBatcher(backend, max_batch_size=8, max_wait=2)
+
+        started = time.monotonic()
+        self.assertEqual(batcher.generate("x"), [{"generated_text": "Feedback for: x"}])
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(backend.batches, [["x"]])
+
+    def test_batch_size_one_calls_backend_in_the_caller_thread(self):
+        threads = []
+
+        class RecordingBackend(FakeBackend):
+            def generate_batch(self, prompts):
+                threads.append(threading.current_thread())
+                return super().generate_batch(prompts)
+
+        batcher = MicroBatcher(RecordingBackend(), max_batch_size=1, max_wait=2)
+
+        self.assertEqual(batcher.generate("x"), [{"generated_text": "Feedback for: x"}])
+        self.assertEqual(threads, [threading.current_thread()])
+        self.assertFalse(hasattr(batcher, "_dispatcher"))
+
+    def test_backend_error_reaches_every_request(self):
+        class BrokenBackend:
+            def generate_batch(self, prompts):
+                raise InferenceError("down")
+
+        batcher = MicroBatcher(BrokenBackend(), max_batch_size=2, max_wait=0.2)
+        futures = [batcher.submit("a"), batcher.submit("b")]
+        for future in futures:
+            with self.assertRaises(InferenceError):
+                future.result(timeout=5)
+
+    def test_failed_batch_is_retried_prompt_by_prompt(self):
+        class PickyBackend(FakeBackend):
+            def generate_batch(self, prompts):
+                self.batches.append(list(prompts))
+                if "bad" in prompts:
+                    raise InferenceError("bad input")
+                return [[{"generated_text": f"Feedback for: {prompt}"}] for prompt in prompts]
+
+        backend = PickyBackend()
+        batcher = MicroBatcher(backend, max_batch_size=3, max_wait=0.2)
+
+        futures = [(prompt, Future()) for prompt in ("a", "bad", "b")]
+        batcher._send(futures)
+
+        self.assertEqual(futures[0][1].result(), [{"generated_text": "Feedback for: a"}])
+        with self.assertRaises(InferenceError):
+            futures[1][1].result()
+        self.assertEqual(futures[2][1].result(), [{"generated_text": "Feedback for: b"}])
+        self.assertEqual(backend.batches, [["a", "bad", "b"], ["a"], ["bad"], ["b"]])
+
+    def test_huggingface_backend_sends_one_request_per_batch(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        server.requests = []
+        server.responses = [(200, [[{"generated_text": "a"}], [{"generated_text": "b"}]], 0)]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = InferenceClient(f"http://127.0.0.1:{server.server_port}/models/", "org/model", backoff=0.01)
+        self.addCleanup(client.close)
+
+        results = HuggingFaceBackend(client).generate_batch(["x", "y"])
+
+        self.assertEqual(results, [[{"generated_text": "a"}], [{"generated_text": "b"}]])
+        self.assertEqual([request["body"] for request in server.requests], [{"inputs": ["x", "y"]}])
+
+
+@override_settings(DASHBOARD_CACHE="default")
+class DashboardQueryBudgetTests(TestCase):
+    """The dashboard is built from a fixed number of queries, however much history a user has."""
+
+    QUERY_BUDGET = 5
+
+    def setUp(self):
+        caches["default"].clear()
+        self.user = CustomUser.objects.create_user(
+            username="student", password="Passw0rd!", learning_goal="School", difficulty_level="Beginner",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.lessons = list(Lesson.objects.filter(learning_goal="School", difficulty_level="Beginner").order_by("order"))
+
+    def add_history(self, count):
+        today = timezone.localdate()
+        lessons = self.lessons
+        StudySession.objects.bulk_create(
+            StudySession(user=self.user, lesson=lessons[i % len(lessons)], date=today + timedelta(days=i % 60 - 20),
+                         start_time=clock(9), end_time=clock(10))
+            for i in range(count)
+        )
+        UserActivity.objects.bulk_create(
+            UserActivity(user=self.user, activity_type="lesson_completed", title=f"Activity {i}")
+            for i in range(count)
+        )
+        self.user.progress.completed_lessons.add(*lessons[:count])
+
+    def get_dashboard(self):
+        # Measure building the dashboard, not serving it from the cache
+        caches["default"].clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.add_history(1)
+        _, small = self.get_dashboard()
+        self.add_history(50)
+        data, large = self.get_dashboard()
+
+        self.assertLessEqual(small, self.QUERY_BUDGET)
+        self.assertEqual(small, large)
+        self.assertEqual(data["progress"]["total_lessons_completed"], min(len(self.lessons), 51))
+        self.assertLessEqual(len(data["study_sessions"]), 20)
+        self.assertEqual(len(data["recent_activities"]), 5)
+
+    def test_study_sessions_are_windowed(self):
+        today = timezone.localdate()
+        for offset in (-30, -1, 0, 5, 90):
+            StudySession.objects.create(user=self.user, lesson=self.lessons[0], date=today + timedelta(days=offset),
+                                        start_time=clock(9), end_time=clock(10))
+
+        data, _ = self.get_dashboard()
+
+        dates = [session["date"] for session in data["study_sessions"]]
+        self.assertEqual(dates, [str(today + timedelta(days=offset)) for offset in (-1, 0, 5)])
+        self.assertEqual(data["study_sessions"][0]["lesson_title"], self.lessons[0].title)
+
+    def test_recommendations_skip_completed_lessons(self):
+        self.user.progress.completed_lessons.add(self.lessons[0])
+
+        data, _ = self.get_dashboard()
+
+        self.assertEqual(data["current_lesson"]["id"], self.lessons[0].id)
+        self.assertNotIn(self.lessons[0].id, [lesson["id"] for lesson in data["recommended_lessons"]])
+
+
+@override_settings(DASHBOARD_CACHE="default")
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.user = CustomUser.objects.create_user(
+            username="student", password="Passw0rd!", learning_goal="School", difficulty_level="Beginner",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.lesson = Lesson.objects.filter(learning_goal="School", difficulty_level="Beginner").order_by("order").first()
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_repeat_requests_are_served_from_cache(self):
+        first, _ = self.get_dashboard()
+        second, queries = self.get_dashboard()
+
+        self.assertEqual(first, second)
+        self.assertEqual(queries, 0)
+
+    def test_completing_a_lesson_invalidates(self):
+        self.get_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.progress.completed_lessons.add(self.lesson)
+
+        data, queries = self.get_dashboard()
+
+        self.assertGreater(queries, 0)
+        self.assertEqual(data["progress"]["total_lessons_completed"], 1)
+
+    def test_activities_and_study_sessions_invalidate(self):
+        self.get_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            UserActivity.create_activity(user=self.user, activity_type="lesson_completed", title="Done", description="")
+        data, _ = self.get_dashboard()
+        self.assertEqual([activity["title"] for activity in data["recent_activities"]], ["Done"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session = StudySession.objects.create(user=self.user, lesson=self.lesson, date=timezone.localdate(),
+                                                  start_time=clock(9), end_time=clock(10))
+        data, _ = self.get_dashboard()
+        self.assertEqual(len(data["study_sessions"]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session.delete()
+        data, _ = self.get_dashboard()
+        self.assertEqual(data["study_sessions"], [])
+
+    def test_other_users_changes_do_not_invalidate(self):
+        other = CustomUser.objects.create_user(username="other", email="other@example.com", password="Passw0rd!")
+        self.get_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            UserActivity.create_activity(user=other, activity_type="lesson_completed", title="Done", description="")
+
+        _, queries = self.get_dashboard()
+
+        self.assertEqual(queries, 0)
+
+    def test_concurrent_miss_waits_for_the_builder(self):
+        key = dashboard_cache._payload_key(self.user.pk)
+        caches["default"].add(f"{key}:lock", 1)
+        threading.Timer(0.1, lambda: caches["default"].set(key, b"built elsewhere")).start()
+
+        payload = dashboard_cache.get_or_build(self.user.pk, lambda: self.fail("built twice"))
+
+        self.assertEqual(payload, b"built elsewhere")
+
+
+@override_settings(CATALOG_VERSION_CACHE="default")
+class LessonCatalogTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        catalog.clear()
+        self.user = CustomUser.objects.create_user(
+            username="student", password="Passw0rd!", learning_goal="School", difficulty_level="Beginner",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_lists_are_served_from_the_catalog(self):
+        for name in ("lesson-list", "all-lessons", "recommended-lessons"):
+            first, _ = self.get(name)
+            second, queries = self.get(name)
+            self.assertTrue(first)
+            self.assertEqual(first, second)
+            self.assertEqual(queries, 0)
+
+    def test_lesson_list_is_sliced_by_track(self):
+        lessons, _ = self.get("lesson-list")
+        titles = set(Lesson.objects.filter(learning_goal="School", difficulty_level="Beginner").values_list("title", flat=True))
+        self.assertEqual({lesson["title"] for lesson in lessons}, titles)
+
+    def test_editing_a_lesson_bumps_the_version(self):
+        self.get("all-lessons")
+        lesson = Lesson.objects.order_by("order").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.title = "Renamed"
+            lesson.save()
+
+        lessons, queries = self.get("all-lessons")
+
+        self.assertGreater(queries, 0)
+        self.assertIn("Renamed", [entry["title"] for entry in lessons])
+
+    def test_fields_projection_is_pushed_into_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("all-lessons"), {"fields": "title,id"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({tuple(lesson) for lesson in response.json()}, {("id", "title")})
+        sql = queries.captured_queries[-1]["sql"]
+        self.assertNotIn("solution", sql)
+        self.assertNotIn("step1_content", sql)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse("lesson-list"), {"fields": "title,password"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_lesson_index(self):
+        lessons, _ = self.get("lesson-index")
+
+        self.assertEqual(len(lessons), Lesson.objects.count())
+        self.assertEqual(set(lessons[0]), {"id", "title", "order", "learning_goal", "difficulty_level"})
+
+
+class ActivityListTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="student", password="Passw0rd!")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, activity_type, minutes_ago, xp=0, title=""):
+        activity = UserActivity.objects.create(
+            user=self.user, activity_type=activity_type, title=title or activity_type, description="", xp_earned=xp,
+        )
+        # created_at is auto_now_add
+        UserActivity.objects.filter(pk=activity.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return activity
+
+    def get(self, url=None, **params):
+        response = self.client.get(url or reverse("activity-list"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_follow_the_cursor_without_gaps(self):
+        created = [self.add("level_up", minutes_ago=i // 2) for i in range(25)]  # equal timestamps in pairs
+
+        ids, url = [], None
+        while True:
+            page = self.get(url, page_size=10) if url is None else self.get(url)
+            self.assertLessEqual(len(page["results"]), 10)
+            ids += [activity["id"] for activity in page["results"]]
+            url = page["next"]
+            if not url:
+                break
+
+        self.assertEqual(sorted(ids), sorted(activity.id for activity in created))
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_next_link_keeps_the_scheme_the_proxy_received(self):
+        for i in range(3):
+            self.add("level_up", minutes_ago=i)
+
+        page = self.client.get(reverse("activity-list"), {"page_size": 2}, HTTP_X_FORWARDED_PROTO="https").json()
+
+        self.assertTrue(page["next"].startswith("https://"), page["next"])
+
+    def test_type_filters(self):
+        self.add("lesson_completed", 1)
+        self.add("level_up", 2)
+        self.add("study_session_added", 3)
+
+        included = self.get(type="lesson_completed,level_up")["results"]
+        excluded = self.get(exclude_type="study_session_added")["results"]
+
+        self.assertEqual([a["activity_type"] for a in included], ["lesson_completed", "level_up"])
+        self.assertEqual([a["activity_type"] for a in excluded], ["lesson_completed", "level_up"])
+        self.assertEqual(self.client.get(reverse("activity-list"), {"type": "bogus"}).status_code, 400)
+
+    def test_xp_rows_next_to_their_activity_are_collapsed(self):
+        self.add("lesson_completed", 10, xp=20)
+        duplicate = self.add("xp_earned", 10, xp=20)
+        standalone = self.add("xp_earned", 60, xp=5)
+
+        ids = [a["id"] for a in self.get()["results"]]
+        raw_ids = [a["id"] for a in self.get(collapse_xp="false")["results"]]
+
+        self.assertNotIn(duplicate.id, ids)
+        self.assertIn(standalone.id, ids)
+        self.assertIn(duplicate.id, raw_ids)
+
+
+class BenchmarkQueriesTests(TestCase):
+    def test_refuses_to_run_without_debug_or_force(self):
+        with self.assertRaisesMessage(CommandError, "--force"):
+            call_command("benchmark_queries", "--users=1", stdout=StringIO())
+        self.assertFalse(CustomUser.objects.filter(username__startswith="benchmark-").exists())
+
+    def test_reports_plans_without_and_with_the_indexes(self):
+        lessons = Lesson.objects.count()
+        with tempfile.NamedTemporaryFile(suffix=".json") as report:
+            out = StringIO()
+            call_command(
+                "benchmark_queries", "--users=3", "--activities=20", "--sessions=5", "--lessons=2",
+                "--questions=2", "--repeat=2", f"--json={report.name}", "--force", stdout=out,
+            )
+            results = json.load(open(report.name))
+
+        self.assertIn("activity_user_created_idx", results["indexes"])
+        self.assertEqual(set(results["before"]), set(results["after"]))
+        for name, after in results["after"].items():
+            self.assertGreaterEqual(after["p95_ms"], after["p50_ms"], name)
+        self.assertNotIn("activity_user_created_idx", results["before"]["activities.first_page"]["plan"])
+        self.assertIn("activity_user_created_idx", results["after"]["activities.first_page"]["plan"])
+        self.assertIn("lesson_track_order_idx", results["after"]["lessons.track"]["plan"])
+        self.assertIn("== quiz.lesson", out.getvalue())
+
+        # The synthetic data is rolled back, the indexes are back in place
+        self.assertEqual(Lesson.objects.count(), lessons)
+        self.assertFalse(CustomUser.objects.filter(username__startswith="benchmark-").exists())
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, UserActivity._meta.db_table)
+        self.assertIn("activity_user_created_idx", indexes)
+
+
+class CurriculumTests(TestCase):
+    def test_migration_loaded_the_curriculum(self):
+        expected = {
+            (spec["fields"]["learning_goal"], spec["fields"]["difficulty_level"], spec["fields"]["title"])
+            for spec in read_curriculum().values()
+        }
+        loaded = set(Lesson.objects.values_list("learning_goal", "difficulty_level", "title"))
+        self.assertLessEqual(expected, loaded)
+
+    def test_seeding_again_keeps_existing_lessons(self):
+        curriculum_migration = import_module("accounts.migrations.0016_load_default_curriculum")
+        lesson = Lesson.objects.get(title="Introduction to Python", learning_goal="School", difficulty_level="Beginner")
+        lesson.description = "Edited by staff"
+        lesson.save()
+        count = Lesson.objects.count()
+
+        curriculum_migration.load(django_apps, None)
+
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.description, "Edited by staff")
+        self.assertEqual(Lesson.objects.count(), count)
+
+    def test_sync_adds_missing_lessons_back(self):
+        Lesson.objects.filter(learning_goal="Portfolio").delete()
+
+        result = sync_curriculum()
+
+        self.assertEqual(len(result.changes["lessons"]["created"]), 3)
+        self.assertEqual(Lesson.objects.filter(learning_goal="Portfolio").count(), 3)
+
+    def test_data_migrations_do_not_depend_on_live_code(self):
+        curriculum_migration = import_module("accounts.migrations.0016_load_default_curriculum")
+        hash_migration = import_module("accounts.migrations.0012_lessontestcase_expected_output_hash")
+
+        Lesson.objects.all().delete()
+        with mock.patch("accounts.curriculum.read_curriculum", side_effect=AssertionError("read the live files")):
+            curriculum_migration.load(django_apps, None)
+        self.assertEqual(Lesson.objects.count(), 13)
+
+        # The frozen copy still agrees with today's grader
+        self.assertEqual(hash_migration.output_hash(" 1.0000001\r\n2 "), output_hash("1.0\n2"))
+
+    def test_user_saves_do_not_seed_lessons(self):
+        user = CustomUser.objects.create_user(
+            username="student", password="Passw0rd!", learning_goal="School", difficulty_level="Beginner",
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+            response = client.patch(reverse("profile"), {"learning_goal": "Portfolio", "difficulty_level": "Advanced"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries.captured_queries if "accounts_lesson" in q["sql"]])
+
+
+class CurriculumSyncTests(TestCase):
+    """sync_curriculum against files written to a temporary directory."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, lessons, level="Beginner"):
+        with open(os.path.join(self.directory.name, "portfolio.json"), "w") as f:
+            json.dump({"format": 1, "learning_goal": "Portfolio", "levels": {level: lessons}}, f)
+        return read_curriculum(self.directory.name)
+
+    def lessons(self, count, quiz_size=2):
+        return [
+            {"slug": f"lesson-{i}", "title": f"Lesson {i}", "description": f"About {i}", "order": i, "quiz": [
+                {"question": f"Q{i}.{j}", "option_a": "a", "option_b": "b", "option_c": "c", "option_d": "d",
+                 "correct_option": "A", "order": j}
+                for j in range(quiz_size)
+            ]}
+            for i in range(count)
+        ]
+
+    def test_applies_only_the_difference(self):
+        sync_curriculum(self.write(self.lessons(3)), prune=True)
+        lessons = self.lessons(3)
+        lessons[0]["description"] = "Rewritten"
+        lessons[1]["quiz"][0]["correct_option"] = "B"
+        del lessons[1]["quiz"][1]
+        del lessons[2]
+        lessons.append({"slug": "lesson-9", "title": "Lesson 9", "description": "New", "order": 9})
+
+        result = sync_curriculum(self.write(lessons), prune=True)
+
+        self.assertEqual(result.changes["lessons"], {
+            "created": ["Portfolio/Beginner: Lesson 9"],
+            "updated": ["Portfolio/Beginner: Lesson 0 (description)"],
+            "deleted": ["Portfolio/Beginner: Lesson 2"],
+            "orphaned": [],
+        })
+        self.assertEqual(result.changes["questions"], {
+            "created": [],
+            "updated": ["Portfolio/Beginner: Lesson 1 (Q1.0: correct_option)"],
+            "deleted": ["Portfolio/Beginner: Lesson 1 (Q1.1)"],
+        })
+        titles = Lesson.objects.filter(learning_goal="Portfolio", difficulty_level="Beginner").values_list("title", flat=True)
+        self.assertEqual(sorted(titles), ["Lesson 0", "Lesson 1", "Lesson 9"])
+        self.assertEqual(QuizQuestion.objects.get(question="Q1.0").correct_option, "B")
+        self.assertFalse(sync_curriculum(self.write(lessons)))
+
+    def test_other_tracks_and_unowned_quizzes_are_kept(self):
+        lesson = Lesson.objects.get(title="Building Your First Project")
+        QuizQuestion.objects.create(lesson=lesson, question="Written in the admin", option_a="a", option_b="b",
+                                    option_c="c", option_d="d", correct_option="A")
+        entry = {"slug": "building-your-first-project", "title": lesson.title,
+                 "description": lesson.description, "order": lesson.order}
+        sync_curriculum(self.write([entry]))
+
+        result = sync_curriculum(self.write([entry]))
+
+        self.assertFalse(result)
+        self.assertTrue(Lesson.objects.filter(learning_goal="School").exists())
+        self.assertTrue(QuizQuestion.objects.filter(question="Written in the admin").exists())
+
+    def test_dry_run_writes_nothing(self):
+        count = Lesson.objects.count()
+        result = sync_curriculum(self.write(self.lessons(2)), dry_run=True, prune=True)
+
+        self.assertEqual(len(result.changes["lessons"]["created"]), 2)
+        self.assertEqual(len(result.changes["lessons"]["deleted"]), 1)
+        self.assertEqual(Lesson.objects.count(), count)
+
+    def test_query_count_does_not_grow_with_the_curriculum(self):
+        def changed_sync(count):
+            Lesson.objects.filter(learning_goal="Portfolio").delete()
+            sync_curriculum(self.write(self.lessons(count)))
+            lessons = self.lessons(count + 1)
+            lessons[0]["description"] = "Rewritten"
+            lessons[1]["quiz"][0]["explanation"] = "Because"
+            del lessons[2]["quiz"][1]
+            del lessons[3]
+            curriculum = self.write(lessons)
+            with CaptureQueriesContext(connection) as queries:
+                sync_curriculum(curriculum, prune=True)
+            return len(queries)
+
+        self.assertEqual(changed_sync(5), changed_sync(40))
+
+    def test_invalid_files_are_rejected(self):
+        with self.assertRaises(CurriculumError):
+            self.write([{"slug": "no-order", "title": "No order", "description": ""}])
+        with self.assertRaises(CurriculumError):
+            self.write([{"slug": "typo", "title": "Typo", "order": 1, "descripton": ""}])
+        with self.assertRaises(CurriculumError):
+            self.write([{"title": "No slug", "order": 1}])
+        with self.assertRaises(CurriculumError):
+            self.write([{"slug": "same", "title": "One", "order": 1}, {"slug": "same", "title": "Two", "order": 2}])
+
+    def test_missing_lessons_are_only_reported_without_prune(self):
+        sync_curriculum(self.write(self.lessons(2)), prune=True)
+
+        result = sync_curriculum(self.write(self.lessons(1)))
+
+        self.assertEqual(result.changes["lessons"]["orphaned"], ["Portfolio/Beginner: Lesson 1"])
+        self.assertFalse(result)
+        self.assertTrue(Lesson.objects.filter(slug="lesson-1").exists())
+
+    def test_prune_keeps_lessons_learners_have_used(self):
+        sync_curriculum(self.write(self.lessons(4)), prune=True)
+        user = CustomUser.objects.create_user(username="student", password="Passw0rd!")
+        lesson1, lesson2 = Lesson.objects.get(slug="lesson-1"), Lesson.objects.get(slug="lesson-2")
+        StudySession.objects.create(user=user, lesson=lesson1, date=timezone.localdate(),
+                                    start_time=clock(9), end_time=clock(10))
+        complete_lesson(user, lesson2)
+
+        result = sync_curriculum(self.write(self.lessons(1)), prune=True)
+
+        self.assertEqual(result.changes["lessons"]["deleted"], ["Portfolio/Beginner: Lesson 3"])
+        self.assertEqual(result.changes["lessons"]["orphaned"], [
+            "Portfolio/Beginner: Lesson 1 (has sessions)",
+            "Portfolio/Beginner: Lesson 2 (has completions)",
+        ])
+        self.assertEqual(
+            sorted(Lesson.objects.filter(slug__startswith="lesson-").values_list("slug", flat=True)),
+            ["lesson-0", "lesson-1", "lesson-2"],
+        )
+        self.assertEqual(UserProgress.objects.get(user=user).completed_lessons.get(), lesson2)
+
+    def test_renamed_lesson_is_updated_in_place(self):
+        sync_curriculum(self.write(self.lessons(2)), prune=True)
+        lesson = Lesson.objects.get(slug="lesson-1")
+        user = CustomUser.objects.create_user(username="student", password="Passw0rd!")
+        complete_lesson(user, lesson)
+        lessons = self.lessons(2)
+        lessons[1]["title"] = "Lesson One"
+
+        result = sync_curriculum(self.write(lessons), prune=True)
+
+        self.assertEqual(result.changes["lessons"]["updated"], ["Portfolio/Beginner: Lesson One (title)"])
+        self.assertEqual(result.changes["lessons"]["deleted"], [])
+        self.assertEqual(Lesson.objects.get(pk=lesson.pk).title, "Lesson One")
+        self.assertEqual(QuizQuestion.objects.filter(lesson=lesson).count(), 2)
+        self.assertTrue(UserProgress.objects.get(user=user).completed_lessons.filter(pk=lesson.pk).exists())
+
+    def test_lessons_without_a_slug_are_adopted_by_title(self):
+        lesson = Lesson.objects.get(title="Building Your First Project")
+        self.assertIsNone(lesson.slug)
+        entry = {"slug": "first-project", "title": lesson.title, "description": lesson.description, "order": 1}
+
+        result = sync_curriculum(self.write([entry]))
+
+        self.assertEqual(result.changes["lessons"]["updated"], ["Portfolio/Beginner: Building Your First Project (slug)"])
+        self.assertEqual(Lesson.objects.get(pk=lesson.pk).slug, "first-project")
+
+    def test_command_needs_prune_to_delete(self):
+        sync_curriculum(self.write(self.lessons(2)), prune=True)
+        self.write(self.lessons(1))
+
+        out = StringIO()
+        call_command("sync_curriculum", f"--dir={self.directory.name}", stdout=out)
+        self.assertIn("? lesson Portfolio/Beginner: Lesson 1", out.getvalue())
+        self.assertIn("Use --prune", out.getvalue())
+        self.assertTrue(Lesson.objects.filter(slug="lesson-1").exists())
+
+        call_command("sync_curriculum", f"--dir={self.directory.name}", "--prune", stdout=StringIO())
+        self.assertFalse(Lesson.objects.filter(slug="lesson-1").exists())
+        with self.assertRaises(CurriculumError):
+            self.write(self.lessons(1), level="Expert")
+
+
+@override_settings(TOKEN_AUTH_SHARED_CACHE="default")
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        token_cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="student", password="Passw0rd!", learning_goal="School", difficulty_level="Beginner",
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.lesson = Lesson.objects.filter(learning_goal="School").first()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def check_completion(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("check-lesson-completion", args=[self.lesson.id]))
+        auth = [q for q in queries.captured_queries if "authtoken_token" in q["sql"]]
+        return response, len(auth)
+
+    def test_token_lookup_is_cached(self):
+        first, first_auth = self.check_completion()
+        second, second_auth = self.check_completion()
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        # A miss looks up the token's user before loading it, to read the version in between
+        self.assertEqual((first_auth, second_auth), (2, 0))
+
+    def test_shared_cache_serves_other_workers(self):
+        self.check_completion()
+        token_cache.clear()  # a worker that never saw the token
+
+        response, auth = self.check_completion()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(auth, 0)
+
+    def test_logout_revokes_the_cached_token(self):
+        self.check_completion()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse("logout")).status_code, 200)
+
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+        response, _ = self.check_completion()
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivation_revokes_the_cached_token(self):
+        self.check_completion()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        response, _ = self.check_completion()
+        self.assertEqual(response.status_code, 401)
+
+    def test_saves_that_change_nothing_cached_keep_the_entry(self):
+        self.check_completion()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=["last_login"])
+            self.user.save()
+
+        self.assertEqual(self.check_completion()[1], 0)
+
+    def test_password_and_profile_changes_drop_the_entry(self):
+        for change in (lambda: self.user.set_password("N3w-Passw0rd!"), lambda: setattr(self.user, "learning_goal", "Portfolio")):
+            self.check_completion()
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+                self.user.save()
+            self.assertEqual(self.check_completion()[1], 2)
+
+    def test_only_the_saved_users_entries_are_dropped(self):
+        other = CustomUser.objects.create_user(username="other", email="other@example.com", password="Passw0rd!")
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=other).key}")
+        other_client.get(reverse("check-lesson-completion", args=[self.lesson.id]))
+        self.check_completion()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(other_client.get(reverse("check-lesson-completion", args=[self.lesson.id])).status_code, 200)
+        self.assertFalse([q for q in queries.captured_queries if "authtoken_token" in q["sql"]])
+        self.assertEqual(self.check_completion()[0].status_code, 401)
+
+    def test_other_workers_drop_their_copy(self):
+        self.check_completion()
+        other_worker = TokenCache()
+        self.assertIsNotNone(other_worker.get(self.token.key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertIsNone(other_worker.get(self.token.key))
+
+    def test_revocation_during_a_miss_is_not_cached_under_the_new_version(self):
+        load = TokenAuthentication.authenticate_credentials
+
+        def load_then_revoke(auth, key):
+            loaded = load(auth, key)
+            # Deactivated and committed after the user was read
+            CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+            token_cache.forget_user(self.user.pk)
+            return loaded
+
+        with mock.patch.object(TokenAuthentication, "authenticate_credentials", autospec=True, side_effect=load_then_revoke):
+            self.assertEqual(self.check_completion()[0].status_code, 200)
+
+        self.assertEqual(self.check_completion()[0].status_code, 401)
+
+    def test_missing_version_fails_closed(self):
+        self.check_completion()
+        other_worker = TokenCache()
+        self.assertIsNotNone(other_worker.get(self.token.key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("logout"))
+        # Culled from the shared cache
+        caches["default"].delete(f"auth:user:{self.user.pk}:version")
+
+        self.assertIsNone(other_worker.get(self.token.key))
+        self.assertEqual(self.check_completion()[0].status_code, 401)
+
+    def test_bulk_deactivation_needs_an_explicit_forget(self):
+        self.check_completion()
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        # No post_save: the cached user is still active until the TTL
+        self.assertEqual(self.check_completion()[0].status_code, 200)
+
+        token_cache.forget_user(self.user.pk)
+        self.assertEqual(self.check_completion()[0].status_code, 401)
+
+    def test_hit_rate_is_reported(self):
+        metrics.reset()
+        for _ in range(4):
+            self.check_completion()
+
+        self.assertEqual(metrics.snapshot()["gauges"]["auth_cache.hit_rate"], 0.75)
+
+
+class ProgressUpdateTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="student", password="Passw0rd!", learning_goal="School", difficulty_level="Beginner",
+        )
+        self.lessons = list(Lesson.objects.filter(learning_goal="School", difficulty_level="Beginner"))
+
+    def test_stale_instances_do_not_lose_xp(self):
+        # Two requests that loaded the row before either of them wrote
+        first = UserProgress.objects.get(user=self.user)
+        second = UserProgress.objects.get(user=self.user)
+
+        first.add_xp(30, create_activity=False)
+        second.add_xp(40, create_activity=False)
+        self.assertEqual(second.live_xp, 70)
+
+        snapshot(lag=0)
+        progress = UserProgress.objects.get(user=self.user)
+        self.assertEqual(progress.xp, 70)
+        self.assertEqual(progress.level, 2)
+
+    def test_xp_award_only_inserts(self):
+        award_xp(self.user, 5)
+        with CaptureQueriesContext(connection) as queries:
+            award_xp(self.user, 5, create_activity=False)
+
+        writes = [q["sql"] for q in queries.captured_queries if q["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT INTO "accounts_xpledgerentry"'))
+
+    def test_level_up_is_recorded_once(self):
+        _, leveled_up = award_xp(self.user, 60, create_activity=False)
+        _, again = award_xp(self.user, 1, create_activity=False)
+        snapshot(lag=0)
+        snapshot(lag=0)
+
+        self.assertEqual((leveled_up, again), (True, False))
+        self.assertEqual(UserActivity.objects.filter(user=self.user, activity_type="level_up").count(), 1)
+
+    def test_complete_lesson_applies_every_delta_once(self):
+        progress = UserProgress.objects.get(user=self.user)
+        UserProgress.objects.filter(pk=progress.pk).update(
+            streak=4, last_active=timezone.localdate() - timedelta(days=1),
+        )
+
+        result = complete_lesson(self.user, self.lessons[0])
+        repeat = complete_lesson(self.user, self.lessons[0])
+        snapshot(lag=0)
+
+        progress.refresh_from_db()
+        self.assertTrue(result.newly_completed)
+        self.assertFalse(repeat.newly_completed)
+        self.assertEqual(result.streak_bonus, 50)
+        self.assertEqual((progress.xp, progress.streak, progress.lessons_completed), (75, 5, 1))
+        self.assertEqual(progress.level, 2)
+        entries = XpLedgerEntry.objects.filter(user=self.user).values_list("source", "source_id", "amount")
+        self.assertCountEqual(entries, [
+            (XpLedgerEntry.SOURCE_LESSON, self.lessons[0].pk, 25),
+            (XpLedgerEntry.SOURCE_STREAK, self.lessons[0].pk, 50),
+        ])
+
+    def test_complete_lesson_view(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        data = client.post(reverse("complete-lesson", args=[self.lessons[0].id])).json()
+        again = client.post(reverse("complete-lesson", args=[self.lessons[0].id])).json()
+
+        self.assertEqual(data["progress"]["xp"], 25)
+        self.assertEqual(data["lessons_completed"], 1)
+        self.assertEqual(again["message"], "Lesson already completed.")
+
+    def test_general_quiz_pays_each_improvement_once(self):
+        questions = [
+            QuizQuestion.objects.create(lesson=self.lessons[0], question=f"Q{i}", option_a="a", option_b="b",
+                                        option_c="c", option_d="d", correct_option="A", order=i)
+            for i in range(2)
+        ]
+        client = APIClient()
+        client.force_authenticate(self.user)
+        answers = {str(questions[0].id): "A", str(questions[1].id): "B"}
+
+        first = client.post(reverse("general-quiz-submit"), {"answers": answers}, format="json").json()
+        second = client.post(reverse("general-quiz-submit"), {"answers": answers}, format="json").json()
+
+        self.assertEqual((first["xp_earned"], second["xp_earned"]), (10, 0))
+        self.assertEqual(second["xp_total"], 10)
+        self.assertEqual(QuizAttempt.objects.get(user=self.user, quiz_type="general").best_score, 1)
+
+
+class ProgressConcurrencyTests(TransactionTestCase):
+    """
+    Hammers the same progress row from several threads. Needs row locks, or
+    SQLite's IMMEDIATE transactions on a file database (see settings.py).
+    """
+
+    THREADS = 8
+    AWARDS_PER_THREAD = 25
+
+    def setUp(self):
+        if not connection.features.has_select_for_update and connection.is_in_memory_db():
+            self.skipTest("threads cannot wait on each other's locks in an in-memory SQLite database")
+        self.user = CustomUser.objects.create_user(username="student", password="Passw0rd!")
+
+    def run_threads(self, work):
+        errors = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def run():
+            try:
+                barrier.wait()
+                work()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_no_lost_xp(self):
+        def work():
+            for _ in range(self.AWARDS_PER_THREAD):
+                award_xp(self.user, 3, create_activity=False)
+
+        self.run_threads(work)
+        snapshot(lag=0)
+
+        progress = UserProgress.objects.get(user=self.user)
+        self.assertEqual(progress.xp, 3 * self.THREADS * self.AWARDS_PER_THREAD)
+        self.assertEqual(progress.level, progress.calculate_level())
+        self.assertEqual(progress.xp, XpLedgerEntry.objects.filter(user=self.user).aggregate(total=Sum("amount"))["total"])
+        # One snapshot folded every award, so one level-up to the final level
+        level_ups = UserActivity.objects.filter(user=self.user, activity_type="level_up")
+        self.assertEqual(list(level_ups.values_list("level_achieved", flat=True)), [progress.level])
+
+    def test_same_lesson_from_many_tabs_counts_once(self):
+        # TransactionTestCase empties the tables, curriculum included
+        lesson = Lesson.objects.create(title="Loops", description="", learning_goal="School",
+                                       difficulty_level="Beginner", order=1)
+        self.run_threads(lambda: complete_lesson(self.user, lesson))
+        snapshot(lag=0)
+
+        progress = UserProgress.objects.get(user=self.user)
+        self.assertEqual((progress.xp, progress.lessons_completed), (25, 1))
+
+
+class XpLedgerTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(username=f"student{i}", email=f"student{i}@example.com", password="Passw0rd!")
+            for i in range(3)
+        ]
+
+    def award(self, user, amount):
+        return award_xp(user, amount, create_activity=False, source=XpLedgerEntry.SOURCE_LESSON_QUIZ, source_id=7)
+
+    def test_reads_include_entries_not_folded_yet(self):
+        self.award(self.users[0], 30)
+        self.award(self.users[0], 40)
+
+        progress = UserProgress.objects.get(user=self.users[0])
+        self.assertEqual((progress.xp, live_xp(progress)), (0, 70))
+        data = UserProgressSerializer(progress).data
+        self.assertEqual((data["xp"], data["level"]), (70, 2))
+
+    def test_snapshot_leaves_young_entries(self):
+        self.award(self.users[0], 30)
+
+        self.assertEqual(snapshot(lag=60), 0)
+        self.assertEqual(UserProgress.objects.get(user=self.users[0]).xp, 0)
+        self.assertEqual(snapshot(lag=0), 1)
+        self.assertEqual(UserProgress.objects.get(user=self.users[0]).xp, 30)
+
+    def test_snapshot_folds_in_batches(self):
+        for amount in (20, 40, 100):
+            for user in self.users:
+                self.award(user, amount)
+
+        while snapshot(batch_size=2, lag=0):
+            pass
+
+        rows = UserProgress.objects.filter(user__in=self.users).values_list("xp", "level", "xp_ledger_id")
+        last_id = XpLedgerEntry.objects.order_by("-id").values_list("id", flat=True)[0]
+        self.assertEqual(sorted(rows)[-1], (160, 3, last_id))
+        self.assertEqual({(xp, level) for xp, level, _ in rows}, {(160, 3)})
+        # Small batches see each user cross level 2 and level 3 separately
+        level_ups = UserActivity.objects.filter(activity_type="level_up").values_list("user_id", "level_achieved")
+        self.assertCountEqual(level_ups, [(user.pk, level) for user in self.users for level in (2, 3)])
+        for progress in UserProgress.objects.filter(user__in=self.users):
+            self.assertEqual(live_xp(progress), 160)
+
+    def test_reconcile_repairs_drift(self):
+        self.award(self.users[0], 30)
+        self.award(self.users[1], 50)
+        snapshot(lag=0)
+        self.award(self.users[0], 10)
+        UserProgress.objects.filter(user=self.users[1]).update(xp=999, level=9)
+
+        out = StringIO()
+        call_command("reconcile_xp", dry_run=True, stdout=out)
+        self.assertIn(f"user {self.users[1].pk}: showed 999 XP, ledger has 50 (-949)", out.getvalue())
+        self.assertEqual(UserProgress.objects.get(user=self.users[1]).xp, 999)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("reconcile_xp", user=[self.users[0].pk, self.users[1].pk], stdout=StringIO())
+        first, second = (UserProgress.objects.get(user=user) for user in self.users[:2])
+        self.assertEqual((second.xp, second.level), (50, 2))
+        # The entry past the cursor stays pending and is folded exactly once
+        self.assertEqual((first.xp, live_xp(first)), (30, 40))
+        snapshot(lag=0)
+        first.refresh_from_db()
+        self.assertEqual(first.xp, 40)
+
+
+    def test_snapshot_xp_command_folds_and_exits_with_once(self):
+        self.award(self.users[0], 60)
+
+        out = StringIO()
+        call_command("snapshot_xp", "--once", "--lag=0", stdout=out)
+
+        self.assertIn("Folded 1 ledger entry.", out.getvalue())
+        self.assertEqual(UserProgress.objects.get(user=self.users[0]).level, 2)
+
+    @override_settings(XP_SNAPSHOT_LAG_SECONDS=0, XP_SNAPSHOT_INTERVAL=60)
+    def test_awards_fold_due_entries_without_the_worker(self):
+        ledger._last_inline_fold = None
+        self.addCleanup(setattr, ledger, "_last_inline_fold", None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.award(self.users[0], 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.award(self.users[0], 10)
+
+        progress = UserProgress.objects.get(user=self.users[0])
+        # The second award came within the interval and waits for the next run
+        self.assertEqual((progress.xp, progress.level, live_xp(progress)), (60, 2, 70))
+        self.assertTrue(UserActivity.objects.filter(user=self.users[0], activity_type="level_up").exists())
+
+    @override_settings(XP_SNAPSHOT_LAG_SECONDS=0, XP_SNAPSHOT_INLINE_BATCH_SIZE=0)
+    def test_inline_fold_can_be_left_to_the_worker(self):
+        ledger._last_inline_fold = None
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.award(self.users[0], 60)
+
+        self.assertEqual(UserProgress.objects.get(user=self.users[0]).xp, 0)
+
+
+class LevelingTests(SimpleTestCase):
+    def test_curve_boundaries(self):
+        cases = {-5: 1, 0: 1, 49: 1, 50: 2, 149: 2, 150: 3, 2249: 9, 2250: 10, 2749: 10, 2750: 11}
+        for xp, level in cases.items():
+            self.assertEqual(level_for_xp(xp), level, xp)
+        # Past the precomputed table the last step continues
+        self.assertEqual(level_for_xp(2250 + 500 * 5000), 5010)
+
+    def test_level_progress(self):
+        self.assertEqual(level_progress(70), {"xp_in_level": 20, "xp_needed": 100, "next_level_xp": 150})
+        self.assertEqual(level_progress(2800), {"xp_in_level": 50, "xp_needed": 500, "next_level_xp": 3250})
+
+    def test_bulk_lookup_matches_single_lookup(self):
+        xps = [-5, 0, 1, 49, 50, 51, 1399, 1400, 2249, 2250, 2750, THRESHOLDS[-1] - 1, THRESHOLDS[-1], 10 ** 6, 10 ** 9]
+        expected = [level_for_xp(xp) for xp in xps]
+
+        self.assertIsNotNone(leveling.numpy)
+        vectorized = levels_for_xp(xps)
+        with mock.patch.object(leveling, "numpy", None):
+            bisected = levels_for_xp(xps)
+
+        self.assertEqual(vectorized, expected)
+        self.assertEqual(bisected, expected)
+        self.assertEqual(levels_for_xp([]), [])
+
+
+class RecomputeLevelsTests(TestCase):
+    def test_stored_levels_follow_the_curve(self):
+        users = [
+            CustomUser.objects.create_user(username=f"student{i}", email=f"student{i}@example.com", password="Passw0rd!")
+            for i in range(3)
+        ]
+        for user, (xp, level) in zip(users, [(0, 1), (320, 1), (40, 7)]):
+            UserProgress.objects.filter(user=user).update(xp=xp, level=level)
+
+        call_command("recompute_levels", chunk_size=2, stdout=StringIO())
+
+        levels = dict(UserProgress.objects.filter(user__in=users).values_list("xp", "level"))
+        self.assertEqual(levels, {0: 1, 320: 4, 40: 1})
+        progress = UserProgress.objects.get(xp=320)
+        data = UserProgressSerializer(progress).data
+        self.assertEqual(data["level"], 4)
+        self.assertEqual(data["level_progress"]["next_level_xp"], 500)
@@ -12,11 +12,14 @@ urlpatterns = [
     path("logout/", views.LogoutView.as_view(), name="logout"),
     path("profile/", views.ProfileView.as_view(), name="profile"),
     path("lessons/", views.LessonListView.as_view(), name="lesson-list"),
+    path("lessons/index/", views.lesson_index, name="lesson-index"),
     path("lessons/<int:pk>/", views.LessonDetailView.as_view(), name="lesson-detail"),
     path("dashboard/", views.DashboardView.as_view(), name="dashboard"),
     path("study-sessions/", views.StudySessionListCreateView.as_view(), name="study-sessions"),
     path("study-sessions/<int:pk>/", views.StudySessionDetailView.as_view(), name="study-session-detail"),
     path("run-code/", views.RunCodeView.as_view(), name="run-code"),
+    path("run-code/jobs/<uuid:job_id>/", views.CodeRunJobView.as_view(), name="run-code-job"),
+    path("run-code/jobs/<uuid:job_id>/stream/", views.CodeRunJobStreamView.as_view(), name="run-code-job-stream"),
     path("all-lessons/", views.all_lessons, name="all-lessons"),
     path("recommended-lessons/", views.AllLessonsView.as_view(), name="recommended-lessons"),
     path("complete_lesson/", views.complete_lesson, name="complete_lesson"),
@@ -28,6 +31,7 @@ urlpatterns = [
     path("lessons/<int:pk>/solution/", LessonSolutionView.as_view(), name="lesson-solution"),
     path("lessons/<int:lesson_id>/quiz/", LessonQuizView.as_view(), name="lesson-quiz"),
     path("lessons/<int:lesson_id>/submit-quiz/", LessonQuizSubmitView.as_view(), name="submit-quiz"),
+    path("lessons/<int:lesson_id>/grade/", views.LessonGradeView.as_view(), name="lesson-grade"),
 
     # General quiz endpoints (not tied to a lesson)
     path("quiz/", GeneralQuizView.as_view(), name="general-quiz"),
@@ -38,4 +42,5 @@ urlpatterns = [
     path("quiz-questions/submit/", GeneralQuizSubmitView.as_view(), name="quiz-general-submit"),
     path('accounts/dashboard/', DashboardView.as_view(), name='accounts-dashboard'),
     path('activities/', ActivityListView.as_view(), name='activity-list'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 ]
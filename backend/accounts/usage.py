@@ -0,0 +1,190 @@
+"""
+Per-lesson resource accounting for sandbox runs.
+
+Every executed run reports CPU time, wall time, peak RSS and output size.
+They are aggregated in memory and folded into one LessonRunStats row per
+lesson and day every USAGE_FLUSH_SECONDS by a background thread, so a run
+costs no extra query and no request waits for the write. A batch that fails
+to save is kept for the next flush.
+Distributions are kept as sparse log-scale histograms (buckets ~19% wide),
+which is enough to read p50/p95/p99 for sizing the execution tier.
+"""
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .metrics import metrics
+from .models import Lesson, LessonRunStats
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("cpu_ms", "wall_ms", "max_rss_kb", "output_bytes")
+BUCKETS_PER_DOUBLING = 4
+
+
+def bucket_for(value):
+    if value <= 1:
+        return 0
+    return math.ceil(BUCKETS_PER_DOUBLING * math.log2(value))
+
+
+def bucket_upper_bound(bucket):
+    return round(2 ** (bucket / BUCKETS_PER_DOUBLING))
+
+
+def merge_histogram(into, other):
+    for bucket, count in other.items():
+        into[str(bucket)] = into.get(str(bucket), 0) + count
+    return into
+
+
+def percentile(histogram, fraction):
+    """Upper bound of the bucket holding the given fraction of samples, or None."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    threshold = fraction * total
+    seen = 0
+    for bucket in sorted(histogram, key=int):
+        seen += histogram[bucket]
+        if seen >= threshold:
+            return bucket_upper_bound(int(bucket))
+    return None
+
+
+def usage_values(usage):
+    """The recorded metrics of one run; CPU/RSS are missing for the subprocess fallback."""
+    values = {
+        "wall_ms": usage["wall"] * 1000,
+        "output_bytes": usage["output_bytes"],
+    }
+    if usage.get("cpu_user") is not None:
+        values["cpu_ms"] = (usage["cpu_user"] + usage["cpu_sys"]) * 1000
+    if usage.get("max_rss_kb") is not None:
+        values["max_rss_kb"] = usage["max_rss_kb"]
+    return values
+
+
+def _empty_aggregate():
+    return {
+        "runs": 0, "timeouts": 0, "truncated": 0,
+        "cpu_ms_total": 0, "wall_ms_total": 0, "output_bytes_total": 0, "max_rss_kb_peak": 0,
+        "histograms": {metric: {} for metric in METRICS},
+    }
+
+
+def merge_aggregate(into, other):
+    for field in ("runs", "timeouts", "truncated", "cpu_ms_total", "wall_ms_total", "output_bytes_total"):
+        into[field] += other[field]
+    into["max_rss_kb_peak"] = max(into["max_rss_kb_peak"], other["max_rss_kb_peak"])
+    for metric, histogram in other["histograms"].items():
+        merge_histogram(into["histograms"].setdefault(metric, {}), histogram)
+    return into
+
+
+class UsageRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(_empty_aggregate)
+        self._flusher = None
+
+    def record(self, lesson_id, result):
+        usage = result.get("usage")
+        if not usage:
+            return
+        values = usage_values(usage)
+        metrics.observe("code_runner.cpu_ms", values.get("cpu_ms", 0))
+        metrics.observe("code_runner.max_rss_kb", values.get("max_rss_kb", 0))
+        metrics.observe("code_runner.output_bytes", values["output_bytes"])
+
+        with self._lock:
+            aggregate = self._pending[(lesson_id, timezone.localdate())]
+            aggregate["runs"] += 1
+            aggregate["timeouts"] += bool(result["timed_out"])
+            aggregate["truncated"] += bool(result.get("truncated"))
+            aggregate["cpu_ms_total"] += round(values.get("cpu_ms", 0))
+            aggregate["wall_ms_total"] += round(values["wall_ms"])
+            aggregate["output_bytes_total"] += values["output_bytes"]
+            aggregate["max_rss_kb_peak"] = max(aggregate["max_rss_kb_peak"], values.get("max_rss_kb", 0))
+            for metric, value in values.items():
+                histogram = aggregate["histograms"][metric]
+                bucket = str(bucket_for(value))
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+            self._start_flusher()
+
+    def _start_flusher(self):
+        # Started with the first run rather than at import, so it also runs in forked gunicorn workers
+        if not settings.USAGE_FLUSH_SECONDS or (self._flusher is not None and self._flusher.is_alive()):
+            return
+        self._flusher = threading.Thread(target=self._flush_periodically, name="usage-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_periodically(self):
+        while settings.USAGE_FLUSH_SECONDS:
+            time.sleep(settings.USAGE_FLUSH_SECONDS)
+            self.flush()
+            # No request cycle ever closes this thread's connection
+            connections.close_all()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(_empty_aggregate)
+        if not pending:
+            return
+        try:
+            save_aggregates(pending)
+        except Exception:
+            logger.exception("Could not save lesson run statistics, keeping them for the next flush")
+            with self._lock:
+                for key, aggregate in pending.items():
+                    merge_aggregate(self._pending[key], aggregate)
+
+
+def save_aggregates(pending):
+    """Fold ``{(lesson_id, day): aggregate}`` into LessonRunStats."""
+    existing_lessons = set(Lesson.objects.filter(id__in={lesson_id for lesson_id, _ in pending}).values_list("id", flat=True))
+    pending = {key: aggregate for key, aggregate in pending.items() if key[0] in existing_lessons}
+    if not pending:
+        return
+    fields = ("runs", "timeouts", "truncated", "cpu_ms_total", "wall_ms_total", "output_bytes_total")
+    with transaction.atomic():
+        # Another process may create the same rows concurrently; conflicts are
+        # skipped and the rows are then updated under a lock like any other
+        LessonRunStats.objects.bulk_create(
+            [LessonRunStats(lesson_id=lesson_id, day=day) for lesson_id, day in pending], ignore_conflicts=True
+        )
+        rows = LessonRunStats.objects.select_for_update().filter(
+            lesson_id__in={lesson_id for lesson_id, _ in pending}, day__in={day for _, day in pending},
+        ).order_by("pk")
+        changed = []
+        for stats in rows:
+            aggregate = pending.get((stats.lesson_id, stats.day))
+            if aggregate is None:
+                continue
+            for field in fields:
+                setattr(stats, field, getattr(stats, field) + aggregate[field])
+            stats.max_rss_kb_peak = max(stats.max_rss_kb_peak, aggregate["max_rss_kb_peak"])
+            for metric, histogram in aggregate["histograms"].items():
+                stats.histograms[metric] = merge_histogram(stats.histograms.get(metric, {}), histogram)
+            changed.append(stats)
+        LessonRunStats.objects.bulk_update(changed, [*fields, "max_rss_kb_peak", "histograms"])
+
+
+recorder = UsageRecorder()
+atexit.register(recorder.flush)
+
+
+def record_usage(lesson_id, result):
+    try:
+        lesson_id = int(lesson_id)
+    except (TypeError, ValueError):
+        # lesson_id comes from the client and may be anything
+        return
+    recorder.record(lesson_id, result)
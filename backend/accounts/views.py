@@ -1,31 +1,50 @@
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate, get_user_model
 from rest_framework.generics import RetrieveUpdateAPIView
 from rest_framework.decorators import api_view, permission_classes
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.db import models
+from django.db import models, transaction
 from .serializers import (
     RegisterSerializer, LoginSerializer, UserProgressSerializer, 
     LessonSerializer, ProfileSerializer, StudySessionSerializer, LessonWithSolutionSerializer,
     QuizQuestionSerializer, QuizSubmitSerializer, UserActivitySerializer
 )
-from .models import CustomUser, UserProgress, Lesson, StudySession, QuizQuestion, QuizAttempt, UserActivity
-import subprocess
-import sys
-from django.http import JsonResponse
+from .models import CustomUser, UserProgress, Lesson, StudySession, QuizQuestion, QuizAttempt, UserActivity, CodeRunJob, XpLedgerEntry
+from . import dashboard_cache
+from .admission import AdmissionRejected, admission, admit_stream, update_gauges
+from .batching import get_gateway
+from .catalog import catalog
+from .feedback_cache import cached_feedback, fingerprint, store_feedback
+from .grading import grade, lesson_cases
+from .hints import analyze
+from .inference import InferenceError, InferenceUnavailable, get_client
+from .jobs import fail_if_stale, submit_job, job_payload, unfinished_jobs
+from .ledger import live_xp, with_live_xp
+from .leveling import level_for_xp
+from .metrics import metrics
+from .pagination import KeysetPagination
+from .progress import award_xp, complete_lesson as record_lesson_completion
+from .sandbox import run_code, stream_code, PoolSaturated
+from .streaming import EventStreamRenderer, sse_event, sse_response, sse_retry
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 from django.views import View
 from django.conf import settings
 import os
-import requests
 from dotenv import load_dotenv
 import json
 import random
 import logging
+import time
+from datetime import timedelta
 
 load_dotenv()  # Load environment variables
 
@@ -76,8 +95,7 @@ class RegisterView(APIView):
                 )
                 
                 # Give initial XP
-                progress, _ = UserProgress.objects.get_or_create(user=user)
-                progress.add_xp(10)
+                award_xp(user, 10, source=XpLedgerEntry.SOURCE_SIGNUP)
                 
                 return Response({
                     "token": token.key,
@@ -132,9 +150,6 @@ class ProfileView(RetrieveUpdateAPIView):
         serializer = self.get_serializer(user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            if "learning_goal" in request.data or "difficulty_level" in request.data:
-                user.refresh_from_db()
-                Lesson.create_default_lessons(user)
             return Response(serializer.data, status=200)
         return Response(serializer.errors, status=400)
 
@@ -142,9 +157,20 @@ class ProfileView(RetrieveUpdateAPIView):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def all_lessons(request):
+    """GET /all-lessons/?fields=id,title  (?fields= is optional)"""
+    fields = requested_fields(request, LessonSerializer.Meta.fields)
     lessons = Lesson.objects.all().order_by("order")
-    serializer = LessonSerializer(lessons, many=True)
-    return Response(serializer.data)
+    payload = catalog.get_or_build(("all-lessons", fields), lambda: render_lessons(lessons, fields))
+    return HttpResponse(payload, content_type="application/json")
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def lesson_index(request):
+    """GET /lessons/index/ - every lesson without its content, for pickers and menus"""
+    lessons = Lesson.objects.all().order_by("order")
+    payload = catalog.get_or_build("lesson-index", lambda: render_lessons(lessons, LESSON_INDEX_FIELDS))
+    return HttpResponse(payload, content_type="application/json")
 
 
 @api_view(['POST'])
@@ -154,30 +180,17 @@ def complete_lesson(request, lesson_id):
 
     try:
         lesson = Lesson.objects.get(id=lesson_id)
-        progress, created = UserProgress.objects.get_or_create(user=user)
+        # Completion, streak and XP (incl. streak milestone bonus) in one locked UPDATE
+        result = record_lesson_completion(user, lesson)
+        progress = result.progress
 
-        if lesson in progress.completed_lessons.all():
+        if not result.newly_completed:
             return Response({
                 "message": "Lesson already completed.",
                 "lessons_completed": progress.lessons_completed,
                 "streak": progress.streak,
             }, status=status.HTTP_200_OK)
 
-        progress.completed_lessons.add(lesson)
-        progress.lessons_completed = progress.completed_lessons.count()
-
-        from datetime import date, timedelta
-        today = date.today()
-        old_streak = progress.streak
-
-        if progress.last_active == today - timedelta(days=1):
-            progress.streak += 1
-        elif progress.last_active != today:
-            progress.streak = 1
-
-        progress.last_active = today
-        progress.save()
-
         # Create lesson completion activity
         UserActivity.create_activity(
             user=user,
@@ -188,27 +201,22 @@ def complete_lesson(request, lesson_id):
             lesson=lesson
         )
 
-        # Award XP for lesson completion  
-        leveled_up = progress.add_xp(25, create_activity=False)  # Don't create separate XP activity
-
         # Check for streak milestones
-        if progress.streak > old_streak and progress.streak % 5 == 0:
-            streak_xp = progress.streak * 10
+        if result.streak_bonus:
             UserActivity.create_activity(
                 user=user,
                 activity_type='streak_milestone',
                 title=f"🔥 {progress.streak}-Day Streak!",
                 description=f"Maintained {progress.streak} days of consistent learning",
-                xp_earned=streak_xp,
+                xp_earned=result.streak_bonus,
                 streak_count=progress.streak
             )
-            progress.add_xp(streak_xp, create_activity=False)  # Don't create separate XP activity
 
         return Response({
             "message": "Lesson marked as completed.",
             "lessons_completed": progress.lessons_completed,
             "streak": progress.streak,
-            "leveled_up": leveled_up,
+            "leveled_up": result.leveled_up,
             "progress": UserProgressSerializer(progress).data
         }, status=status.HTTP_200_OK)
 
@@ -283,19 +291,39 @@ class LessonListView(generics.ListAPIView):
         ).order_by("order")
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        lessons_data = [
-            {
-                "title": lesson.title,
-                "description": lesson.description,
-                "step1_content": lesson.step1_content,
-                "step2_content": lesson.step2_content,
-                "step3_challenge": lesson.step3_challenge,
-                "code_snippet": lesson.code_snippet,
-            }
-            for lesson in queryset
-        ]
-        return Response(lessons_data, status=status.HTTP_200_OK)
+        user = request.user
+        if not user.learning_goal or not user.difficulty_level:
+            return Response([], status=status.HTTP_200_OK)
+
+        fields = requested_fields(request, LESSON_SUMMARY_FIELDS)
+        key = ("lessons", user.learning_goal.strip(), user.difficulty_level.strip(), fields)
+        payload = catalog.get_or_build(key, lambda: render_lessons(self.get_queryset(), fields))
+        return HttpResponse(payload, content_type="application/json")
+
+
+# Lesson lists without solutions (lessons/, recommended-lessons/)
+LESSON_SUMMARY_FIELDS = ("title", "description", "step1_content", "step2_content", "step3_challenge", "code_snippet")
+LESSON_INDEX_FIELDS = ("id", "title", "order", "learning_goal", "difficulty_level")
+
+
+def requested_fields(request, available):
+    """
+    The fields named in ``?fields=a,b``, in the order of ``available``, or all
+    of ``available`` without the parameter. Unknown names are a 400.
+    """
+    raw = request.query_params.get("fields")
+    if not raw:
+        return tuple(available)
+    requested = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = requested - set(available)
+    if unknown:
+        raise ValidationError({"fields": [f"Unknown field(s): {', '.join(sorted(unknown))}."]})
+    return tuple(name for name in available if name in requested)
+
+
+def render_lessons(queryset, fields):
+    # values() selects only these columns; they are all plain model fields
+    return JSONRenderer().render(list(queryset.values(*fields)))
 
 
 class AllLessonsView(generics.ListAPIView):
@@ -306,27 +334,28 @@ class AllLessonsView(generics.ListAPIView):
         return Lesson.objects.all().order_by("order")
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        lessons_data = [
-            {
-                "title": lesson.title,
-                "description": lesson.description,
-                "step1_content": lesson.step1_content,
-                "step2_content": lesson.step2_content,
-                "step3_challenge": lesson.step3_challenge,
-                "code_snippet": lesson.code_snippet,
-            }
-            for lesson in queryset
-        ]
-        return Response(lessons_data, status=status.HTTP_200_OK)
+        fields = requested_fields(request, LESSON_SUMMARY_FIELDS)
+        payload = catalog.get_or_build(("recommended-lessons", fields), lambda: render_lessons(self.get_queryset(), fields))
+        return HttpResponse(payload, content_type="application/json")
 
 
 class DashboardView(APIView):
+    """
+    Assembled from a fixed number of queries (progress with its completed
+    count, current lesson, recommendations, windowed study sessions and
+    recent activities) however much history the user has, and cached per
+    user as rendered JSON until one of its inputs changes.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        progress, _ = UserProgress.objects.get_or_create(user=user)
+        payload = dashboard_cache.get_or_build(request.user.pk, lambda: JSONRenderer().render(self.build(request.user)))
+        return HttpResponse(payload, content_type="application/json")
+
+    def build(self, user):
+        progress, _ = with_live_xp(UserProgress.objects.annotate(
+            completed_lessons_count=models.Count("completed_lessons")
+        )).get_or_create(user=user)
 
         available_lessons = Lesson.objects.filter(
             learning_goal=user.learning_goal,
@@ -334,19 +363,30 @@ class DashboardView(APIView):
         ).order_by("order")
 
         current_lesson = available_lessons.first()
-        study_sessions = StudySession.objects.filter(user=user)
-        recommended_lessons = available_lessons.exclude(id__in=progress.completed_lessons.all())[:3]
-        
+        completed = UserProgress.completed_lessons.through.objects.filter(
+            userprogress_id=progress.id, lesson_id=models.OuterRef("pk")
+        )
+        recommended_lessons = available_lessons.exclude(models.Exists(completed))[:3]
+
+        today = timezone.localdate()
+        study_sessions = StudySession.objects.filter(
+            user=user,
+            date__gte=today - timedelta(days=settings.DASHBOARD_SESSION_PAST_DAYS),
+            date__lte=today + timedelta(days=settings.DASHBOARD_SESSION_FUTURE_DAYS),
+        ).select_related("lesson").only(
+            "id", "lesson__title", "date", "start_time", "end_time"
+        ).order_by("date", "start_time")[:settings.DASHBOARD_SESSION_LIMIT]
+
         # Get recent activities
         recent_activities = UserActivity.objects.filter(user=user)[:5]
 
-        return Response({
+        return {
             "current_lesson": LessonSerializer(current_lesson).data if current_lesson else None,
             "recommended_lessons": LessonSerializer(recommended_lessons, many=True).data,
             "study_sessions": StudySessionSerializer(study_sessions, many=True).data,
             "progress": UserProgressSerializer(progress).data,
             "recent_activities": UserActivitySerializer(recent_activities, many=True).data,
-        })
+        }
 
 
 class StudySessionListCreateView(generics.ListCreateAPIView):
@@ -388,6 +428,7 @@ class StudySessionDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 class RunCodeView(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
 
     def post(self, request):
         code = request.data.get("code", "").strip()
@@ -396,28 +437,129 @@ class RunCodeView(APIView):
         if not code or not lesson_id:
             return Response({"error": "Missing code or lesson_id."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            result = subprocess.run(
-                [sys.executable, "-c", code],
-                capture_output=True, text=True, timeout=5
-            )
-
-            output = result.stdout if result.stdout else result.stderr
+        mode = request.data.get("mode") or ("async" if settings.CODE_RUNNER_ASYNC_JOBS else "sync")
+        if mode == "stream":
+            return sse_response(admit_stream(request.user, "run_code", self.stream_events(code, lesson_id)))
+        if mode == "async":
+            # The executor tier bounds execution itself; here only cap how much a user can queue
+            if unfinished_jobs(request.user) >= settings.ADMISSION_LIMITS["run_code"]["per_user"]:
+                raise AdmissionRejected(wait=1)
+            job = submit_job(request.user, code, lesson_id)
+            return Response({
+                "job_id": str(job.id),
+                "status": job.status,
+                "poll_url": reverse("run-code-job", kwargs={"job_id": job.id}),
+                "stream_url": reverse("run-code-job-stream", kwargs={"job_id": job.id}),
+            }, status=status.HTTP_202_ACCEPTED)
 
-            return JsonResponse({
-                "output": output.strip(),
-                "status_code": result.returncode
-            }, status=status.HTTP_200_OK)
+        with admission(request.user, "run_code"):
+            try:
+                result = run_code(code, lesson_id=lesson_id)
+            except PoolSaturated as e:
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except Exception as e:
+                return Response({"error": f"Execution failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        except subprocess.TimeoutExpired:
+        if result["timed_out"]:
             return Response({"error": "Execution timeout exceeded."}, status=status.HTTP_408_REQUEST_TIMEOUT)
+
+        return JsonResponse(self.result_payload(result), status=status.HTTP_200_OK)
+
+    @staticmethod
+    def result_payload(result):
+        output = result["stdout"] if result["stdout"] else result["stderr"]
+        if result["truncated"]:
+            output = output.rstrip() + "\n[Output truncated]"
+        return {
+            "output": output.strip(),
+            "status_code": result["returncode"],
+            "cached": result["cached"],
+            "usage": result["usage"],
+        }
+
+    def stream_events(self, code, lesson_id):
+        """
+        SSE for "mode": "stream": "stdout"/"stderr" events as output is
+        printed, then a "result" event shaped like the synchronous response.
+        """
+        try:
+            for stream, data in stream_code(code, lesson_id=lesson_id):
+                if stream != "result":
+                    yield sse_event(stream, {"data": data})
+                elif data["timed_out"]:
+                    yield sse_event("error", {"error": "Execution timeout exceeded."})
+                else:
+                    yield sse_event("result", self.result_payload(data))
+        except PoolSaturated as e:
+            yield sse_event("error", {"error": str(e)})
         except Exception as e:
-            return Response({"error": f"Execution failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            yield sse_event("error", {"error": f"Execution failed: {str(e)}"})
+
+class LessonGradeView(APIView):
+    """
+    POST /lessons/<lesson_id>/grade/
+      body: {"code": "..."}
+    Runs the code against every test case of the lesson and returns per-case results.
+    Grading shares the run-code admission slots, it takes the same sandbox capacity.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, lesson_id):
+        code = request.data.get("code", "").strip()
+        if not code:
+            return Response({"error": "No code provided."}, status=status.HTTP_400_BAD_REQUEST)
+
+        lesson = get_object_or_404(Lesson.objects.prefetch_related("test_cases"), id=lesson_id)
+        cases = lesson_cases(lesson)
+        if not cases:
+            return Response({"error": "This lesson has no expected output to grade against."}, status=status.HTTP_404_NOT_FOUND)
+
+        with admission(request.user, "run_code"):
+            try:
+                result = grade(code, cases)
+            except PoolSaturated as e:
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except Exception as e:
+                return Response({"error": f"Grading failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class CodeRunJobView(APIView):
+    """
+    GET /run-code/jobs/<job_id>/  →  current state of an async run, including the result once finished.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = fail_if_stale(get_object_or_404(CodeRunJob, id=job_id, user=request.user))
+        response = Response(job_payload(job), status=status.HTTP_200_OK)
+        if not job.is_finished:
+            response["Retry-After"] = str(settings.CODE_RUNNER_JOB_POLL_INTERVAL)
+        return response
+
+
+class CodeRunJobStreamView(APIView):
+    """
+    GET /run-code/jobs/<job_id>/stream/  →  Server-Sent Events: the final "result" event
+    (same payload as the poll endpoint) once the job has finished, otherwise one "status"
+    event and a "retry" hint. The response always ends right away so no web worker is held
+    while the job runs; EventSource reconnects by itself after the hinted delay.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+
+    def get(self, request, job_id):
+        job = fail_if_stale(get_object_or_404(CodeRunJob, id=job_id, user=request.user))
+        if job.is_finished:
+            return sse_response(iter([sse_event("result", job_payload(job))]))
 
-@receiver(post_save, sender=CustomUser)
-def assign_lessons_on_signup(sender, instance, created, **kwargs):
-    if created or (instance.learning_goal and instance.difficulty_level):
-        Lesson.create_default_lessons(instance)
+        response = sse_response(iter([
+            sse_retry(settings.CODE_RUNNER_JOB_POLL_INTERVAL),
+            sse_event("status", {"job_id": str(job.id), "status": job.status}),
+        ]))
+        response["Retry-After"] = str(settings.CODE_RUNNER_JOB_POLL_INTERVAL)
+        return response
 
 
 class LogoutView(APIView):
@@ -447,7 +589,15 @@ class CreateSuperUserView(View):
 
 
 class CodeFeedbackView(APIView):
+    """
+    POST /ai-feedback/   body: {"code": ..., "lesson_id": optional, "escalate": optional, "mode": optional}
+    Answers with instant rule-based hints; the remote model is only asked
+    when no rule fires or the student sets "escalate" to get more feedback.
+    With "mode": "stream" the answer is sent as Server-Sent Events and the
+    model's tokens are relayed as they are generated.
+    """
     permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
 
     def post(self, request):
         code = request.data.get("code", "").strip()
@@ -455,23 +605,84 @@ class CodeFeedbackView(APIView):
         if not code:
             return Response({"error": "No code provided."}, status=status.HTTP_400_BAD_REQUEST)
 
-        HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
-        API_URL = "https://api-inference.huggingface.co/models/bigcode/starcoder"
-
-        headers = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"}
-        payload = {"inputs": f"Review this Python code and suggest improvements:\n{code}"}
-
+        lesson_id = request.data.get("lesson_id")
         try:
-            response = requests.post(API_URL, headers=headers, json=payload)
-            feedback = response.json()
+            lesson_id = int(lesson_id) if lesson_id not in (None, "") else None
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid lesson_id."}, status=status.HTTP_400_BAD_REQUEST)
+        escalate = str(request.data.get("escalate", "")).lower() in ("1", "true", "yes")
+
+        expected_output = None
+        if lesson_id is not None:
+            expected_output = Lesson.objects.filter(id=lesson_id).values_list("expected_output", flat=True).first()
+
+        started = time.monotonic()
+        hints = analyze(code, expected_output)
+        metrics.observe("feedback.hints_seconds", time.monotonic() - started)
+
+        key = fingerprint(code, lesson_id)
+        if hints and not escalate:
+            metrics.incr("feedback.answered_by_rules")
+            answer = {"hints": hints, "feedback": None, "source": "rules", "cached": False}
+        else:
+            # Repeat submissions are answered from the cache without an admission slot
+            feedback = cached_feedback(key)
+            answer = None
+            if feedback is not None:
+                answer = {"hints": hints, "feedback": feedback, "source": "cache", "cached": True}
 
-            if "error" in feedback:
-                return Response({"error": "AI feedback failed"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        prompt = f"Review this Python code and suggest improvements:\n{code}"
 
-            return Response({"feedback": feedback}, status=status.HTTP_200_OK)
+        if request.data.get("mode") == "stream":
+            if answer is not None:
+                return sse_response(iter([sse_event("hints", {"hints": hints}), sse_event("result", answer)]))
+            events = self.stream_events(request.user, key, code, lesson_id, prompt, hints)
+            return sse_response(admit_stream(request.user, "ai_feedback", events))
 
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if answer is not None:
+            return Response(answer)
+
+        with admission(request.user, "ai_feedback"):
+            try:
+                feedback = get_gateway().generate(prompt)
+            except InferenceUnavailable as e:
+                return Response({"error": str(e), "hints": hints}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except InferenceError:
+                return Response({"error": "AI feedback failed", "hints": hints}, status=status.HTTP_502_BAD_GATEWAY)
+
+        store_feedback(key, request.user, code, lesson_id, feedback)
+        return Response({"hints": hints, "feedback": feedback, "source": "model", "cached": False})
+
+    def stream_events(self, user, key, code, lesson_id, prompt, hints):
+        """
+        SSE for "mode": "stream": a "hints" event right away, a "token" event
+        per generated piece of text, then a "result" event shaped like the
+        non-streaming response. If the client goes away the generator is
+        closed, which closes the upstream connection and stops generation.
+        """
+        yield sse_event("hints", {"hints": hints})
+
+        tokens = get_client().stream(prompt)
+        pieces = []
+        try:
+            for text in tokens:
+                pieces.append(text)
+                yield sse_event("token", {"text": text})
+        except GeneratorExit:
+            metrics.incr("feedback.streams_cancelled")
+            raise
+        except InferenceUnavailable as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        except InferenceError:
+            yield sse_event("error", {"error": "AI feedback failed"})
+            return
+        finally:
+            tokens.close()
+
+        feedback = [{"generated_text": "".join(pieces)}]
+        store_feedback(key, user, code, lesson_id, feedback)
+        yield sse_event("result", {"hints": hints, "feedback": feedback, "source": "model", "cached": False})
 
 
 class LessonSolutionView(generics.RetrieveAPIView):
@@ -529,8 +740,7 @@ class LessonQuizSubmitView(APIView):
 
         # Award XP
         xp_earned = correct * 10
-        progress, _ = UserProgress.objects.get_or_create(user=request.user)
-        leveled_up = progress.add_xp(xp_earned)
+        progress, leveled_up = award_xp(request.user, xp_earned, source=XpLedgerEntry.SOURCE_LESSON_QUIZ, source_id=lesson_id)
 
         # Create quiz activity - ONLY ONE ACTIVITY, NOT TWO
         lesson = Lesson.objects.get(id=lesson_id)
@@ -563,8 +773,8 @@ class LessonQuizSubmitView(APIView):
             "correct": correct,
             "score_percentage": score_percentage,
             "xp_earned": xp_earned,
-            "xp_total": progress.xp,
-            "level": progress.level,
+            "xp_total": progress.live_xp,
+            "level": level_for_xp(progress.live_xp),
             "leveled_up": leveled_up,
             "feedback": feedback
         }, 200)
@@ -610,39 +820,41 @@ class GeneralQuizSubmitView(APIView):
         current_score = correct
         score_percentage = int((current_score / total_questions) * 100)  # Add this line
 
-        # Get or create quiz attempt record
-        quiz_attempt, created = QuizAttempt.objects.get_or_create(
-            user=request.user,
-            quiz_type="general",
-            learning_goal=request.user.learning_goal,
-            difficulty_level=request.user.difficulty_level,
-            defaults={
-                'best_score': 0,
-                'total_questions': 0,
-                'max_xp_earned': 0
-            }
-        )
+        with transaction.atomic():
+            # Locked so two submissions cannot both be paid for the same improvement
+            quiz_attempt, created = QuizAttempt.objects.select_for_update().get_or_create(
+                user=request.user,
+                quiz_type="general",
+                learning_goal=request.user.learning_goal,
+                difficulty_level=request.user.difficulty_level,
+                defaults={
+                    'best_score': 0,
+                    'total_questions': 0,
+                    'max_xp_earned': 0
+                }
+            )
 
-        # Calculate XP to award
-        xp_to_award = 0
-        if current_score > quiz_attempt.best_score:
-            # They improved! Award XP for the improvement
-            previous_max_xp = quiz_attempt.best_score * 10
-            new_max_xp = current_score * 10
-            xp_to_award = new_max_xp - previous_max_xp
-            
-            # Update their best score
-            quiz_attempt.best_score = current_score
-            quiz_attempt.max_xp_earned = new_max_xp
-            quiz_attempt.save()
-        else:
-            # No improvement, no additional XP
+            # Calculate XP to award
             xp_to_award = 0
-
-        # Award XP WITHOUT creating separate XP activity
-        user_progress, _ = UserProgress.objects.get_or_create(user=request.user)
-        if xp_to_award > 0:
-            user_progress.add_xp(xp_to_award, create_activity=False)  # Don't create XP activity
+            if current_score > quiz_attempt.best_score:
+                # They improved! Award XP for the improvement
+                previous_max_xp = quiz_attempt.best_score * 10
+                new_max_xp = current_score * 10
+                xp_to_award = new_max_xp - previous_max_xp
+
+                # Update their best score
+                quiz_attempt.best_score = current_score
+                quiz_attempt.max_xp_earned = new_max_xp
+                quiz_attempt.save(update_fields=["best_score", "max_xp_earned", "updated_at"])
+
+            # Award XP WITHOUT creating separate XP activity
+            if xp_to_award > 0:
+                user_progress, _ = award_xp(
+                    request.user, xp_to_award, create_activity=False,
+                    source=XpLedgerEntry.SOURCE_GENERAL_QUIZ, source_id=quiz_attempt.pk,
+                )
+            else:
+                user_progress, _ = UserProgress.objects.get_or_create(user=request.user)
 
         # CREATE QUIZ COMPLETION ACTIVITY (this was missing!)
         if score_percentage >= 70:  # Passing grade
@@ -670,16 +882,65 @@ class GeneralQuizSubmitView(APIView):
             "correct": current_score,
             "best_score": quiz_attempt.best_score,
             "xp_earned": xp_to_award,
-            "xp_total": user_progress.xp,
-            "level": user_progress.level,
+            "xp_total": live_xp(user_progress),
+            "level": level_for_xp(live_xp(user_progress)),
             "feedback": feedback,
             "message": f"Best score: {quiz_attempt.best_score}/{total_questions}" if not created else "First attempt!"
         }, status=status.HTTP_200_OK)
 
 
 class ActivityListView(generics.ListAPIView):
+    """
+    GET /activities/?type=a,b&exclude_type=c&cursor=...&page_size=20
+    Newest first, one page at a time (see KeysetPagination). "XP earned" rows
+    that only repeat the XP of an activity logged within two minutes of them
+    are left out, unless ?collapse_xp=false.
+    """
     permission_classes = [IsAuthenticated]
     serializer_class = UserActivitySerializer
-    
+    pagination_class = KeysetPagination
+    XP_COLLAPSE_WINDOW = timedelta(minutes=2)
+
+    def activity_types(self, param):
+        raw = self.request.query_params.get(param)
+        if not raw:
+            return None
+        types = {name.strip() for name in raw.split(",") if name.strip()}
+        unknown = types - {choice for choice, _ in UserActivity.ACTIVITY_TYPES}
+        if unknown:
+            raise ValidationError({param: [f"Unknown activity type(s): {', '.join(sorted(unknown))}."]})
+        return types
+
     def get_queryset(self):
-        return UserActivity.objects.filter(user=self.request.user)
+        activities = UserActivity.objects.filter(user=self.request.user)
+
+        include = self.activity_types("type")
+        if include:
+            activities = activities.filter(activity_type__in=include)
+        exclude = self.activity_types("exclude_type")
+        if exclude:
+            activities = activities.exclude(activity_type__in=exclude)
+
+        if self.request.query_params.get("collapse_xp", "true").lower() != "false":
+            main_activity = UserActivity.objects.filter(
+                user_id=models.OuterRef("user_id"),
+                created_at__gte=models.OuterRef("created_at") - self.XP_COLLAPSE_WINDOW,
+                created_at__lte=models.OuterRef("created_at") + self.XP_COLLAPSE_WINDOW,
+            ).exclude(activity_type="xp_earned").filter(
+                models.Q(xp_earned=models.OuterRef("xp_earned")) | models.Q(xp_earned__gt=0)
+            )
+            activities = activities.exclude(models.Q(activity_type="xp_earned") & models.Exists(main_activity))
+
+        return activities
+
+
+class MetricsView(APIView):
+    """
+    GET /metrics/  →  counters, timings and gauges of the worker that served the request.
+    Staff only.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        update_gauges()
+        return Response(metrics.snapshot(), status=status.HTTP_200_OK)
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 from dotenv import load_dotenv
 
@@ -16,6 +17,10 @@ DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "codegrow.onrender.com,localhost,127.0.0.1").split(",")
 
+# TLS ends at the hosting proxy, which reports the original scheme here; without
+# it build_absolute_uri() (e.g. the activities "next" link) would say http://
+SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
+
 
 
 INSTALLED_APPS = [
@@ -82,6 +87,11 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # SQLite has no row locks: take the write lock when a transaction starts so
+            # concurrent ones queue (up to timeout seconds) instead of failing with "locked"
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            # A file, not shared-cache memory, so the concurrency tests' threads wait on that lock
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
     print("Using SQLite database locally")
@@ -131,7 +141,7 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -139,7 +149,97 @@ REST_FRAMEWORK = {
 }
 
 # Hugging Face AI Model Settings
-HF_API_KEY = os.getenv("HF_API_KEY")  # Remove hardcoded key
+HF_API_KEY = os.getenv("HF_API_KEY") or os.getenv("HUGGINGFACE_API_KEY")  # Remove hardcoded key
 HF_MODEL_ID = os.getenv("HF_MODEL_ID", "mistralai/Mistral-7B-Instruct-v0.2")
-HF_API_URL = "https://api-inference.huggingface.co/models/"
-HF_REQUEST_TIMEOUT = 15  # seconds
+HF_API_URL = os.getenv("HF_API_URL", "https://api-inference.huggingface.co/models/")
+HF_CONNECT_TIMEOUT = 3  # seconds
+HF_REQUEST_TIMEOUT = 15  # seconds, read timeout of one attempt
+HF_MAX_RETRIES = 2  # extra attempts after a connection error, timeout, 429 or 5xx
+HF_RETRY_BACKOFF = 0.5  # seconds, doubled per attempt and jittered
+HF_POOL_SIZE = 10  # keep-alive connections per process
+HF_CIRCUIT_FAILURES = 5  # consecutive failed requests before failing fast
+HF_CIRCUIT_RESET_SECONDS = 30  # how long to fail fast before trying again
+
+# Micro-batching of concurrent feedback requests (accounts/batching.py)
+HF_BATCH_BACKEND = os.getenv("HF_BATCH_BACKEND", "accounts.batching.HuggingFaceBackend")
+# prompts per inference call; 1 (pass-through) suits sync workers, raise it with gthread/ASGI workers
+HF_BATCH_MAX_SIZE = int(os.getenv("HF_BATCH_MAX_SIZE", "1"))
+HF_BATCH_MAX_WAIT_MS = 50  # how long a batch that already has company waits for more; 0 = never wait
+HF_BATCH_CONCURRENCY = 4  # batches in flight per process
+FEEDBACK_CACHE_ENTRIES = 2048  # AI feedback answers kept in memory per web worker
+
+# Study sessions shown on the dashboard
+DASHBOARD_SESSION_PAST_DAYS = 7
+DASHBOARD_SESSION_FUTURE_DAYS = 30
+DASHBOARD_SESSION_LIMIT = 20
+# Rendered dashboards, per user (accounts/dashboard_cache.py)
+DASHBOARD_CACHE = "shared"
+DASHBOARD_CACHE_SECONDS = 120  # bounds relative times like "5 minutes ago"
+DASHBOARD_CACHE_WAIT_SECONDS = 2  # how long a request waits for another one rebuilding the same dashboard
+
+# Version of the rendered lesson catalog that every worker checks (accounts/catalog.py)
+CATALOG_VERSION_CACHE = "shared"
+
+# Token -> user lookups kept per web worker (accounts/authentication.py)
+TOKEN_AUTH_CACHE_ENTRIES = 4096
+TOKEN_AUTH_CACHE_SECONDS = 300
+# Second level shared by the workers; also carries revocations between them. None keeps the cache per worker
+TOKEN_AUTH_SHARED_CACHE = os.getenv("TOKEN_AUTH_SHARED_CACHE", "shared") or None
+
+# Lessons and their quizzes, one JSON file per learning goal (accounts/curriculum.py)
+CURRICULUM_DIR = os.getenv("CURRICULUM_DIR", os.path.join(BASE_DIR, "curriculum"))
+
+# Folding the XP ledger into UserProgress (accounts/ledger.py, manage.py snapshot_xp)
+XP_SNAPSHOT_INTERVAL = 10  # seconds between runs once the snapshotter has caught up
+XP_SNAPSHOT_BATCH_SIZE = 2000  # ledger entries folded per transaction
+XP_SNAPSHOT_LAG_SECONDS = 30  # entries younger than this may still have an open transaction before them
+XP_SNAPSHOT_INLINE_BATCH_SIZE = 200  # entries a web process folds after an award, once per interval; 0 = worker only
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Shared by every worker process on the host. Swap in memcached/redis
+    # here to get atomic add() for the admission slots.
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("SHARED_CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "codegrow-cache")),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Admission control for run-code/, lesson grading and ai-feedback/ (accounts/admission.py)
+ADMISSION_CACHE = "shared"
+ADMISSION_LEASE_SECONDS = 60  # slots held by a dead worker free themselves after this
+ADMISSION_LIMITS = {
+    # per_user/global: concurrent requests, queue: requests allowed to wait, wait: seconds they may wait
+    "run_code": {"per_user": 2, "global": 16, "queue": 32, "wait": 5},
+    "ai_feedback": {"per_user": 1, "global": 8, "queue": 16, "wait": 10},
+}
+
+# Code execution sandbox (RunCodeView)
+CODE_RUNNER_TIMEOUT = 5  # seconds per submission
+CODE_RUNNER_MAX_OUTPUT_BYTES = 128 * 1024  # a run is stopped once it prints more than this
+CODE_RUNNER_CPU_LIMIT = 5  # RLIMIT_CPU seconds for one run
+CODE_RUNNER_MEMORY_LIMIT_MB = 256  # RLIMIT_AS for one run
+USAGE_FLUSH_SECONDS = 30  # how often per-lesson run statistics are written; 0 = only on explicit flush()
+CODE_RUNNER_POOL_ENABLED = os.getenv("CODE_RUNNER_POOL_ENABLED", "True").lower() == "true"
+CODE_RUNNER_POOL_SIZE = int(os.getenv("CODE_RUNNER_POOL_SIZE", "2"))  # warm interpreters per web worker
+CODE_RUNNER_POOL_QUEUE_DEPTH = int(os.getenv("CODE_RUNNER_POOL_QUEUE_DEPTH", "8"))
+CODE_RUNNER_POOL_MAX_RUNS = int(os.getenv("CODE_RUNNER_POOL_MAX_RUNS", "200"))  # recycle a worker after this many runs
+CODE_RUNNER_POOL_ACQUIRE_TIMEOUT = 10  # seconds a queued request waits for a free worker
+# "True" makes run-code/ return a job id by default; clients can still send "mode": "sync"
+CODE_RUNNER_ASYNC_JOBS = os.getenv("CODE_RUNNER_ASYNC_JOBS", "False").lower() == "true"
+# "thread" runs jobs inside the web worker, "external" leaves them to `manage.py run_code_executor`
+CODE_RUNNER_JOB_EXECUTOR = os.getenv("CODE_RUNNER_JOB_EXECUTOR", "thread")
+CODE_RUNNER_JOB_STALE_AFTER = 30  # seconds past the timeout before a running job is marked failed
+CODE_RUNNER_JOB_POLL_INTERVAL = 1  # seconds clients are told to wait before asking about a job again
+# Results of deterministic programs are reused instead of re-running them
+CODE_RUNNER_RESULT_CACHE_ENABLED = os.getenv("CODE_RUNNER_RESULT_CACHE_ENABLED", "True").lower() == "true"
+CODE_RUNNER_RESULT_CACHE_ENTRIES = 2048
+CODE_RUNNER_RESULT_CACHE_BYTES = 8 * 1024 * 1024  # stdout + stderr characters across all entries
+CODE_RUNNER_SYNTAX_CACHE_ENTRIES = 4096  # compile() verdicts kept per web worker
+
+# Autograder (accounts/grading.py)
+GRADER_CASE_TIME_LIMIT = 2  # seconds per test case unless the case sets its own
+GRADER_FLOAT_TOLERANCE = 1e-6
@@ -9,56 +9,33 @@ const Activity = () => {
     const [activities, setActivities] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
+    const [nextUrl, setNextUrl] = useState(null);
 
-    const fetchActivities = async () => {
+    // XP rows that duplicate a lesson/quiz activity are already left out by the server
+    const describeXpActivity = (activity) => {
+        if (activity.activity_type !== 'xp_earned' || !activity.description) {
+            return activity;
+        }
+        if (activity.description.includes('quiz')) {
+            return { ...activity, title: '🎯 Quiz Completed!', activity_type: 'quiz_completed' };
+        }
+        if (activity.description.includes('lesson')) {
+            return { ...activity, title: '✅ Lesson Completed!', activity_type: 'lesson_completed' };
+        }
+        if (activity.description.includes('study session')) {
+            return { ...activity, title: '📅 Study Session Completed!', activity_type: 'study_session_completed' };
+        }
+        return { ...activity, title: `⭐ Earned ${activity.xp_earned} XP` };
+    };
+
+    const fetchActivities = async (url = "accounts/activities/", append = false) => {
         try {
-            const response = await api.get("accounts/activities/");
-            let activitiesData = response.data.results || response.data;
-            
-            // Enhanced filtering for better XP activity handling
-            const filteredActivities = activitiesData.filter(activity => {
-                if (activity.activity_type === 'xp_earned') {
-                    // Check if there's a recent main activity that already includes this XP
-                    const recentMainActivity = activitiesData.find(mainActivity => 
-                        mainActivity.activity_type !== 'xp_earned' &&
-                        Math.abs(new Date(mainActivity.created_at) - new Date(activity.created_at)) < 120000 && // Within 2 minutes
-                        (
-                            mainActivity.xp_earned === activity.xp_earned || // Same XP amount
-                            mainActivity.xp_earned > 0 // Main activity has XP
-                        )
-                    );
-                    
-                    // If we found a main activity, don't show the standalone XP
-                    if (recentMainActivity) {
-                        return false;
-                    }
-                    
-                    // If no main activity found, enhance the XP activity with better context
-                    if (activity.description) {
-                        // Try to extract context from description
-                        if (activity.description.includes('quiz')) {
-                            activity.title = '🎯 Quiz Completed!';
-                            activity.activity_type = 'quiz_completed';
-                        } else if (activity.description.includes('lesson')) {
-                            activity.title = '✅ Lesson Completed!';
-                            activity.activity_type = 'lesson_completed';
-                        } else if (activity.description.includes('study session')) {
-                            activity.title = '📅 Study Session Completed!';
-                            activity.activity_type = 'study_session_completed';
-                        } else {
-                            activity.title = `⭐ Earned ${activity.xp_earned} XP`;
-                        }
-                    }
-                    
-                    return true; // Keep enhanced XP activity
-                }
-                return true; // Keep all non-XP activities
-            });
-            
-            // Sort by creation date (newest first)
-            filteredActivities.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
-            
-            setActivities(filteredActivities);
+            const response = await api.get(url);
+            const page = (response.data.results || response.data).map(describeXpActivity);
+
+            // Pages arrive newest first, so the next page goes after the current one
+            setActivities(previous => (append ? [...previous, ...page] : page));
+            setNextUrl(response.data.next || null);
             setError(null);
         } catch (err) {
             setError("Failed to load activities");
@@ -127,7 +104,7 @@ const Activity = () => {
                     <p>Track your learning progress and achievements</p>
                     <button 
                         className="refresh-btn"
-                        onClick={fetchActivities}
+                        onClick={() => fetchActivities()}
                         disabled={loading}
                     >
                         🔄 Refresh
@@ -181,6 +158,15 @@ const Activity = () => {
                         </div>
                     )}
                 </div>
+
+                {nextUrl && (
+                    <button
+                        className="refresh-btn"
+                        onClick={() => fetchActivities(nextUrl, true)}
+                    >
+                        Load more
+                    </button>
+                )}
             </div>
         </div>
     );
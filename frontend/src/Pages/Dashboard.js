@@ -21,6 +21,7 @@ const Dashboard = () => {
     const [showSuccessMessage, setShowSuccessMessage] = useState(false);
     const [xp, setXp] = useState(0);
     const [level, setLevel] = useState(1);
+    const [levelProgress, setLevelProgress] = useState({ xp_in_level: 0, xp_needed: 50 });
     const [recentActivities, setRecentActivities] = useState([]);
     const token = localStorage.getItem("token");
 
@@ -30,6 +31,9 @@ const Dashboard = () => {
                 const response = await api.get("accounts/dashboard/");
                 setXp(response.data.progress.xp);
                 setLevel(response.data.progress.level);
+                if (response.data.progress.level_progress) {
+                    setLevelProgress(response.data.progress.level_progress);
+                }
                 setLessonsCompleted(response.data.progress.total_lessons_completed || 0);
                 setTotalLessons(response.data.progress.lesson_cap ?? LESSON_CAP_FALLBACK);
                 setStreak(response.data.progress.streak || 0);
@@ -64,8 +68,9 @@ const Dashboard = () => {
         ? Math.min(100, Math.round((lessonsCompleted / totalLessons) * 100)) 
         : 0;
 
-    const xpToLevel = 50;
-    const xpWithinLevel = xp % xpToLevel;
+    // Thresholds come from the backend's leveling table
+    const xpToLevel = levelProgress.xp_needed;
+    const xpWithinLevel = levelProgress.xp_in_level;
     const xpPercentage = Math.min(100, Math.round((xpWithinLevel / xpToLevel) * 100));
 
     const radius = 76;
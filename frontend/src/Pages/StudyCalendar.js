@@ -43,7 +43,7 @@ const StudyCalendar = () => {
     useEffect(() => {
         const fetchLessons = async () => {
             try {
-                const response = await axios.get(`${API_BASE_URL}all-lessons/`, {
+                const response = await axios.get(`${API_BASE_URL}lessons/index/`, {
                     headers: { Authorization: `Token ${token}` },
                 });
                 setLessons(response.data);